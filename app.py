@@ -5,19 +5,24 @@ import os
 import uuid
 import logging
 import sys # For exit on init failure
-from threading import Lock
 import traceback
+import json
 import datetime # Added for cleanup command
 from datetime import timedelta # Added for cleanup command
 import time # Added for start_interview timing
+import queue
+import threading
+from functools import wraps
 
 print("--- app.py: Basic imports done ---")
 
 from flask import (
     Flask, request, jsonify, render_template, send_file, session as flask_session,
-    redirect, url_for, flash # Added redirect, url_for, flash
+    redirect, url_for, flash, # Added redirect, url_for, flash
+    Response, stream_with_context
 )
 from werkzeug.utils import secure_filename
+import click
 import werkzeug.exceptions
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy # Import SQLAlchemy directly if needed
@@ -62,7 +67,9 @@ print(f"--- app.py: Logger '{__name__}' configured ---")
 try:
     print("--- app.py: Attempting local module imports ---")
     from modules import utils, llm_interface, audio_utils, report_generator, prompt_templates # Combined imports
-    from modules.interview_logic import InterviewSession
+    from modules.interview_logic import InterviewSession, get_jd_cache_stats, get_turn_prefetch_stats
+    from modules.session_store import create_session_store, create_session_lock_manager, restart_sweeper
+    from modules import session_journal, background_tasks, llm_limiter, llm_resilience, llm_cache
     from models import db, bcrypt, User, Report, PasswordReset # Import db, bcrypt and models
     from auth import auth_bp # Import the authentication blueprint
     print("--- app.py: Local module imports successful ---")
@@ -141,13 +148,16 @@ try:
     utils.initialize_nltk()
     logger.info("NLTK initialization attempted.")
 
-    # Initialize Google STT Client
-    logger.info("Initializing STT Client...")
-    stt_initialized = audio_utils.initialize_stt_client()
-    if not stt_initialized:
-         logger.warning("STT Client failed to initialize. Transcription will be unavailable.")
+    # Initialize Google STT Client (gRPC channels are not fork-safe: with a preloading master, each worker creates its own)
+    if config.EMBEDDING_LOAD_MODE == "preload":
+        logger.info("STT Client initialization deferred to worker processes (EMBEDDING_LOAD_MODE=preload).")
     else:
-         logger.info("STT Client initialized successfully.")
+        logger.info("Initializing STT Client...")
+        stt_initialized = audio_utils.initialize_stt_client()
+        if not stt_initialized:
+             logger.warning("STT Client failed to initialize. Transcription will be unavailable.")
+        else:
+             logger.info("STT Client initialized successfully.")
 
     # Initialize RAG (DB connection + Embedding Model)
     logger.info("Initializing RAG components...")
@@ -166,26 +176,73 @@ except Exception as init_err:
      logger.critical(f"FATAL ERROR during pre-run initialization: {init_err}", exc_info=True)
      sys.exit(1) # Exit if critical initializations fail
 
-# --- In-Memory Session Storage (for interviews) ---
-interview_sessions = {} # Stores active InterviewSession objects
-session_lock = Lock() # Protects access to interview_sessions dict
-logger.info("In-memory interview session storage ready.")
+# --- Interview Session Storage ---
+# Backend is chosen by config.SESSION_STORE_BACKEND ('memory' for a single worker, 'file' to share across workers)
+try:
+    session_locks = create_session_lock_manager() # Per-interview locks (cross-process for the 'file' backend)
+    interview_store = create_session_store(lock_manager=session_locks)
+    session_journal.initialize_journal() # Checkpoints used to recover sessions lost by a restart
+    if session_journal.is_enabled() and config.SESSION_TTL_SECONDS > 0 and getattr(interview_store, 'sweeper', None):
+        interview_store.sweeper.add_task(lambda: session_journal.purge_older_than(config.SESSION_TTL_SECONDS))
+except Exception as store_err:
+    logger.critical(f"FATAL ERROR initializing interview session store: {store_err}", exc_info=True)
+    sys.exit(1)
+
+def init_worker_process():
+    """
+    Per-process setup for a gunicorn worker forked from a preloading master (EMBEDDING_LOAD_MODE=preload,
+    called from gunicorn.conf.py post_fork). The embedding model and app state are inherited copy-on-write;
+    threads and network clients are not, so they are started here.
+    """
+    restart_sweeper(interview_store)
+    if not audio_utils.initialize_stt_client():
+        logger.warning("STT Client failed to initialize. Transcription will be unavailable.")
+    logger.info(f"Worker process {os.getpid()} initialized.")
+
 
 # --- Utility Functions for Interview Sessions ---
 def get_session(interview_id) -> InterviewSession | None:
-     with session_lock:
-          return interview_sessions.get(interview_id)
+     session_obj = interview_store.get(interview_id)
+     if session_obj is None and session_journal.is_enabled():
+          # Lazy recovery: the session may have been lost by a worker restart/deploy. Rebuild it from
+          # its checkpoint journal (one file read) instead of re-running question generation.
+          recovered_state = session_journal.replay(interview_id)
+          if recovered_state:
+               session_obj = InterviewSession.from_dict(recovered_state)
+               interview_store.put(interview_id, session_obj)
+               logger.info(f"[{interview_id}] Recovered interview session from journal (state: {session_obj.state}).")
+     return session_obj
 
 def store_session(interview_id, session_obj):
-     with session_lock:
-          interview_sessions[interview_id] = session_obj
-          logger.info(f"Stored interview session {interview_id}. Active sessions: {len(interview_sessions)}")
+     """Persists the session. Must be called after every mutation so other workers see the new state."""
+     interview_store.put(interview_id, session_obj)
+     logger.debug(f"Stored interview session {interview_id} (state: {session_obj.state}).")
 
 def remove_session(interview_id):
-     with session_lock:
-          if interview_id in interview_sessions:
-               del interview_sessions[interview_id]
-               logger.info(f"Removed interview session {interview_id}. Active sessions: {len(interview_sessions)}")
+     session_obj = interview_store.get(interview_id)
+     if session_obj is not None:
+          session_obj.release_resources() # e.g. the context cache of an interview abandoned mid-way
+     session_journal.delete(interview_id)
+     if interview_store.delete(interview_id):
+          logger.info(f"Removed interview session {interview_id}. Active sessions: {interview_store.count()}")
+
+def with_session_lock(view_func):
+     """
+     Runs the view while holding the lock of the interview in the Flask session.
+     Overlapping requests for the same interview (double-clicked submit, concurrent polls)
+     get a 409 instead of repeating STT/LLM work on the same InterviewSession.
+     """
+     @wraps(view_func)
+     def wrapper(*args, **kwargs):
+          interview_id = flask_session.get('interview_id')
+          if not interview_id:
+               return view_func(*args, **kwargs) # View reports the missing session itself
+          with session_locks.hold(interview_id, timeout=config.SESSION_LOCK_WAIT_SECONDS) as acquired:
+               if not acquired:
+                    logger.warning(f"[{interview_id}] Rejected overlapping {request.path} request from user {current_user.id}: session busy.")
+                    return jsonify({"error": "This interview is busy processing a previous request. Please wait.", "status": "BUSY"}), 409
+               return view_func(*args, **kwargs)
+     return wrapper
 
 # --- Routes ---
 
@@ -231,33 +288,12 @@ def start_interview():
             logger.warning(f"User {user_id}: Invalid file type: {resume_file.filename}")
             return jsonify({"error": "Invalid file type. Please upload a PDF resume."}), 400
 
-        # Secure filename and create temp path
+        # Secure filename and create temp path. The file is only saved here; text extraction and
+        # question generation run on the background pool (see run_interview_setup).
         temp_filename = f"{uuid.uuid4()}_{secure_filename(resume_file.filename)}"
         temp_resume_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-
-        resume_text = None
-        try:
-            logger.debug(f"User {user_id}: Saving temporary resume to: {temp_resume_path}")
-            resume_file.save(temp_resume_path)
-            logger.debug(f"User {user_id}: Extracting text from resume PDF...")
-            resume_text = utils.extract_text_from_pdf(temp_resume_path)
-
-            if resume_text is None or not resume_text.strip():
-                 logger.error(f"User {user_id}: Failed to extract text from resume: {temp_resume_path}")
-                 return jsonify({"error": "Failed to extract text from the resume PDF. It might be image-based or corrupted."}), 400
-            logger.info(f"User {user_id}: Resume text extracted (length: {len(resume_text)} chars).")
-
-        except Exception as pdf_err:
-            logger.error(f"User {user_id}: Error processing resume PDF: {pdf_err}", exc_info=True)
-            error_msg = "Failed to process resume PDF."
-            if isinstance(pdf_err, ImportError):
-                 error_msg = "PDF processing library not installed or accessible."
-            return jsonify({"error": error_msg}), 500
-        finally:
-            # Ensure temp file is always removed
-            if os.path.exists(temp_resume_path):
-                try: os.remove(temp_resume_path)
-                except OSError as e: logger.warning(f"Could not remove temp resume file {temp_resume_path}: {e}")
+        logger.debug(f"User {user_id}: Saving temporary resume to: {temp_resume_path}")
+        resume_file.save(temp_resume_path)
 
         # Generate Interview ID and Session
         interview_id = str(uuid.uuid4())
@@ -266,24 +302,30 @@ def start_interview():
         # Clean up old interview session data from Flask session if any
         old_interview_id = flask_session.pop('interview_id', None)
         if old_interview_id:
-            remove_session(old_interview_id) # Remove from in-memory store
-
-        logger.info(f"[{interview_id}] Creating InterviewSession object...")
-        # Pass user_id to InterviewSession if needed for associating reports later
-        session_obj = InterviewSession(interview_id, resume_text, jd_text) # Pass user_id if needed
-        init_state_info = session_obj.get_state()
+            remove_session(old_interview_id) # Remove from session store
 
-        if init_state_info["state"] == "ERROR":
-            logger.error(f"[{interview_id}] Session initialization failed for user {user_id}. Error: {init_state_info['error']}")
-            return jsonify({"error": f"Interview initialization failed: {init_state_info['error']}"}), 500
+        # Store the session in INITIALIZING state right away so status polls can find it
+        session_obj = InterviewSession(interview_id, None, jd_text, initialize=False) # Pass user_id if needed
+        store_session(interview_id, session_obj)
+        try:
+            background_tasks.submit(run_interview_setup, interview_id, temp_resume_path, user_id)
+        except background_tasks.PoolSaturatedError:
+            logger.warning(f"[{interview_id}] Interview setup pool saturated. Rejecting start request from user {user_id}.")
+            remove_session(interview_id)
+            _remove_temp_file(temp_resume_path)
+            return jsonify({"error": "The server is busy preparing other interviews. Please try again in a minute."}), 503
 
-        store_session(interview_id, session_obj) # Store in memory
         flask_session['interview_id'] = interview_id # Store reference in Flask session
         logger.debug(f"Stored interview_id {interview_id} in Flask session for user {user_id}.")
 
         elapsed_time = time.time() - start_time
-        logger.info(f"[{interview_id}] Interview setup completed in {elapsed_time:.2f} seconds for user {user_id}.")
-        return jsonify({"interview_id": interview_id,"message": "Interview initialized successfully. Ready for greeting."}), 200
+        logger.info(f"[{interview_id}] Interview setup queued in {elapsed_time * 1000:.0f} ms for user {user_id}.")
+        return jsonify({
+            "interview_id": interview_id,
+            "status": session_obj.state,
+            "status_url": url_for('interview_status'),
+            "message": "Interview is being prepared. Poll the status URL until it is READY."
+        }), 202
 
     except werkzeug.exceptions.RequestEntityTooLarge:
          logger.warning(f"User {user_id}: Resume upload failed - File too large.")
@@ -293,9 +335,79 @@ def start_interview():
         return jsonify({"error": f"An unexpected server error occurred during setup."}), 500
 
 
+def _remove_temp_file(path):
+    if path and os.path.exists(path):
+        try: os.remove(path)
+        except OSError as e: logger.warning(f"Could not remove temp file {path}: {e}")
+
+
+def run_interview_setup(interview_id, temp_resume_path, user_id):
+    """
+    Background job for /start-interview: extracts the resume text and runs
+    InterviewSession._initialize_session (NLTK analysis, RAG retrieval, question generation).
+    Holds the session lock so overlapping requests on this interview get 409 until setup is done.
+    """
+    start_time = time.time()
+    with session_locks.hold(interview_id, timeout=5.0) as acquired:
+        if not acquired:
+            logger.error(f"[{interview_id}] Could not lock new session for setup. Aborting.")
+            _remove_temp_file(temp_resume_path)
+            return
+        session_obj = interview_store.get(interview_id)
+        if session_obj is None:
+            logger.info(f"[{interview_id}] Session was removed before setup started (user {user_id} restarted?). Skipping.")
+            _remove_temp_file(temp_resume_path)
+            return
+        try:
+            logger.debug(f"[{interview_id}] Extracting text from resume PDF...")
+            resume_text = utils.extract_text_from_pdf(temp_resume_path)
+            if resume_text is None or not resume_text.strip():
+                logger.error(f"[{interview_id}] Failed to extract text from resume: {temp_resume_path}")
+                session_obj._set_error_state("Failed to extract text from the resume PDF. It might be image-based or corrupted.")
+            else:
+                logger.info(f"[{interview_id}] Resume text extracted (length: {len(resume_text)} chars).")
+                session_obj.resume_text_raw = resume_text
+                session_obj._initialize_session()
+        except Exception as e:
+            logger.exception(f"[{interview_id}] Unexpected error during background interview setup for user {user_id}")
+            session_obj._set_error_state(f"An unexpected error occurred during interview setup: {e}")
+        finally:
+            _remove_temp_file(temp_resume_path)
+
+        if interview_store.get(interview_id) is None:
+            # The user started another interview while this one was being prepared
+            logger.info(f"[{interview_id}] Session removed during setup. Discarding result.")
+            session_journal.delete(interview_id)
+            return
+        store_session(interview_id, session_obj)
+
+    elapsed_time = time.time() - start_time
+    if session_obj.state == "ERROR":
+        logger.error(f"[{interview_id}] Session initialization failed for user {user_id} after {elapsed_time:.2f}s. Error: {session_obj.error_message}")
+    else:
+        logger.info(f"[{interview_id}] Interview setup completed in {elapsed_time:.2f} seconds for user {user_id}.")
+
+
+# Interview Setup Status (Protected)
+@app.route('/interview-status', methods=['GET'])
+@login_required
+def interview_status():
+    """Lightweight poll target while /start-interview runs in the background. Never blocks on the session lock."""
+    interview_id = flask_session.get('interview_id')
+    if not interview_id:
+        return jsonify({"error": "No active interview session found. Please start a new interview."}), 400
+    session_obj = get_session(interview_id)
+    if not session_obj:
+        flask_session.pop('interview_id', None)
+        return jsonify({"error": "Interview session not found or expired. Please start again."}), 404
+    state_info = session_obj.get_state()
+    return jsonify({"interview_id": interview_id, "status": state_info["state"], "error": state_info["error"]}), 200
+
+
 # Get AI Message (Protected)
 @app.route('/get-ai-message', methods=['GET'])
 @login_required
+@with_session_lock
 def get_ai_message():
     interview_id = flask_session.get('interview_id')
     if not interview_id:
@@ -306,7 +418,7 @@ def get_ai_message():
     session_obj = get_session(interview_id)
 
     if not session_obj:
-        logger.warning(f"User {current_user.id}: Interview session {interview_id} not found in memory.")
+        logger.warning(f"User {current_user.id}: Interview session {interview_id} not found in session store.")
         flask_session.pop('interview_id', None) # Clean up stale session ID
         return jsonify({"error": "Interview session not found or expired. Please start again."}), 404
 
@@ -316,44 +428,132 @@ def get_ai_message():
     #    return jsonify({"error": "Permission denied."}), 403
 
     try:
-        state_info = session_obj.get_state()
-        current_state = state_info["state"]
-        logger.debug(f"[{interview_id}] Current session state: {current_state}")
-
-        ai_message = None
-        response_status = 200
-
-        # Determine AI message based on state
-        if current_state == "READY": ai_message = session_obj.get_greeting()
-        elif current_state == "ASKING": ai_message = session_obj.get_next_ai_turn()
-        elif current_state == "AWAITING_RESPONSE": ai_message = session_obj.last_ai_message
-        elif current_state in ["FINISHED", "EVALUATING"]: ai_message = session_obj.last_ai_message or "The interview has concluded."
-        elif current_state == "ERROR":
-             ai_message = state_info.get("error", "An unspecified error occurred.")
-             response_status = 500 # Internal Server Error likely
-        else: # e.g., INITIALIZING, IN_PROGRESS
-             ai_message = "Interview is currently processing, please wait..."
-             response_status = 202 # Accepted, still processing
-
-        # Re-check state after potential action (get_greeting/get_next_ai_turn might change state or error out)
-        final_state_info = session_obj.get_state()
-        if final_state_info["state"] == "ERROR" and response_status != 500: # If error occurred during processing
-            ai_message = final_state_info.get("error", "An error occurred generating the AI message.")
-            response_status = 500
-
-        logger.info(f"[{interview_id}] Sending AI message to user {current_user.id}. Final state: {final_state_info['state']}")
-        return jsonify({"ai_message": ai_message, "status": final_state_info["state"]}), response_status
+        payload, response_status = _next_ai_message(interview_id, session_obj)
+        logger.info(f"[{interview_id}] Sending AI message to user {current_user.id}. Final state: {payload['status']}")
+        return jsonify(payload), response_status
 
     except Exception as e:
         logger.exception(f"[{interview_id}] Unexpected error in /get-ai-message for user {current_user.id}")
         if session_obj and session_obj.get_state()["state"] != "ERROR":
              session_obj._set_error_state(f"Server error during AI turn generation: {e}")
+             store_session(interview_id, session_obj)
         return jsonify({"error": f"An unexpected server error occurred.", "status": "ERROR"}), 500
 
 
+def _next_ai_message(interview_id, session_obj, turn_chunks=None):
+    """
+    Produces the AI message for the session's current state and persists any state change.
+    turn_chunks: for the streaming endpoint, a callable receiving each sentence chunk of a newly
+    generated AI turn (the turn is then generated with stream_next_ai_turn).
+    Returns ({"ai_message", "status"}, http_status).
+    """
+    state_info = session_obj.get_state()
+    current_state = state_info["state"]
+    logger.debug(f"[{interview_id}] Current session state: {current_state}")
+
+    ai_message = None
+    response_status = 200
+
+    # Determine AI message based on state
+    if current_state == "READY": ai_message = session_obj.get_greeting()
+    elif current_state == "ASKING" and turn_chunks is not None:
+        for chunk in session_obj.stream_next_ai_turn():
+            turn_chunks(chunk)
+        ai_message = session_obj.last_ai_message
+    elif current_state == "ASKING": ai_message = session_obj.get_next_ai_turn()
+    elif current_state == "AWAITING_RESPONSE": ai_message = session_obj.last_ai_message
+    elif current_state in ["FINISHED", "EVALUATING"]: ai_message = session_obj.last_ai_message or "The interview has concluded."
+    elif current_state == "ERROR":
+         ai_message = state_info.get("error", "An unspecified error occurred.")
+         response_status = 500 # Internal Server Error likely
+    else: # e.g., INITIALIZING, IN_PROGRESS
+         ai_message = "Interview is currently processing, please wait..."
+         response_status = 202 # Accepted, still processing
+
+    # Persist any state change made by get_greeting/get_next_ai_turn
+    if current_state in ["READY", "ASKING"]:
+        store_session(interview_id, session_obj)
+
+    # Re-check state after potential action (get_greeting/get_next_ai_turn might change state or error out)
+    final_state_info = session_obj.get_state()
+    if final_state_info["state"] == "ERROR" and response_status != 500: # If error occurred during processing
+        ai_message = final_state_info.get("error", "An error occurred generating the AI message.")
+        response_status = 500
+
+    return {"ai_message": ai_message, "status": final_state_info["state"]}, response_status
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Stream AI Message (Protected): Server-Sent Events version of /get-ai-message
+@app.route('/get-ai-message/stream', methods=['GET'])
+@login_required
+def stream_ai_message():
+    interview_id = flask_session.get('interview_id')
+    if not interview_id:
+        return jsonify({"error": "No active interview session found. Please start a new interview."}), 400
+    user_id = current_user.id
+
+    def generate():
+        # The session lock is taken here, not by @with_session_lock: the view returns before the
+        # body is streamed, and the turn is generated while the response is being sent.
+        with session_locks.hold(interview_id, timeout=config.SESSION_LOCK_WAIT_SECONDS) as acquired:
+            if not acquired:
+                logger.warning(f"[{interview_id}] Rejected overlapping stream request from user {user_id}: session busy.")
+                yield _sse_event("busy", {"error": "This interview is busy processing a previous request. Please wait.", "status": "BUSY"})
+                return
+            session_obj = get_session(interview_id)
+            if not session_obj:
+                yield _sse_event("error", {"error": "Interview session not found or expired. Please start again.", "status": "ERROR"})
+                return
+
+            chunks = queue.SimpleQueue()
+            result = {}
+
+            def run_turn():
+                try:
+                    result["payload"], result["status"] = _next_ai_message(
+                        interview_id, session_obj,
+                        turn_chunks=chunks.put if config.INTERVIEWER_STREAMING_ENABLED else None,
+                    )
+                except Exception as e:
+                    logger.exception(f"[{interview_id}] Unexpected error in /get-ai-message/stream for user {user_id}")
+                    if session_obj.get_state()["state"] != "ERROR":
+                        session_obj._set_error_state(f"Server error during AI turn generation: {e}")
+                        store_session(interview_id, session_obj)
+                    result["payload"], result["status"] = {"error": "An unexpected server error occurred.", "status": "ERROR"}, 500
+                finally:
+                    chunks.put(None)
+
+            # The turn runs on its own thread so it completes (and is stored) even if the client
+            # disconnects mid-stream; the lock is held until it has finished either way.
+            worker = threading.Thread(target=run_turn, name=f"ai-turn-{interview_id}", daemon=True)
+            worker.start()
+            try:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is None:
+                        break
+                    yield _sse_event("chunk", {"text": chunk})
+                payload = result["payload"]
+                if result["status"] >= 500 or "error" in payload:
+                    yield _sse_event("error", {"error": payload.get("error") or payload.get("ai_message"), "status": payload.get("status", "ERROR")})
+                else:
+                    logger.info(f"[{interview_id}] Streamed AI message to user {user_id}. Final state: {payload['status']}")
+                    yield _sse_event("done", payload)
+            finally:
+                worker.join()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}) # Disable proxy buffering
+
+
 # Submit Audio Response (Protected)
 @app.route('/submit-response', methods=['POST'])
 @login_required
+@with_session_lock
 def submit_response():
     interview_id = flask_session.get('interview_id')
     if not interview_id:
@@ -364,7 +564,7 @@ def submit_response():
     session_obj = get_session(interview_id)
 
     if not session_obj:
-        logger.warning(f"User {current_user.id}: Interview session {interview_id} not found in memory for submit.")
+        logger.warning(f"User {current_user.id}: Interview session {interview_id} not found in session store for submit.")
         flask_session.pop('interview_id', None)
         return jsonify({"error": "Interview session not found or expired. Please start again."}), 404
 
@@ -442,6 +642,9 @@ def submit_response():
              session_obj._set_error_state(f"Server error processing audio: {e}")
         response_status = 500
     finally:
+        # Persist whatever state processing left behind (success, STT failure or error)
+        try: store_session(interview_id, session_obj)
+        except Exception as store_err: logger.error(f"[{interview_id}] Failed to persist session after response processing: {store_err}", exc_info=True)
         if os.path.exists(temp_audio_path):
             try: os.remove(temp_audio_path)
             except OSError as e: logger.warning(f"[{interview_id}] Could not remove temp audio file {temp_audio_path}: {e}")
@@ -456,6 +659,7 @@ def submit_response():
 # Get Report (Protected)
 @app.route('/get-report', methods=['GET'])
 @login_required
+@with_session_lock
 def get_report():
     interview_id = flask_session.get('interview_id')
     if not interview_id:
@@ -466,7 +670,7 @@ def get_report():
     session_obj = get_session(interview_id)
 
     if not session_obj:
-        logger.warning(f"User {current_user.id}: Interview session {interview_id} not found in memory for get-report.")
+        logger.warning(f"User {current_user.id}: Interview session {interview_id} not found in session store for get-report.")
         flask_session.pop('interview_id', None)
         return jsonify({"error": "Interview session not found or expired."}), 404
 
@@ -489,6 +693,7 @@ def get_report():
          logger.info(f"[{interview_id}] Performing final evaluation for user {current_user.id} before report.")
          try:
               eval_success = session_obj.perform_final_evaluation() # Pass user if needed
+              store_session(interview_id, session_obj)
               if not eval_success:
                    logger.error(f"[{interview_id}] Final evaluation failed for user {current_user.id}. Report generation stopped.")
                    # Return error if evaluation is critical
@@ -505,6 +710,7 @@ def get_report():
         # Pass current_user.name or id if needed for the report content/DB record
         # Modification: Ensure generate_report links the created report to the user
         report_path = session_obj.generate_report() # Pass current_user if needed
+        store_session(interview_id, session_obj) # Persist report path / error state
 
         if report_path and os.path.exists(report_path):
             # --- Add Report record to DB ---
@@ -551,6 +757,45 @@ def get_report():
         return jsonify({"error": f"An unexpected server error occurred while generating the report: {report_err}"}), 500
 
 
+# Session Metrics (Protected)
+@app.route('/metrics/sessions', methods=['GET'])
+@login_required
+def session_metrics():
+    """Reports session store occupancy, per-session lock contention and JD analysis cache hits."""
+    store_stats = interview_store.get_stats() if hasattr(interview_store, 'get_stats') else {"sessions": interview_store.count()}
+    return jsonify({
+        "backend": interview_store.backend_name,
+        "store": store_stats,
+        "locks": session_locks.get_stats(),
+        "jd_cache": get_jd_cache_stats(),
+    }), 200
+
+
+# RAG Metrics (Protected)
+@app.route('/metrics/rag', methods=['GET'])
+@login_required
+def rag_metrics():
+    """Reports embedding/context cache effectiveness and RAG connection pool saturation for this worker."""
+    return jsonify({
+        "embedding_cache": utils.get_embedding_cache_stats(),
+        "context_cache": utils.get_rag_context_cache_stats(),
+        "db_pool": utils.get_rag_pool_stats(),
+    }), 200
+
+
+@app.route('/metrics/llm', methods=['GET'])
+@login_required
+def llm_metrics():
+    """Reports LLM limiter state (in-flight calls, queueing, wait times, RPM/TPM limits) circuit breakers, caches and next-turn prefetching for this worker."""
+    return jsonify({
+        "limiter": llm_limiter.get_stats(),
+        "breakers": llm_resilience.get_stats(),
+        "response_cache": llm_cache.get_stats(),
+        "context_cache": llm_interface.get_context_cache_stats(),
+        "turn_prefetch": get_turn_prefetch_stats(),
+    }), 200
+
+
 # --- Error Handlers ---
 @app.errorhandler(400)
 def handle_400(error):
@@ -675,6 +920,452 @@ def cleanup_unconfirmed_users_command():
             logger.error(f"Error during cleanup of unconfirmed users: {e}", exc_info=True)
             print(f"Error during cleanup: {e}")
 
+@app.cli.command('session-memory-report')
+def session_memory_report_command():
+    """Measures bytes held per InterviewSession at 6, 20 and 50 turns (slotted records vs. legacy dicts)."""
+    import tracemalloc
+    from modules.interview_logic import HistoryEntry, QnATurn
+
+    def build_session(num_turns, legacy_dicts):
+        # Synthetic but realistically sized texts; each string is a distinct object per session
+        session_obj = InterviewSession.__new__(InterviewSession)
+        for field in InterviewSession.PERSISTED_FIELDS:
+            setattr(session_obj, field, None)
+        session_obj.resume_text_raw = "resume " * 600
+        session_obj.jd_text_raw = "job description " * 200
+        session_obj.prepared_questions = [f"Prepared question {i} " + "about a scenario " * 8 for i in range(config.NUM_QUESTIONS + 1)]
+        session_obj.conversation_history, session_obj.interview_qna = [], []
+        for turn in range(1, num_turns + 1):
+            question = session_obj.prepared_questions[turn % len(session_obj.prepared_questions)]
+            ai_text = f"Thanks. Turn {turn}. " + question
+            response = f"Candidate answer {turn} " + "with supporting detail " * 35
+            if legacy_dicts:
+                session_obj.conversation_history += [{"speaker": config.INTERVIEWER_AI_NAME, "text": ai_text}, {"speaker": config.CANDIDATE_NAME, "text": response}]
+                session_obj.interview_qna.append({
+                    "question_turn": turn, "question": question, "response": response, "is_prepared_question": True,
+                    "prepared_question_index": turn % 7 + 1, "detection_method": "Prepared Q Match (Overlap: 80.0%)",
+                    "stt_success": True, "stt_error_message": None, "confidence_score": 0.72, "confidence_rating": "Medium",
+                    "primary_emotion": "neutral", "confidence_analysis_error": False, "confidence_message": "ok",
+                    "evaluation": f"Evaluation {turn} " + "structured feedback " * 60, "score": 4, "score_justification": "Solid answer.",
+                })
+            else:
+                session_obj.conversation_history += [HistoryEntry(config.INTERVIEWER_AI_NAME, ai_text), HistoryEntry(config.CANDIDATE_NAME, response)]
+                session_obj.interview_qna.append(QnATurn(
+                    question_turn=turn, question=question, response=response, is_prepared_question=True,
+                    prepared_question_index=turn % 7 + 1, detection_method="Prepared Q Match (Overlap: 80.0%)",
+                    stt_success=True, confidence_score=0.72, confidence_rating="Medium", primary_emotion="neutral",
+                    confidence_analysis_error=False, confidence_message="ok",
+                    evaluation=f"Evaluation {turn} " + "structured feedback " * 60, score=4, score_justification="Solid answer.",
+                ))
+        return session_obj
+
+    sample_size = 50
+    print(f"{'turns':>5} | {'legacy dict bytes/session':>26} | {'slotted bytes/session':>22} | {'saved':>6}")
+    for num_turns in (6, 20, 50):
+        results = {}
+        for legacy in (True, False):
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            sessions = [build_session(num_turns, legacy) for _ in range(sample_size)]
+            results[legacy] = (tracemalloc.get_traced_memory()[0] - baseline) / sample_size
+            tracemalloc.stop()
+            del sessions
+        saved = 1 - results[False] / results[True] if results[True] else 0
+        print(f"{num_turns:>5} | {results[True]:>26,.0f} | {results[False]:>22,.0f} | {saved:>6.1%}")
+
+
+@app.cli.command('session-lock-stress')
+@click.option('--threads', type=int, default=32, show_default=True, help='Concurrent requests fired at one interview.')
+@click.option('--rounds', type=int, default=5, show_default=True, help='Bursts to run; each needs the lock released by the previous one.')
+@click.option('--hold-seconds', type=float, default=0.5, show_default=True, help='How long the winning request holds the session (raised above SESSION_LOCK_WAIT_SECONDS).')
+@click.option('--file-locks', is_flag=True, help='Use the cross-process flock locks of the file backend (in a temporary directory).')
+def session_lock_stress_command(threads, rounds, hold_seconds, file_locks):
+    """Hammers one interview from many threads through @with_session_lock: exactly one request may win per burst."""
+    global session_locks
+    import shutil
+    import tempfile
+    from types import SimpleNamespace
+    from modules.session_store import SessionLockManager
+
+    hold_seconds = max(hold_seconds, config.SESSION_LOCK_WAIT_SECONDS * 2 + 0.2) # Losers must give up while the winner still holds
+    interview_id = f"lock-stress-{uuid.uuid4()}"
+    stress_user = SimpleNamespace(id="lock-stress", is_active=True, is_authenticated=True, get_id=lambda: "lock-stress")
+    inside = {"now": 0, "max": 0}
+    inside_lock = threading.Lock()
+
+    @with_session_lock
+    def busy_view():
+        with inside_lock:
+            inside["now"] += 1
+            inside["max"] = max(inside["max"], inside["now"])
+        time.sleep(hold_seconds)
+        with inside_lock:
+            inside["now"] -= 1
+        return jsonify({"status": "OK"}), 200
+
+    def fire(barrier, statuses, index):
+        with app.test_request_context('/submit-response', method='POST'):
+            flask_session['interview_id'] = interview_id
+            login_user(stress_user)
+            barrier.wait()
+            result = busy_view()
+            statuses[index] = result[1] if isinstance(result, tuple) else 200
+
+    saved_locks = session_locks
+    lock_dir = tempfile.mkdtemp(prefix="session-lock-stress-") if file_locks else None
+    session_locks = SessionLockManager(lock_dir=lock_dir) if file_locks else session_locks
+    failures = []
+    try:
+        before = session_locks.get_stats()
+        print(f"{threads} threads x {rounds} rounds against {interview_id} ({'flock' if file_locks else 'in-process'} locks, hold {hold_seconds:.2f}s)")
+        for round_number in range(1, rounds + 1):
+            barrier = threading.Barrier(threads)
+            statuses = [None] * threads
+            workers = [threading.Thread(target=fire, args=(barrier, statuses, i)) for i in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            ok, busy = statuses.count(200), statuses.count(409)
+            print(f"  round {round_number}: {ok} acquired, {busy} rejected with 409, {time.perf_counter() - started:.2f}s")
+            if ok != 1 or busy != threads - 1:
+                failures.append(f"round {round_number}: expected 1 acquired and {threads - 1} rejected, got {ok} and {busy} (statuses {sorted(set(map(str, statuses)))})")
+        after = session_locks.get_stats()
+    finally:
+        session_locks = saved_locks
+        if lock_dir:
+            shutil.rmtree(lock_dir, ignore_errors=True)
+
+    # The same counters /metrics/sessions reports under "locks"
+    acquired, rejected = after["acquired"] - before["acquired"], after["rejected"] - before["rejected"]
+    print(f"lock stats: +{acquired} acquired, +{rejected} rejected, held now {after['held']}, max wait {after['max_wait_seconds']:.3f}s, most requests inside the view {inside['max']}")
+    if inside["max"] != 1:
+        failures.append(f"{inside['max']} requests ran the view at the same time")
+    if acquired != rounds or rejected != rounds * (threads - 1):
+        failures.append(f"lock counters: expected +{rounds} acquired / +{rounds * (threads - 1)} rejected, got +{acquired} / +{rejected}")
+    if after["held"] != 0:
+        failures.append(f"{after['held']} lock(s) still marked held after all requests finished")
+    if failures:
+        raise click.ClickException("Session lock stress test failed:\n  " + "\n  ".join(failures))
+    print("OK: exactly one request per burst held the session; all others got 409.")
+
+
+@app.cli.command('embedding-benchmark')
+@click.option('--backends', default='torch,onnx,int8', show_default=True, help='Comma-separated EMBEDDING_BACKEND values to compare (torch is the reference).')
+@click.option('--samples', type=int, default=200, show_default=True, help='Number of texts (knowledge_documents contents if reachable, else synthetic queries).')
+def embedding_benchmark_command(backends, samples):
+    """Compares embedding backends: load time, memory, single-query latency, batch throughput and cosine agreement with float32 torch."""
+    import numpy as np
+
+    if not utils.RAG_DEPENDENCIES_AVAILABLE:
+        print("Error: sentence-transformers is not installed.")
+        return
+    backend_list = ['torch'] + [b.strip() for b in backends.split(',') if b.strip() and b.strip() != 'torch']
+
+    texts = []
+    try:
+        from modules import rag_admin
+        conn = rag_admin.open_admin_connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT content FROM knowledge_documents ORDER BY random() LIMIT %s", (samples,))
+            texts = [row[0] for row in cur.fetchall()]
+        conn.close()
+    except Exception as e:
+        print(f"Knowledge base not reachable ({e}); using synthetic queries.")
+    if not texts:
+        topics = ["indexing", "replication", "REST APIs", "unit testing", "caching", "concurrency", "query tuning", "microservices"]
+        roles = ["Software Engineer", "Database Administrator", "Data Analyst"]
+        texts = [f"Common interview questions about {topics[i % len(topics)]} for {roles[i % len(roles)]} (case {i})" for i in range(samples)]
+    single_texts = texts[:50]
+
+    def measure(backend):
+        before = _memory_kb()
+        start = time.time()
+        model = utils.create_embedding_model(backend)
+        load_seconds = time.time() - start
+        model.encode(single_texts[:2]) # Warm-up
+        latencies = []
+        for text in single_texts:
+            start = time.time()
+            model.encode([text])
+            latencies.append(time.time() - start)
+        start = time.time()
+        vectors = np.asarray(model.encode(texts, batch_size=32), dtype=np.float32)
+        batch_seconds = time.time() - start
+        return {
+            "load_seconds": load_seconds,
+            "rss_delta_kb": _memory_kb()['Rss'] - before['Rss'],
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "texts_per_second": len(texts) / batch_seconds if batch_seconds else 0.0,
+            "vectors": vectors.tolist(),
+        }
+
+    def normalized(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    results = {}
+    for backend in backend_list:
+        print(f"Measuring '{backend}'...")
+        results[backend] = _run_in_child(lambda: measure(backend)) # Fresh process per backend for clean memory numbers
+        if "error" in results[backend]:
+            print(f"  skipped: {results[backend]['error']}")
+    if "error" in results['torch']:
+        print("Error: the float32 torch reference could not be measured.")
+        return
+
+    reference = normalized(results['torch']['vectors'])
+    k = min(5, len(texts) - 1)
+    reference_top = np.argsort(-(reference @ reference.T), axis=1)[:, 1:k + 1]
+    print(f"\n{len(texts)} texts, model {config.EMBEDDING_MODEL_NAME}")
+    print(f"{'backend':>8} | {'load s':>6} | {'+RSS MB':>7} | {'p50 ms':>7} | {'p95 ms':>7} | {'texts/s':>8} | {'cos mean':>8} | {'cos min':>7} | {'top' + str(k) + ' overlap':>12}")
+    for backend, result in results.items():
+        if "error" in result:
+            continue
+        vectors = normalized(result['vectors'])
+        cosines = np.sum(vectors * reference, axis=1)
+        top = np.argsort(-(vectors @ vectors.T), axis=1)[:, 1:k + 1]
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)]) if k > 0 else 1.0
+        print(f"{backend:>8} | {result['load_seconds']:>6.1f} | {result['rss_delta_kb'] / 1024:>7.0f} | {result['p50_ms']:>7.1f} | {result['p95_ms']:>7.1f} | "
+              f"{result['texts_per_second']:>8.1f} | {cosines.mean():>8.4f} | {cosines.min():>7.4f} | {overlap:>12.2%}")
+    print("\nSwitch EMBEDDING_BACKEND only if cosine stays close to 1.0 and the top-k overlap stays high.")
+    print("Stored knowledge_documents embeddings come from the float model, so small drifts shift similarity scores near RETRIEVAL_SIMILARITY_THRESHOLD.")
+
+
+@app.cli.command('embedding-server')
+@click.option('--socket-path', default=None, help='Unix socket to listen on (default: EMBEDDING_SERVER_SOCKET).')
+def embedding_server_command(socket_path):
+    """Runs the shared embedding server: one model copy, requests from all workers encoded in dynamic batches."""
+    from modules.embedding_server import EmbeddingServer
+
+    socket_path = socket_path or config.EMBEDDING_SERVER_SOCKET
+    if not socket_path:
+        print("Error: set EMBEDDING_SERVER_SOCKET or pass --socket-path.")
+        return
+    model = utils.get_embedding_model(allow_load=True)
+    if model is None:
+        print("Error: the embedding model could not be loaded (check RAG_ENABLED and sentence-transformers).")
+        return
+    server = EmbeddingServer(socket_path, model)
+    print(f"Embedding server listening on {server.socket_path} (max batch {server.batcher.max_batch} texts, max wait {config.EMBEDDING_SERVER_MAX_WAIT_MS} ms).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stats = server.batcher.stats
+        if stats["batches"]:
+            print(f"Served {stats['requests']} requests in {stats['batches']} batches (avg {stats['texts'] / stats['batches']:.1f} texts/batch).")
+
+
+def _memory_kb():
+    """Memory of the current process in kB, from /proc/self/smaps_rollup (Linux), else peak RSS."""
+    # Rss: resident pages; Pss: shared pages split between sharers; Private: pages only this process holds
+    values = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                    values[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        import resource
+        values['Rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    values['Private'] = values.pop('Private_Clean', 0) + values.pop('Private_Dirty', 0)
+    return values
+
+
+def _run_in_child(fn):
+    """Runs fn() in a forked child and returns its JSON-serializable result (isolates memory measurements)."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0: # Child: measure, report through the pipe, exit without running atexit handlers
+        os.close(read_fd)
+        try:
+            payload = json.dumps(fn())
+        except Exception as e:
+            payload = json.dumps({"error": str(e)})
+        with os.fdopen(write_fd, 'w') as f:
+            f.write(payload)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+
+@app.cli.command('embedding-memory-report')
+@click.option('--workers', type=int, default=3, show_default=True, help='Number of simulated workers to fork for the preload measurement.')
+def embedding_memory_report_command(workers):
+    """Reports embedding-model startup time and per-worker memory for the eager, lazy and preload loading modes (Linux)."""
+    import gc
+
+    if not utils.RAG_DEPENDENCIES_AVAILABLE:
+        print("Error: sentence-transformers is not installed.")
+        return
+    probe = "Common interview questions about databases for Software Engineer"
+
+    # Eager/lazy cost: a fresh model instance in a clean child (what every worker pays on its own)
+    def load_fresh():
+        before = _memory_kb()
+        start = time.time()
+        model = utils.SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+        load_seconds = time.time() - start
+        start = time.time()
+        model.encode([probe])
+        first_encode = time.time() - start
+        after = _memory_kb()
+        return {"load_seconds": load_seconds, "first_encode_seconds": first_encode, "rss_delta_kb": after['Rss'] - before['Rss']}
+    fresh = _run_in_child(load_fresh)
+    if "error" in fresh:
+        print(f"Error loading the model: {fresh['error']}")
+        return
+
+    # Preload: model loaded once here (the "master"), then workers forked after gc.freeze()
+    utils.get_embedding_model(allow_load=True)
+    gc.freeze()
+    def worker_after_fork():
+        utils.get_embedding_model(allow_load=True).encode([probe])
+        return _memory_kb()
+    forked = [_run_in_child(worker_after_fork) for _ in range(workers)]
+    gc.unfreeze()
+    avg_private_kb = sum(m['Private'] for m in forked) / len(forked)
+    avg_pss_kb = sum(m.get('Pss', m['Rss']) for m in forked) / len(forked)
+
+    mb = 1024.0
+    print(f"Model: {config.EMBEDDING_MODEL_NAME} (current EMBEDDING_LOAD_MODE={config.EMBEDDING_LOAD_MODE})")
+    print(f"{'mode':>8} | {'worker boot s':>13} | {'first RAG use s':>15} | {'model MB per worker':>19}")
+    print(f"{'eager':>8} | {fresh['load_seconds']:>13.1f} | {fresh['first_encode_seconds']:>15.2f} | {fresh['rss_delta_kb'] / mb:>19.0f}")
+    print(f"{'lazy':>8} | {0.0:>13.1f} | {fresh['load_seconds'] + fresh['first_encode_seconds']:>15.2f} | {fresh['rss_delta_kb'] / mb:>19.0f}")
+    print(f"{'preload':>8} | {0.0:>13.1f} | {'n/a':>15} | {avg_private_kb / mb:>19.0f}")
+    print(f"\npreload: {workers} forked workers, avg private {avg_private_kb / mb:.0f} MB, avg PSS {avg_pss_kb / mb:.0f} MB "
+          f"(the model is loaded once in the master: {fresh['load_seconds']:.1f}s).")
+    print("'model MB per worker' for preload is the worker's whole private memory after one encode, not just the model.")
+
+
+@app.cli.command('rag-index')
+@click.option('--method', type=click.Choice(['hnsw', 'ivfflat']), default='hnsw', show_default=True, help='ANN index type to build.')
+@click.option('--storage', type=click.Choice(['vector', 'halfvec', 'binary']), default=None, help='Vector representation to index (default: RAG_VECTOR_STORAGE).')
+@click.option('--lists', type=int, default=None, help='IVFFlat lists (default: rows/1000, or sqrt(rows) above 1M rows).')
+@click.option('--m', 'hnsw_m', type=int, default=16, show_default=True, help='HNSW max connections per layer.')
+@click.option('--ef-construction', type=int, default=64, show_default=True, help='HNSW build-time candidate list size.')
+@click.option('--replace', is_flag=True, help='Drop and rebuild the index if it already exists.')
+@click.option('--explain-only', is_flag=True, help='Skip the build and only report query plans/timings.')
+@click.option('--tune', default='', help='Comma-separated ef_search (hnsw) or probes (ivfflat) values to compare, e.g. 20,40,80,160.')
+@click.option('--compare', is_flag=True, help='Compare every storage that has an index for --method (recall/latency against exact search).')
+@click.option('--candidates', type=int, default=None, help='Re-rank candidates per query for halfvec/binary (default: RAG_RERANK_CANDIDATES).')
+@click.option('--samples', type=int, default=1, show_default=True, help='Random stored embeddings to average the timings and recall over.')
+@click.option('--sample-query', default=None, help='Text to embed for the EXPLAIN runs (default: random stored documents).')
+def rag_index_command(method, storage, lists, hnsw_m, ef_construction, replace, explain_only, tune, compare, candidates, samples, sample_query):
+    """Creates/tunes the pgvector ANN index on knowledge_documents and reports EXPLAIN ANALYZE timings."""
+    from modules import rag_admin
+
+    storage = storage or config.RAG_VECTOR_STORAGE
+    try:
+        conn = rag_admin.open_admin_connection()
+    except Exception as e:
+        print(f"Error: could not connect to the RAG database: {e}")
+        return
+    try:
+        with conn.cursor() as cur:
+            print(f"{rag_admin.TABLE_NAME}: {rag_admin.count_documents(cur):,} rows")
+            if not explain_only:
+                elapsed = rag_admin.create_ann_index(cur, method, lists=lists, m=hnsw_m, ef_construction=ef_construction, replace=replace, storage=storage)
+                print(f"Index {rag_admin.index_name(method, storage)} ready in {elapsed:.1f}s.")
+            sizes, shared_buffers = rag_admin.index_sizes(cur)
+            for name, definition in rag_admin.list_vector_indexes(cur):
+                print(f"  {definition}  [{sizes.get(name, 0) / 1024 ** 2:,.1f} MiB]")
+            print(f"  shared_buffers: {shared_buffers / 1024 ** 2:,.1f} MiB")
+
+            embeddings = rag_admin.sample_query_embeddings(cur, sample_query, samples)
+            top_k = max(config.RETRIEVAL_TOP_K, 1)
+            baselines = [rag_admin.explain_probe(cur, embedding, top_k, exact=True) for embedding in embeddings]
+            baseline_ms = sum(b['execution_ms'] for b in baselines) / len(baselines)
+            baseline_plan_ms = sum(b['planning_ms'] for b in baselines) / len(baselines)
+            print(f"\n{'storage':>8} | {'setting':>16} | {'exec ms':>9} | {'plan ms':>8} | {'index':>5} | {'recall@' + str(top_k):>9}")
+            print(f"{'vector':>8} | {'exact (seqscan)':>16} | {baseline_ms:>9.2f} | {baseline_plan_ms:>8.2f} | {'no':>5} | {1.0:>9.2f}")
+
+            if compare:
+                existing = {name for name, _ in rag_admin.list_vector_indexes(cur)}
+                storages = [s for s in rag_admin.STORAGES if rag_admin.index_name(method, s) in existing]
+            else:
+                storages = [storage]
+            knob = 'ef_search' if method == 'hnsw' else 'probes'
+            configured = config.RAG_HNSW_EF_SEARCH if method == 'hnsw' else config.RAG_IVFFLAT_PROBES
+            values = [int(v) for v in tune.split(',') if v.strip()] or [configured]
+            for probe_storage in storages:
+                for value in values:
+                    kwargs = {'ef_search': value} if method == 'hnsw' else {'probes': value}
+                    results = [rag_admin.explain_probe(cur, embedding, top_k, storage=probe_storage, candidates=candidates, **kwargs) for embedding in embeddings]
+                    recalls = [len(set(r['ids']) & set(b['ids'])) / len(b['ids']) if b['ids'] else 1.0 for r, b in zip(results, baselines)]
+                    label = f"{knob}={value or 'default'}"
+                    print(f"{probe_storage:>8} | {label:>16} | {sum(r['execution_ms'] for r in results) / len(results):>9.2f} | "
+                          f"{sum(r['planning_ms'] for r in results) / len(results):>8.2f} | {'yes' if all(r['uses_index'] for r in results) else 'no':>5} | "
+                          f"{sum(recalls) / len(recalls):>9.2f}")
+            env_name = 'RAG_HNSW_EF_SEARCH' if method == 'hnsw' else 'RAG_IVFFLAT_PROBES'
+            print(f"\nSet {env_name} to the smallest value with acceptable recall (and RAG_VECTOR_STORAGE to the storage you chose).")
+    except Exception as e:
+        logger.error(f"rag-index failed: {e}", exc_info=True)
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+@app.cli.command('rag-snapshot')
+@click.option('--full', is_flag=True, help='Rebuild from scratch instead of appending new rows (needed after edits to existing documents).')
+def rag_snapshot_command(full):
+    """Snapshots knowledge_documents into the memory-mapped index used by RAG_BACKEND=local."""
+    from modules import rag_admin, rag_local_index
+
+    try:
+        conn = rag_admin.open_admin_connection()
+        conn.autocommit = False # Server-side cursors need a transaction
+    except Exception as e:
+        print(f"Error: could not connect to the RAG database: {e}")
+        return
+    try:
+        result = rag_local_index.build_snapshot(conn, config.RAG_LOCAL_INDEX_DIR, full=full)
+        print(f"Snapshot {result['version']} ({result['mode']}): {result['documents']:,} documents, {result['added']:,} added in {result['seconds']:.1f}s.")
+        print(f"Directory: {config.RAG_LOCAL_INDEX_DIR}. Running workers pick it up within {config.RAG_LOCAL_RELOAD_CHECK_SECONDS}s.")
+    except Exception as e:
+        logger.error(f"rag-snapshot failed: {e}", exc_info=True)
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+@app.cli.command('rag-ingest')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--workers', type=int, default=None, help='Worker processes, each with its own model copy (default: RAG_INGEST_WORKERS).')
+@click.option('--force', is_flag=True, help='Re-embed documents even if the ingest log says they are up to date.')
+def rag_ingest_command(path, workers, force):
+    """Chunks, embeds and bulk-loads documents from PATH into knowledge_documents (resumable)."""
+    from modules import rag_ingest
+
+    def report(result, totals):
+        rate = totals["documents"] / totals["seconds"] if totals["seconds"] else 0.0
+        status = f"error: {result['error']}" if "error" in result else f"{result['documents']} docs, {result['chunks']} chunks, {result['skipped']} skipped"
+        print(f"[{totals['files_done']}/{totals['files']}] {os.path.basename(result['path'])}: {status} ({rate:.1f} docs/s)")
+
+    print(f"Ingesting {path} with model {rag_ingest.model_signature()}...")
+    try:
+        totals = rag_ingest.run_ingest(path, workers=workers, force=force, progress=report)
+    except Exception as e:
+        logger.error(f"rag-ingest failed: {e}", exc_info=True)
+        print(f"Error: {e}")
+        return
+    seconds = totals["seconds"] or 1e-9
+    print(f"Done: {totals['documents']:,} documents ({totals['chunks']:,} chunks) from {totals['files']:,} files in {totals['seconds']:.1f}s "
+          f"with {totals['workers']} workers: {totals['documents'] / seconds:.1f} docs/s, {totals['chunks'] / seconds:.1f} chunks/s.")
+    print(f"Skipped (already ingested): {totals['skipped']:,}. Failed files: {totals['failed']:,}" + (" (rerun to retry)." if totals['failed'] else "."))
+    if totals["documents"] and config.RAG_BACKEND == "local":
+        print("RAG_BACKEND=local: run `flask rag-snapshot --full` to publish the new documents to workers.")
+
+
 # --- Main Execution Block ---
 if __name__ == '__main__':
     logger.info("Running in __main__ block (direct execution)")
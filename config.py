@@ -14,11 +14,40 @@ NUM_QUESTIONS = 6
 raw_debug = os.environ.get("FLASK_DEBUG", "False")
 DEBUG = raw_debug.lower() in ("true", "1", "t", "yes")
 
+# --- Background Work (interview setup runs off the request thread) ---
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+BACKGROUND_MAX_PENDING = int(os.getenv("BACKGROUND_MAX_PENDING", "16")) # Queued jobs beyond this are rejected with 503
+
 # --- File Paths ---
 UPLOAD_FOLDER = os.path.abspath(os.getenv("UPLOAD_FOLDER", "temp_uploads"))
 REPORT_FOLDER = os.path.abspath(os.getenv("REPORT_FOLDER", "reports"))
 REPORT_FILENAME_TEMPLATE = "{interview_id}_interview_report.pdf"
 
+# --- Interview Session Storage ---
+# 'memory' keeps sessions in the worker process (single worker only).
+# 'file' shares serialized sessions between worker processes via SESSION_STORE_DIR.
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+SESSION_STORE_DIR = os.path.abspath(os.getenv("SESSION_STORE_DIR", "interview_sessions"))
+# Gunicorn worker processes (read by gunicorn.conf.py). More than one requires the 'file' backend.
+GUNICORN_WORKERS = int(os.getenv("GUNICORN_WORKERS", "2" if SESSION_STORE_BACKEND == "file" else "1"))
+# Eviction (0 disables a limit). Sessions idle longer than the TTL are discarded.
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(4 * 3600)))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "200")) # Memory backend: max live sessions per worker
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024))) # Memory backend: approx. serialized size budget
+SESSION_IDLE_SPILL_SECONDS = int(os.getenv("SESSION_IDLE_SPILL_SECONDS", "900")) # Memory backend: spill idle sessions to disk
+SESSION_SPILL_DIR = os.path.abspath(os.getenv("SESSION_SPILL_DIR", os.path.join(SESSION_STORE_DIR, "spill")))
+SESSION_SWEEP_INTERVAL_SECONDS = int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+# Append-only per-interview checkpoint journal used to recover sessions after a restart/deploy
+SESSION_JOURNAL_ENABLED = os.getenv("SESSION_JOURNAL_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+SESSION_JOURNAL_DIR = os.path.abspath(os.getenv("SESSION_JOURNAL_DIR", "interview_journal"))
+SESSION_JOURNAL_FSYNC = os.getenv("SESSION_JOURNAL_FSYNC", "True").lower() in ("true", "1", "t", "yes")
+# How long a request waits for another request on the same interview before answering 409 (0 = fail fast)
+SESSION_LOCK_WAIT_SECONDS = float(os.getenv("SESSION_LOCK_WAIT_SECONDS", "0"))
+
+# Job-description analysis (summary, title, keywords, role guidance) shared across candidates for the same JD
+JD_CACHE_SIZE = int(os.getenv("JD_CACHE_SIZE", "128")) # 0 disables
+JD_CACHE_TTL_SECONDS = int(os.getenv("JD_CACHE_TTL_SECONDS", str(24 * 3600)))
+
 # --- SQLAlchemy Database (Users, Reports, Auth Data) ---
 SQLALCHEMY_DB_NAME = os.getenv("SQLALCHEMY_DB_NAME", "users")
 SQLALCHEMY_DB_USER = os.getenv("SQLALCHEMY_DB_USER") # Load from .env
@@ -41,12 +70,72 @@ RAG_DB_USER = os.getenv("RAG_DB_USER") # Load from .env
 RAG_DB_PASSWORD = os.getenv("RAG_DB_PASSWORD", "") # Load from .env, default empty
 RAG_DB_HOST = os.getenv("RAG_DB_HOST", "localhost")
 RAG_DB_PORT = os.getenv("RAG_DB_PORT", "5432")
+# Connection pool shared by request threads (per worker process)
+RAG_DB_POOL_MIN = int(os.getenv("RAG_DB_POOL_MIN", "1"))
+RAG_DB_POOL_MAX = int(os.getenv("RAG_DB_POOL_MAX", "8"))
+RAG_DB_POOL_WAIT_SECONDS = float(os.getenv("RAG_DB_POOL_WAIT_SECONDS", "5")) # Wait for a free connection before giving up
+RAG_DB_STATEMENT_TIMEOUT_MS = int(os.getenv("RAG_DB_STATEMENT_TIMEOUT_MS", "5000"))
+RAG_DB_HEALTHCHECK_IDLE_SECONDS = int(os.getenv("RAG_DB_HEALTHCHECK_IDLE_SECONDS", "30")) # Ping connections idle longer than this on checkout
+RAG_DB_RECONNECT_INTERVAL_SECONDS = int(os.getenv("RAG_DB_RECONNECT_INTERVAL_SECONDS", "30"))
 
 # --- RAG Configuration ---
 EMBEDDING_MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
-MAX_CONTEXT_LENGTH = 10000
+# 'eager' loads the model at app import in every worker, 'lazy' on first RAG use, 'preload' once in the gunicorn
+# master before fork (see gunicorn.conf.py) so workers share its memory copy-on-write.
+EMBEDDING_LOAD_MODE = os.getenv("EMBEDDING_LOAD_MODE", "eager").lower()
+if EMBEDDING_LOAD_MODE not in ("eager", "lazy", "preload"):
+    logger.warning(f"Unknown EMBEDDING_LOAD_MODE '{EMBEDDING_LOAD_MODE}'. Using 'eager'.")
+    EMBEDDING_LOAD_MODE = "eager"
+# Inference backend for the embedding model: 'torch' (float32), 'onnx' (ONNX Runtime) or 'int8' (dynamic quantization).
+# Check accuracy/latency against 'torch' with `flask embedding-benchmark` before switching.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "") # Optional ONNX file in the model repo, e.g. onnx/model_qint8_avx512_vnni.onnx
+MAX_CONTEXT_LENGTH = 10000 # Hard character cap on the RAG context
+# RAG context packing: token budget for the knowledge-base context in the question-generation prompt. Documents are
+# trimmed to their most relevant sentences and near-duplicates (word-shingle Jaccard >= threshold) are dropped.
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1200"))
+RAG_CONTEXT_MAX_SENTENCES_PER_DOC = int(os.getenv("RAG_CONTEXT_MAX_SENTENCES_PER_DOC", "4"))
+RAG_CONTEXT_DEDUP_THRESHOLD = float(os.getenv("RAG_CONTEXT_DEDUP_THRESHOLD", "0.6"))
+RAG_CONTEXT_CHARS_PER_TOKEN = float(os.getenv("RAG_CONTEXT_CHARS_PER_TOKEN", "4")) # Token estimate used for the budget
 RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
 RETRIEVAL_SIMILARITY_THRESHOLD = float(os.getenv("RETRIEVAL_SIMILARITY_THRESHOLD", "0.58"))
+# pgvector ANN index search knobs (see `flask rag-index`); 0 keeps the server default
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "0")) # HNSW candidate list size (pgvector default 40; must be >= RETRIEVAL_TOP_K)
+RAG_IVFFLAT_PROBES = int(os.getenv("RAG_IVFFLAT_PROBES", "0")) # IVFFlat lists scanned per query (pgvector default 1)
+# Representation searched by the ANN index: 'vector' (float32), 'halfvec' (float16, half the index size) or 'binary'
+# (binary_quantize + Hamming distance, 1/32 the size). With halfvec/binary the top RAG_RERANK_CANDIDATES per query are
+# re-ranked by exact cosine on the full-precision column. Build the matching index with `flask rag-index --storage ...`.
+RAG_VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "vector").lower()
+if RAG_VECTOR_STORAGE not in ("vector", "halfvec", "binary"):
+    logger.warning(f"Unknown RAG_VECTOR_STORAGE '{RAG_VECTOR_STORAGE}'. Using 'vector'.")
+    RAG_VECTOR_STORAGE = "vector"
+RAG_RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "40")) # Coarse candidates per query (binary usually needs more, e.g. 200)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768")) # Must match knowledge_documents.embedding (used in halfvec/bit casts)
+# 'postgres' queries pgvector per interview; 'local' searches a memory-mapped snapshot built by `flask rag-snapshot`
+RAG_BACKEND = os.getenv("RAG_BACKEND", "postgres").lower()
+RAG_LOCAL_INDEX_DIR = os.path.abspath(os.getenv("RAG_LOCAL_INDEX_DIR", "rag_index"))
+RAG_LOCAL_RELOAD_CHECK_SECONDS = int(os.getenv("RAG_LOCAL_RELOAD_CHECK_SECONDS", "30")) # How often workers look for a newer snapshot
+# Cache of the final formatted RAG context per JD + focus topics (0 disables); invalidated when knowledge_documents changes
+RAG_CONTEXT_CACHE_SIZE = int(os.getenv("RAG_CONTEXT_CACHE_SIZE", "256"))
+RAG_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("RAG_CONTEXT_CACHE_TTL_SECONDS", str(6 * 3600)))
+RAG_KB_VERSION_CHECK_SECONDS = int(os.getenv("RAG_KB_VERSION_CHECK_SECONDS", "60")) # How often the knowledge base change check runs
+# Bulk ingestion (`flask rag-ingest`): worker processes (one model copy each), encode batch size and chunking
+RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", "2"))
+RAG_INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "128"))
+RAG_INGEST_CHUNK_CHARS = int(os.getenv("RAG_INGEST_CHUNK_CHARS", "1200"))
+RAG_INGEST_CHUNK_OVERLAP_CHARS = int(os.getenv("RAG_INGEST_CHUNK_OVERLAP_CHARS", "200"))
+# Optional shared embedding server (`flask embedding-server`): workers send encode requests over this Unix socket
+# and the server batches requests that arrive within MAX_WAIT_MS. Empty = encode in-process.
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+EMBEDDING_SERVER_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_SERVER_TIMEOUT_SECONDS", "10"))
+EMBEDDING_SERVER_FALLBACK = os.getenv("EMBEDDING_SERVER_FALLBACK", "True").lower() in ("true", "1", "t", "yes") # Load the model in-process if the server is down
+# Query-embedding cache: in-memory LRU entries per worker (0 disables), plus an optional SQLite file that survives restarts
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "") # e.g. cache/embeddings.sqlite3 ('' = memory only)
+if EMBEDDING_CACHE_PATH:
+    EMBEDDING_CACHE_PATH = os.path.abspath(EMBEDDING_CACHE_PATH)
 
 if not RAG_ENABLED:
     RETRIEVAL_TOP_K = 0
@@ -68,9 +157,87 @@ elif GOOGLE_APPLICATION_CREDENTIALS:
 INTERVIEWER_LLM_MODEL_NAME = "gemini-1.5-flash-latest"
 EVALUATOR_LLM_MODEL_NAME = "gemini-1.5-pro-latest" # Consider using flash here too for cost/speed if acceptable
 
+# --- LLM Rate Limiting (per worker process, see modules/llm_limiter.py) ---
+# Project quota per model as "model=rpm:tpm,..." (0 = unlimited); models not listed use LLM_DEFAULT_RPM/TPM.
+# Each process gets 1/LLM_RATE_LIMIT_PROCESSES of it, which defaults to the gunicorn worker count.
+def _parse_rate_limits(value):
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            model, rates = item.rsplit("=", 1)
+            rpm, tpm = rates.split(":")
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            logger.warning(f"Ignoring malformed LLM_RATE_LIMITS entry '{item}' (expected model=rpm:tpm).")
+    return limits
+
+LLM_RATE_LIMITS = _parse_rate_limits(os.getenv(
+    "LLM_RATE_LIMITS", f"{INTERVIEWER_LLM_MODEL_NAME}=2000:4000000,{EVALUATOR_LLM_MODEL_NAME}=1000:4000000"
+))
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "0"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "0"))
+LLM_RATE_LIMIT_PROCESSES = int(os.getenv("LLM_RATE_LIMIT_PROCESSES", str(GUNICORN_WORKERS))) # gunicorn.conf.py keeps this in step with -w
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "8")) # Calls in flight per process, all models (0 = unlimited)
+LLM_MAX_CONCURRENT_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENT_PER_MODEL", "0")) # 0 = only the global cap applies
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30")) # Longest wait for capacity before failing the call
+
+# --- LLM Retries and Circuit Breakers (see modules/llm_resilience.py) ---
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2")) # Retries of retryable errors (429, 5xx, timeouts); terminal errors are never retried
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "1")) # Backoff doubles per attempt, with jitter
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "8")) # Cap on one backoff (a longer server retry hint still wins)
+LLM_RETRY_BUDGET_SECONDS = float(os.getenv("LLM_RETRY_BUDGET_SECONDS", "20")) # No retry starts past this long after the first attempt
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "60")) # Deadline per Gemini request (0 = client default)
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")) # Consecutive provider failures that open a model's breaker (0 = disabled)
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")) # Open breakers fail fast this long, then let one probe through
+
+# Model used while a model's breaker is open or its retries failed, as "model=fallback,..."
+def _parse_fallback_models(value):
+    fallbacks = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        model, _, fallback = item.partition("=")
+        if model.strip() and fallback.strip():
+            fallbacks[model.strip()] = fallback.strip()
+        else:
+            logger.warning(f"Ignoring malformed LLM_FALLBACK_MODELS entry '{item}' (expected model=fallback).")
+    return fallbacks
+
+LLM_FALLBACK_MODELS = _parse_fallback_models(os.getenv("LLM_FALLBACK_MODELS", f"{EVALUATOR_LLM_MODEL_NAME}={INTERVIEWER_LLM_MODEL_NAME}"))
+
+# --- LLM Response Cache (opt-in, see modules/llm_cache.py) ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "False").lower() in ("true", "1", "t")
+LLM_CACHE_SITES = frozenset(site.strip() for site in os.getenv("LLM_CACHE_SITES", "question_generation,evaluation").split(",") if site.strip()) # Call sites whose responses are cached
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512")) # In-memory entries per worker (0 = disk only)
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRY_BYTES = int(os.getenv("LLM_CACHE_MAX_ENTRY_BYTES", str(64 * 1024))) # Larger responses are not cached
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "") # e.g. cache/llm_responses.sqlite3 ('' = memory only)
+if LLM_CACHE_PATH:
+    LLM_CACHE_PATH = os.path.abspath(LLM_CACHE_PATH)
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "20000")) # Oldest entries beyond this are trimmed (0 = no limit)
+
+# --- Gemini Context Caching of the interviewer prompt prefix (resume, JD, prepared questions, instructions) ---
+LLM_CONTEXT_CACHE_ENABLED = os.getenv("LLM_CONTEXT_CACHE_ENABLED", "True").lower() in ("true", "1", "t")
+LLM_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS", "32768")) # Provider minimum; smaller prefixes are sent in full
+LLM_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("LLM_CONTEXT_CACHE_TTL_SECONDS", "3600")) # Should outlast an interview (recreated if it expires); deleted at evaluation or when the session is dropped
+
 # --- LLM Generation Parameters ---
 INTERVIEWER_MAX_TOKENS = 500
 INTERVIEWER_TEMPERATURE = 0.65
+# Streaming interviewer replies (/get-ai-message/stream): sentence chunks are relayed to the browser and the
+# NeuroSync Player as they complete. Chunks shorter than STREAM_MIN_CHUNK_CHARS are joined with the next sentence.
+INTERVIEWER_STREAMING_ENABLED = os.getenv("INTERVIEWER_STREAMING_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+STREAM_MIN_CHUNK_CHARS = int(os.getenv("STREAM_MIN_CHUNK_CHARS", "40"))
+# Generate the next AI turn in the background as soon as the candidate's transcript is recorded
+# Prefetched replies live in the worker that handled /submit-response. With the 'file' backend the next
+# request usually reaches another worker, so the prefetch would be an extra LLM call per turn.
+INTERVIEWER_PREFETCH_ENABLED = os.getenv("INTERVIEWER_PREFETCH_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+if INTERVIEWER_PREFETCH_ENABLED and SESSION_STORE_BACKEND == "file":
+    if "INTERVIEWER_PREFETCH_ENABLED" in os.environ:
+        logger.warning("INTERVIEWER_PREFETCH_ENABLED is ignored with SESSION_STORE_BACKEND=file (prefetched turns are per worker).")
+    INTERVIEWER_PREFETCH_ENABLED = False
+INTERVIEWER_PREFETCH_WAIT_SECONDS = float(os.getenv("INTERVIEWER_PREFETCH_WAIT_SECONDS", "90")) # Longest wait for an in-flight prefetch
+INTERVIEWER_PREFETCH_MAX_SESSIONS = int(os.getenv("INTERVIEWER_PREFETCH_MAX_SESSIONS", "256")) # Pending prefetches kept per worker
+INTERVIEWER_PREFETCH_WORKERS = int(os.getenv("INTERVIEWER_PREFETCH_WORKERS", "2")) # Own pool, separate from BACKGROUND_WORKERS (interview setup)
+INTERVIEWER_PREFETCH_MAX_PENDING = int(os.getenv("INTERVIEWER_PREFETCH_MAX_PENDING", "2")) # Beyond this, turns are generated on request instead
 EVALUATOR_MAX_TOKENS = 700
 EVALUATOR_TEMPERATURE = 0.5
 
@@ -153,6 +320,8 @@ if SQLALCHEMY_DATABASE_URI:
     logger.info(f"App DB (SQLAlchemy): postgresql://{SQLALCHEMY_DB_USER}:***@{SQLALCHEMY_DB_HOST}:{SQLALCHEMY_DB_PORT}/{SQLALCHEMY_DB_NAME}")
 else:
     logger.error("App DB (SQLAlchemy): NOT CONFIGURED")
+if RAG_ENABLED and RAG_BACKEND == "local":
+    logger.info(f"RAG Backend: local snapshot ({RAG_LOCAL_INDEX_DIR}), Postgres fallback")
 if RAG_ENABLED and RETRIEVAL_TOP_K > 0 and all([RAG_DB_NAME, RAG_DB_USER, RAG_DB_HOST]):
     logger.info(f"RAG DB (psycopg2): postgresql://{RAG_DB_USER}:***@{RAG_DB_HOST}:{RAG_DB_PORT}/{RAG_DB_NAME}")
 elif RAG_ENABLED:
@@ -162,6 +331,7 @@ else:
 logger.info(f"Mail Server: {MAIL_SERVER}:{MAIL_PORT} (Username: {MAIL_USERNAME})")
 logger.info(f"Upload Folder: {UPLOAD_FOLDER}")
 logger.info(f"Report Folder: {REPORT_FOLDER}")
+logger.info(f"Session Store: {SESSION_STORE_BACKEND}" + (f" ({SESSION_STORE_DIR})" if SESSION_STORE_BACKEND == "file" else ""))
 logger.info(f"Google Project ID: {GOOGLE_CLOUD_PROJECT_ID}")
 logger.info(f"Google API Key Set: {'Yes' if GOOGLE_API_KEY else 'No'}")
 logger.info(f"Google Credentials File Set: {'Yes - ' + GOOGLE_APPLICATION_CREDENTIALS if GOOGLE_APPLICATION_CREDENTIALS else 'No'}")
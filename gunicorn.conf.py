@@ -0,0 +1,44 @@
+# gunicorn.conf.py
+# Usage: gunicorn app:app   (this file is picked up automatically from the working directory)
+import gc
+import os
+
+import config
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5050")
+workers = config.GUNICORN_WORKERS # 1 unless SESSION_STORE_BACKEND=file
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120")) # Question generation and evaluation call the LLM
+
+# EMBEDDING_LOAD_MODE=preload imports the app (and loads the embedding model) once in the master.
+# Workers are forked afterwards and share the model's pages copy-on-write instead of each loading a copy.
+preload_app = config.EMBEDDING_LOAD_MODE == "preload"
+
+
+def on_starting(server):
+    # The memory session store lives inside one worker: with several, a session's requests land on
+    # workers that don't have it (or that rebuild a diverging copy from the journal).
+    if server.cfg.workers > 1 and config.SESSION_STORE_BACKEND != "file":
+        raise RuntimeError(
+            f"{server.cfg.workers} workers need SESSION_STORE_BACKEND=file "
+            f"(the '{config.SESSION_STORE_BACKEND}' session store is single-worker only)."
+        )
+    # Each worker takes 1/LLM_RATE_LIMIT_PROCESSES of the LLM quota. Workers are forked from this
+    # process, so matching the real worker count here (e.g. after -w) keeps the total at the quota.
+    if "LLM_RATE_LIMIT_PROCESSES" not in os.environ and config.LLM_RATE_LIMIT_PROCESSES != server.cfg.workers:
+        config.LLM_RATE_LIMIT_PROCESSES = server.cfg.workers
+    server.log.info(f"LLM rate limits split across {config.LLM_RATE_LIMIT_PROCESSES} process(es) for {server.cfg.workers} worker(s).")
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything allocated so far out of the GC's tracked generations, so collections in
+        # the workers don't write to (and thereby copy) the shared pages of the preloaded objects.
+        gc.freeze()
+        server.log.info("Preloaded app: gc.freeze() applied before forking workers.")
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import init_worker_process
+        init_worker_process()
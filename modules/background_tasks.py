@@ -0,0 +1,102 @@
+# modules/background_tasks.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, BoundedSemaphore
+
+# Local module imports
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when the background pool already has its maximum number of queued + running jobs."""
+
+
+class BoundedPool:
+    """
+    Thread pool that rejects work instead of queueing without limit (ThreadPoolExecutor's own
+    queue is unbounded). The executor is created on first use so that it is built inside each
+    worker process, not in a pre-fork parent.
+    """
+
+    def __init__(self, name, workers, max_pending):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(0, max_pending)
+        self._executor = None
+        self._capacity = None # Bounds running + queued jobs
+        self._lock = Lock() # Protects the executor (held by shutdown() while jobs finish)
+        self._stats_lock = Lock()
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting {self.name} pool ({self.workers} workers, max {self.max_pending} pending jobs).")
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+                self._capacity = BoundedSemaphore(self.workers + self.max_pending)
+            return self._executor
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules fn(*args, **kwargs) and returns its Future.
+        Raises PoolSaturatedError instead of queueing without limit.
+        """
+        executor = self._get_executor()
+        capacity = self._capacity
+        if not capacity.acquire(blocking=False):
+            self._count("rejected")
+            raise PoolSaturatedError(f"{self.name} pool is saturated.")
+
+        def run():
+            try:
+                result = fn(*args, **kwargs)
+                self._count("completed")
+                return result
+            except Exception:
+                self._count("failed")
+                logger.exception(f"Background task {getattr(fn, '__name__', fn)} failed.")
+                raise
+            finally:
+                capacity.release()
+
+        try:
+            future = executor.submit(run)
+        except Exception:
+            capacity.release()
+            raise
+        # A job cancelled while still queued never reaches run(), so its slot is released here instead
+        future.add_done_callback(lambda f: capacity.release() if f.cancelled() else None)
+        self._count("submitted")
+        return future
+
+    def shutdown(self, wait=True):
+        """Stops the pool, optionally waiting for running jobs to finish."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats, workers=self.workers, max_pending=self.max_pending)
+
+
+# --- Global Worker Pool ---
+# Interview setup (/start-interview). Speculative work uses its own pools so it can never make this one reject setups.
+_pool = BoundedPool("interview-bg", config.BACKGROUND_WORKERS, config.BACKGROUND_MAX_PENDING)
+stats = _pool.stats
+
+
+def submit(fn, *args, **kwargs):
+    """Schedules fn(*args, **kwargs) on the interview setup pool. Raises PoolSaturatedError when full."""
+    return _pool.submit(fn, *args, **kwargs)
+
+
+def shutdown(wait=True):
+    _pool.shutdown(wait=wait)
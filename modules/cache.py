@@ -0,0 +1,178 @@
+# modules/cache.py
+import os
+import time
+import sqlite3
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU mapping with optional per-entry TTL and hit/miss counters.
+    Keys must be hashable; values are stored as-is (no copy).
+    on_evict(key, value), if given, is called outside the lock for entries dropped by the size
+    bound or the TTL (not for delete() or replacement by put()).
+    """
+
+    def __init__(self, max_entries, ttl_seconds=0, on_evict=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries = OrderedDict() # key -> (value, stored_at)
+        self._lock = Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _notify_evicted(self, dropped):
+        if self.on_evict is None:
+            return
+        for key, value in dropped:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                logger.warning(f"Cache eviction callback failed for {key!r}: {e}")
+
+    def get(self, key, default=None):
+        dropped = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return default
+            value, stored_at = entry
+            if self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                dropped.append((key, value))
+            else:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+        self._notify_evicted(dropped)
+        return default
+
+    def put(self, key, value):
+        dropped = []
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, (evicted_value, _) = self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+                dropped.append((evicted_key, evicted_value))
+        self._notify_evicted(dropped)
+
+    def purge_expired(self):
+        """Drops entries past the TTL without waiting for a lookup. Returns the number removed."""
+        if self.ttl_seconds <= 0:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            dropped = [(key, value) for key, (value, stored_at) in self._entries.items() if stored_at < cutoff]
+            for key, _ in dropped:
+                del self._entries[key]
+            self.stats["expired"] += len(dropped)
+        self._notify_evicted(dropped)
+        return len(dropped)
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+            }
+
+
+class SqliteBlobStore:
+    """
+    Small persistent key -> bytes store backed by one SQLite file.
+    Used as the second tier behind an LRUCache so cached values survive restarts.
+    Each call opens its own connection, so the store can be shared between threads and worker processes.
+    """
+
+    def __init__(self, path, table="cache", ttl_seconds=0):
+        self.path = os.path.abspath(path)
+        self.table = "".join(c for c in table if c.isalnum() or c == "_") or "cache"
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection inside a transaction (committed on success) and always closes it."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache store {self.path} read failed: {e}")
+            return None
+        if row is None:
+            return None
+        if self.ttl_seconds > 0 and time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row[0]
+
+    def put(self, key, value):
+        try:
+            with self._connect() as conn:
+                conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)", (key, value, time.time()))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache store {self.path} write failed: {e}")
+
+    def purge_older_than(self, max_age_seconds):
+        """Deletes entries stored more than max_age_seconds ago. Returns the number removed."""
+        try:
+            with self._connect() as conn:
+                cur = conn.execute(f"DELETE FROM {self.table} WHERE stored_at < ?", (time.time() - max_age_seconds,))
+                return cur.rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Cache store {self.path} purge failed: {e}")
+            return 0
+
+    def trim(self, max_entries):
+        """Deletes the oldest entries beyond max_entries. Returns the number removed."""
+        try:
+            with self._connect() as conn:
+                cur = conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (max(0, int(max_entries)),),
+                )
+                return cur.rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Cache store {self.path} trim failed: {e}")
+            return 0
+
+    def count(self):
+        try:
+            with self._connect() as conn:
+                return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except sqlite3.Error:
+            return 0
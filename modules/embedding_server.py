@@ -0,0 +1,213 @@
+# modules/embedding_server.py
+"""
+Local embedding service with dynamic batching (run with `flask embedding-server`).
+
+All gunicorn workers send encode requests over a Unix socket to one process that holds the
+only copy of the embedding model. Requests arriving within EMBEDDING_SERVER_MAX_WAIT_MS of each
+other are encoded together as one batch, up to EMBEDDING_SERVER_MAX_BATCH texts.
+
+Wire format (both directions): 4-byte big-endian length + JSON body.
+    request:  {"texts": [str, ...]}
+    response: {"dim": int, "vectors": base64(float32 row-major)} or {"error": str}
+"""
+import os
+import json
+import time
+import queue
+import base64
+import socket
+import struct
+import logging
+import socketserver
+from threading import Thread, Event
+
+# Local module imports
+import config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class EmbeddingServerError(RuntimeError):
+    """Raised by the client when the server is unreachable or reports an error."""
+
+
+def _send_message(sock, payload):
+    body = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"Message too large ({size} bytes).")
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+# --- Server ---
+class _PendingRequest:
+    __slots__ = ("texts", "vectors", "error", "done")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.vectors = None
+        self.error = None
+        self.done = Event()
+
+
+class DynamicBatcher(Thread):
+    """Collects pending requests for up to max_wait_ms (or max_batch texts) and encodes them in one call."""
+
+    def __init__(self, model, max_batch, max_wait_ms):
+        super().__init__(name="embedding-batcher", daemon=True)
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait_seconds = max_wait_ms / 1000.0
+        self.pending = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "texts": 0, "max_batch_texts": 0, "encode_seconds_total": 0.0}
+
+    def submit(self, texts, timeout):
+        request = _PendingRequest(texts)
+        self.pending.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the batch to be encoded.")
+        if request.error:
+            raise RuntimeError(request.error)
+        return request.vectors
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()] # Block until the first request of the next batch
+            num_texts = len(batch[0].texts)
+            deadline = time.time() + self.max_wait_seconds
+            while num_texts < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                num_texts += len(request.texts)
+            self._encode_batch(batch, num_texts)
+
+    def _encode_batch(self, batch, num_texts):
+        texts = [text for request in batch for text in request.texts]
+        start = time.time()
+        try:
+            vectors = np.asarray(self.model.encode(texts, batch_size=max(32, self.max_batch)), dtype=np.float32)
+            offset = 0
+            for request in batch:
+                request.vectors = vectors[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+        except Exception as e:
+            logger.error(f"Batch encode of {num_texts} texts failed: {e}", exc_info=True)
+            for request in batch:
+                request.error = str(e)
+        finally:
+            elapsed = time.time() - start
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["texts"] += num_texts
+            self.stats["max_batch_texts"] = max(self.stats["max_batch_texts"], num_texts)
+            self.stats["encode_seconds_total"] += elapsed
+            for request in batch:
+                request.done.set()
+        logger.debug(f"Encoded batch: {len(batch)} requests, {num_texts} texts in {elapsed * 1000:.1f} ms.")
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        try:
+            while True: # Clients may reuse a connection for several requests
+                try:
+                    message = _recv_message(self.request)
+                except (ConnectionError, struct.error):
+                    return
+                if message.get("stats"):
+                    _send_message(self.request, {"stats": batcher.stats})
+                    continue
+                texts = [str(t) for t in message.get("texts", [])]
+                try:
+                    vectors = batcher.submit(texts, timeout=config.EMBEDDING_SERVER_TIMEOUT_SECONDS) if texts else np.zeros((0, 0), dtype=np.float32)
+                    dim = vectors.shape[1] if vectors.ndim == 2 else 0
+                    _send_message(self.request, {"dim": dim, "vectors": base64.b64encode(np.ascontiguousarray(vectors).tobytes()).decode("ascii")})
+                except Exception as e:
+                    _send_message(self.request, {"error": str(e)})
+        except OSError as e:
+            logger.debug(f"Embedding client connection error: {e}")
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128 # listen() backlog; bursts of interview setups connect at once
+
+    def __init__(self, socket_path, model, max_batch=None, max_wait_ms=None):
+        self.socket_path = os.path.abspath(socket_path)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path) # Stale socket from a previous run
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        super().__init__(self.socket_path, _RequestHandler)
+        os.chmod(self.socket_path, 0o660)
+        self.batcher = DynamicBatcher(
+            model,
+            max_batch or config.EMBEDDING_SERVER_MAX_BATCH,
+            config.EMBEDDING_SERVER_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms,
+        )
+        self.batcher.start()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+# --- Client ---
+class EmbeddingClient:
+    """Blocking client; opens one short-lived connection per call, so it is safe to share between threads."""
+
+    def __init__(self, socket_path, timeout_seconds):
+        self.socket_path = socket_path
+        self.timeout_seconds = timeout_seconds
+
+    def _request(self, payload):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout_seconds)
+                sock.connect(self.socket_path)
+                _send_message(sock, payload)
+                response = _recv_message(sock)
+        except (OSError, ConnectionError, ValueError) as e:
+            raise EmbeddingServerError(f"Embedding server at {self.socket_path} unavailable: {e}") from e
+        if "error" in response:
+            raise EmbeddingServerError(f"Embedding server error: {response['error']}")
+        return response
+
+    def encode(self, texts):
+        """Returns a float32 array of shape (len(texts), dim)."""
+        response = self._request({"texts": list(texts)})
+        vectors = np.frombuffer(base64.b64decode(response["vectors"]), dtype=np.float32)
+        return vectors.reshape(len(texts), response["dim"]) if texts else vectors
+
+    def stats(self):
+        return self._request({"stats": True})["stats"]
@@ -6,15 +6,25 @@ import json
 import requests
 import socket
 import os
+import sys
+import hashlib
+import queue
+import itertools
+import threading
+from dataclasses import dataclass, fields
 
 # Local module imports
 import config
 # Use absolute imports within the package if running as a module
 from . import utils
 from . import llm_interface
+from . import llm_cache # Call-site names for the LLM response cache
 from . import prompt_templates
 from . import audio_utils # For STT call
 from . import report_generator
+from . import session_journal # Per-turn checkpoints for crash recovery
+from . import background_tasks # Pool for next-turn prefetches
+from .cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -64,6 +74,72 @@ def send_text_to_player(text_to_send):
         logger.error(f"Unexpected error sending text to player: {e}", exc_info=True)
         return False
 
+class SentenceChunker:
+    """
+    Splits streamed LLM text into sentence-sized chunks for speech: a chunk is released once it
+    ends at a sentence boundary and is at least min_chars long (very short sentences such as
+    "Great." are joined with the next one).
+    """
+    _BOUNDARY_RE = re.compile(r"[.!?]+[\"')\]]*\s+")
+
+    def __init__(self, min_chars):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, fragment):
+        """Adds a fragment and returns the list of completed chunks."""
+        self.buffer += fragment
+        chunks = []
+        while True:
+            cut = None
+            for match in self._BOUNDARY_RE.finditer(self.buffer):
+                if match.end() >= self.min_chars:
+                    cut = match
+                    break
+            if cut is None:
+                return chunks
+            chunks.append(self.buffer[:cut.end()].strip())
+            self.buffer = self.buffer[cut.end():]
+
+    def flush(self):
+        """Returns whatever is left once the stream has ended."""
+        rest, self.buffer = self.buffer.strip(), ""
+        return rest
+
+
+class PlayerSentenceStream:
+    """
+    Sends chunks to the NeuroSync Player in order from a background thread, so the LLM stream is
+    never held up by the player round trip (send_text_to_player waits for a confirmation).
+    """
+
+    def __init__(self, interview_id):
+        self.interview_id = interview_id
+        self.failures = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"player-stream-{interview_id}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            if not send_text_to_player(text):
+                self.failures += 1
+
+    def send(self, text):
+        self._queue.put(text)
+
+    def close(self, timeout=30.0):
+        """Waits for queued chunks to be sent. Returns True if all of them were delivered."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"[{self.interview_id}] NeuroSync Player still busy after {timeout}s; remaining chunks are sent in the background.")
+            return False
+        return self.failures == 0
+
 # --- Helper to Parse Questions ---
 def parse_generated_questions(raw_text):
     """
@@ -165,9 +241,211 @@ def parse_generated_questions(raw_text):
     return questions
 
 
+# --- Compact Turn Records ---
+# Slotted dataclasses instead of per-turn dicts: no per-instance __dict__, and the text fields
+# hold references to the same string objects used elsewhere in the session (history entries,
+# prepared questions) instead of copies.
+@dataclass(slots=True)
+class HistoryEntry:
+    """One utterance in the conversation history."""
+    speaker: str
+    text: str
+
+    def to_dict(self):
+        return {"speaker": self.speaker, "text": self.text}
+
+
+@dataclass(slots=True)
+class QnATurn:
+    """A question/response pair with its STT, confidence and evaluation results."""
+    question_turn: int
+    question: str
+    response: str
+    is_prepared_question: bool = False
+    prepared_question_index: int | None = None
+    detection_method: str = ""
+    stt_success: bool = False # Boolean indicating if STT worked
+    stt_error_message: str | None = None # Specific error message if stt_success is False
+    # --- Confidence Results ---
+    confidence_score: float | None = None
+    confidence_rating: str = "N/A"
+    primary_emotion: str = "N/A"
+    confidence_analysis_error: bool = True # True if API call failed OR API reported error
+    confidence_message: str = "Analysis not performed"
+    # --- Evaluation Results (Filled later) ---
+    evaluation: str | None = None
+    score: int | None = None
+    score_justification: str | None = None
+
+    def to_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    @classmethod
+    def from_dict(cls, data):
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+@dataclass(slots=True)
+class PreparedTurn:
+    """Result of InterviewSession._prepare_ai_turn: either a final message, or the prompt for the LLM."""
+    message: str | None = None
+    turn: int = 0
+    prompt: str = ""
+    remaining_indices: list | None = None
+    history_chars: int = 0
+    context_cache: object = None # llm_interface.ContextCache holding the prompt prefix; prompt is then only the turn part
+
+
+def _intern_label(text):
+    """Interns short repeated labels (speaker names, detection methods) so all turns share one copy."""
+    return sys.intern(text) if isinstance(text, str) and len(text) <= 64 else text
+
+
+# --- Job Description Artifacts ---
+# Everything derived from the JD alone, computed once per distinct JD and shared by every
+# candidate interviewed against it. Only resume-side analysis runs per candidate.
+@dataclass(slots=True, frozen=True)
+class JDArtifacts:
+    jd_summary: str
+    role_title: str
+    query_role_title: str # Title as generate_search_queries reads it from the summary
+    focus_keywords: tuple # extract_keywords(jd_text, 20), input to get_focus_topics
+    query_keywords: tuple # extract_keywords(jd_summary, 8), input to generate_search_queries
+    question_types: tuple
+    role_guidance: dict
+
+
+def _select_role_guidance(role_title):
+    """Question types and prompt guidance for the role family named in the JD title."""
+    role_lower = role_title.lower()
+    if "database admin" in role_lower or "dba" in role_lower or "database administrator" in role_lower:
+        q_types_list = ["[DB Concept/Scenario]", "[SQL Query (Scenario)]", "[Troubleshooting Scenario]", "[DB Admin Task/Scenario]", "[Security Scenario]", "[Behavioral/Learning Scenario]"]
+        role_guidance = {"role": "Probe core DB concepts, backup/recovery, performance tuning.", "code": "Focus on practical SQL for administration & querying.", "solve": "Present common DBA challenges (e.g., locking, slow queries, disk space)."}
+    elif "software engineer" in role_lower or "developer" in role_lower or "programmer" in role_lower:
+        q_types_list = ["[Technical Concept/Tradeoff]", "[Coding Challenge (Scenario)]", "[System Design (Scenario)]", "[Debugging Scenario]", "[Behavioral Scenario (Teamwork)]", "[Behavioral Scenario (Learning)]"]
+        role_guidance = {"role": "Assess CS fundamentals, data structures, algorithms.", "code": "Provide small coding problems (logic, syntax).", "solve": "Debugging/design scenarios related to application development."}
+    else: # Default / Analyst / Other
+        q_types_list = ["[Technical Scenario]", "[Problem Solving Scenario]", "[Tool/Concept Question]", "[Data Interpretation (if relevant)]", "[Behavioral Question]", "[Learning Question]"]
+        role_guidance = {"role": "Focus on general tech concepts relevant to the JD.", "code": "Ask about high-level logic or specific tool usage.", "solve": "Present general technical or analytical challenges."}
+    return tuple(q_types_list), role_guidance
+
+
+_jd_artifact_cache = LRUCache(config.JD_CACHE_SIZE, ttl_seconds=config.JD_CACHE_TTL_SECONDS) if config.JD_CACHE_SIZE > 0 else None
+
+
+def get_jd_artifacts(jd_text):
+    """Returns the JDArtifacts for jd_text, from the cache (keyed by content hash) when possible."""
+    # Keywords are empty until NLTK is ready, so its state is part of the key
+    key = hashlib.sha256(jd_text.encode("utf-8")).hexdigest() + (":nltk" if utils.nltk_initialized else "")
+    if _jd_artifact_cache is not None:
+        cached = _jd_artifact_cache.get(key)
+        if cached is not None:
+            return cached
+
+    jd_summary = utils.clean_text(jd_text[:config.MAX_SUMMARY_LENGTH * 2])[:config.MAX_SUMMARY_LENGTH]
+    role_match = re.search(r"^(?:Job\s+)?Title\s*[:\-]?\s*(.*?)(\n|$)", jd_text, re.IGNORECASE | re.MULTILINE)
+    role_title = role_match.group(1).strip() if role_match else "Relevant Role (from Job Description)"
+    summary_match = re.search(r"^(?:Job\s+)?Title\s*[:\-]?\s*(.*?)(\n|$)", jd_summary, re.IGNORECASE | re.MULTILINE)
+    question_types, role_guidance = _select_role_guidance(role_title)
+    artifacts = JDArtifacts(
+        jd_summary=jd_summary,
+        role_title=role_title,
+        query_role_title=summary_match.group(1).strip() if summary_match else "Position",
+        focus_keywords=tuple(utils.extract_keywords(jd_text, max_keywords=20)),
+        query_keywords=tuple(utils.extract_keywords(jd_summary, max_keywords=8)),
+        question_types=question_types,
+        role_guidance=role_guidance,
+    )
+    if _jd_artifact_cache is not None:
+        _jd_artifact_cache.put(key, artifacts)
+    return artifacts
+
+
+def get_jd_cache_stats():
+    return _jd_artifact_cache.get_stats() if _jd_artifact_cache is not None else {"enabled": False}
+
+
+# --- Next-Turn Prefetch ---
+@dataclass(slots=True)
+class TurnPrefetch:
+    """An interviewer LLM call started while the candidate's response is still being processed."""
+    prompt: str
+    future: object # concurrent.futures.Future of the raw LLM reply
+    usage: dict
+    started_at: float
+
+
+_prefetch_stats = {"started": 0, "used": 0, "discarded": 0, "evicted": 0, "failed": 0, "not_started": 0, "saved_seconds_total": 0.0}
+_prefetch_stats_lock = threading.Lock()
+
+
+def _count_prefetch(name, amount=1):
+    with _prefetch_stats_lock:
+        _prefetch_stats[name] += amount
+
+
+def _drop_turn_prefetch(interview_id, prefetch):
+    """
+    Cancels a prefetch nobody will consume (LRU/TTL eviction, dropped session). A call still queued
+    never starts; one already running cannot be interrupted and finishes within the request timeout.
+    """
+    cancelled = prefetch.future.cancel()
+    _count_prefetch("evicted")
+    logger.debug(f"[{interview_id}] Dropped unused AI turn prefetch ({'cancelled' if cancelled else 'already running'}).")
+
+
+# Keyed by interview id rather than stored on the session, so a session reloaded from the store
+# in the same process still finds its prefetch. Prefetches never cross worker processes. They run
+# on their own small pool so speculative calls can never make /start-interview answer 503.
+if config.INTERVIEWER_PREFETCH_ENABLED:
+    _turn_prefetches = LRUCache(config.INTERVIEWER_PREFETCH_MAX_SESSIONS, ttl_seconds=config.INTERVIEWER_PREFETCH_WAIT_SECONDS * 2, on_evict=_drop_turn_prefetch)
+    _prefetch_pool = background_tasks.BoundedPool("turn-prefetch", config.INTERVIEWER_PREFETCH_WORKERS, config.INTERVIEWER_PREFETCH_MAX_PENDING)
+else:
+    _turn_prefetches = _prefetch_pool = None
+
+
+def get_turn_prefetch_stats():
+    if _turn_prefetches is None:
+        return {"enabled": False}
+    with _prefetch_stats_lock:
+        stats = dict(_prefetch_stats)
+    saved_seconds_total = stats.pop("saved_seconds_total")
+    stats["saved_seconds_avg"] = round(saved_seconds_total / stats["used"], 3) if stats["used"] else None
+    stats["pending"] = len(_turn_prefetches)
+    stats["pool"] = _prefetch_pool.get_stats()
+    return stats
+
+
+def _generate_interviewer_reply(prompt, context_cache=None, usage=None):
+    """One non-streaming interviewer LLM call (used for regular and prefetched turns)."""
+    return llm_interface.query_llm(
+        prompt, config.INTERVIEWER_LLM_MODEL_NAME,
+        config.INTERVIEWER_MAX_TOKENS, config.INTERVIEWER_TEMPERATURE,
+        cache_site=llm_cache.CONVERSATION, context_cache=context_cache, usage=usage
+    )
+
+
 # --- Interview Session Class ---
 class InterviewSession:
-    def __init__(self, interview_id, resume_text, jd_text):
+    # Attributes persisted by to_dict()/from_dict() so a session can be rebuilt in another worker process
+    PERSISTED_FIELDS = (
+        "interview_id", "resume_text_raw", "jd_text_raw", "role_title", "resume_summary", "jd_summary",
+        "project_details", "focus_topics", "prepared_questions", "conversation_history", "interview_qna",
+        "asked_questions_indices", "current_turn_number", "state", "last_ai_message", "last_question_context",
+        "evaluation_complete", "report_generated", "report_path", "error_message",
+    )
+    # Scalar fields that can change after initialization; journaled with every checkpoint
+    JOURNALED_FIELDS = (
+        "asked_questions_indices", "current_turn_number", "state", "last_ai_message", "last_question_context",
+        "evaluation_complete", "report_generated", "report_path", "error_message",
+    )
+
+    def __init__(self, interview_id, resume_text, jd_text, initialize=True):
+        """
+        Creates the session. With initialize=False the session stays INITIALIZING and the caller
+        runs _initialize_session() later (e.g. on the background pool, see app.start_interview).
+        """
         self.interview_id = interview_id
         self.resume_text_raw = resume_text
         self.jd_text_raw = jd_text
@@ -177,8 +455,8 @@ class InterviewSession:
         self.project_details = ""
         self.focus_topics = []
         self.prepared_questions = []
-        self.conversation_history = [] # List of {"speaker": name, "text": content}
-        self.interview_qna = [] # List of turn data dicts for evaluation/report
+        self.conversation_history = [] # List of HistoryEntry
+        self.interview_qna = [] # List of QnATurn records for evaluation/report
         self.asked_questions_indices = set() # Tracks indices of prepared questions *successfully asked*
         self.current_turn_number = 0 # Increments when candidate response is processed
         self.state = "INITIALIZING" # INITIALIZING, READY, IN_PROGRESS, ASKING, AWAITING_RESPONSE, EVALUATING, FINISHED, ERROR
@@ -188,8 +466,11 @@ class InterviewSession:
         self.report_generated = False
         self.report_path = None
         self.error_message = None # Store specific error message if state is ERROR
+        self._reset_journal_marks(started=False)
+        self._reset_prompt_prefix()
 
-        self._initialize_session()
+        if initialize:
+            self._initialize_session()
 
     def _set_error_state(self, message):
         """Helper to set the error state and log."""
@@ -199,14 +480,71 @@ class InterviewSession:
         # Send error message to player? Maybe not, frontend handles displaying errors.
         # send_text_to_player(f"An internal error occurred: {message}")
         self.last_ai_message = f"An error occurred: {message}" # For frontend display
+        self._checkpoint("error")
+
+    def _reset_prompt_prefix(self):
+        """Per-session interviewer prompt prefix and its provider-side context cache."""
+        self._prompt_prefix = None
+        self._context_cache = None
+        self._context_cache_checked = False
+
+    def _context_cache_state(self):
+        """JSON form of the context cache handle, persisted so rebuilt sessions reuse the same cache."""
+        if self._context_cache is not None:
+            return self._context_cache.to_dict()
+        return {"unavailable": True} if self._context_cache_checked else None
+
+    def _restore_context_cache(self, state):
+        self._reset_prompt_prefix()
+        if not state:
+            return
+        if state.get("name"):
+            try:
+                self._context_cache = llm_interface.ContextCache.from_dict(state, self._conversation_prompt_prefix())
+            except (KeyError, TypeError) as e:
+                logger.warning(f"[{self.interview_id}] Ignoring unreadable context cache reference: {e}")
+                return
+        self._context_cache_checked = True
+
+    def _reset_journal_marks(self, started):
+        """Records how much of the history/QnA lists the journal already contains."""
+        self._journal_started = started # False until the initial snapshot has been written
+        self._journaled_history_len = len(self.conversation_history)
+        self._journaled_qna_len = len(self.interview_qna)
+
+    def _checkpoint(self, event):
+        """Appends a journal record for a state transition. Journal failures never break the interview."""
+        if not session_journal.is_enabled():
+            return
+        if event != "initialized" and not self._journal_started:
+            return # Nothing to recover before question generation has succeeded
+        try:
+            if event == "initialized":
+                payload = {"snapshot": self.to_dict()}
+            else:
+                payload = {
+                    "fields": {field: getattr(self, field) for field in self.JOURNALED_FIELDS},
+                    "history": [entry.to_dict() for entry in self.conversation_history[self._journaled_history_len:]],
+                }
+                payload["fields"]["asked_questions_indices"] = sorted(self.asked_questions_indices)
+                payload["fields"]["context_cache"] = self._context_cache_state()
+                if event == "evaluation": # Evaluation rewrites existing turns
+                    payload["qna_replace"] = [turn.to_dict() for turn in self.interview_qna]
+                else:
+                    payload["qna"] = [turn.to_dict() for turn in self.interview_qna[self._journaled_qna_len:]]
+            session_journal.append(self.interview_id, event, payload)
+            self._reset_journal_marks(started=True)
+        except Exception as e:
+            logger.error(f"[{self.interview_id}] Failed to write '{event}' checkpoint to session journal: {e}", exc_info=True)
 
     def _initialize_session(self):
         """Performs initial text analysis and question generation."""
         logger.info(f"[{self.interview_id}] Initializing interview session...")
         try:
-            # 1. Summarize and Extract Details (Basic cleaning)
+            # 1. Summarize and Extract Details (Basic cleaning). JD-side analysis is shared across candidates.
+            jd_artifacts = get_jd_artifacts(self.jd_text_raw)
             self.resume_summary = utils.clean_text(self.resume_text_raw[:config.MAX_SUMMARY_LENGTH * 2])[:config.MAX_SUMMARY_LENGTH]
-            self.jd_summary = utils.clean_text(self.jd_text_raw[:config.MAX_SUMMARY_LENGTH * 2])[:config.MAX_SUMMARY_LENGTH]
+            self.jd_summary = jd_artifacts.jd_summary
             # Use the raw text for project details extraction as cleaning might remove structure
             self.project_details = utils.extract_project_details(self.resume_text_raw)
             if len(self.project_details) > config.MAX_PROJECT_SUMMARY_LENGTH:
@@ -214,11 +552,10 @@ class InterviewSession:
             logger.info(f"[{self.interview_id}] Input texts summarized. Extracted {len(self.project_details)} chars of project/experience details.")
 
             # 2. Identify Role and Focus Topics
-            role_match = re.search(r"^(?:Job\s+)?Title\s*[:\-]?\s*(.*?)(\n|$)", self.jd_text_raw, re.IGNORECASE | re.MULTILINE)
-            self.role_title = role_match.group(1).strip() if role_match else "Relevant Role (from Job Description)"
+            self.role_title = jd_artifacts.role_title
             logger.info(f"[{self.interview_id}] Identified Role Title: {self.role_title}")
             # Ensure focus topics are relevant and not too generic
-            self.focus_topics = utils.get_focus_topics(self.resume_text_raw, self.jd_text_raw, top_n=5)
+            self.focus_topics = utils.get_focus_topics(self.resume_text_raw, self.jd_text_raw, top_n=5, jd_keywords=jd_artifacts.focus_keywords)
             logger.info(f"[{self.interview_id}] Identified Focus Topics: {self.focus_topics}")
 
             # 3. Prepare RAG Context (Optional)
@@ -226,21 +563,25 @@ class InterviewSession:
             # RAG logic remains the same as before...
             if config.RETRIEVAL_TOP_K > 0:
                 # Ensure embedding model is loaded (utils.py should handle this)
-                if not utils.embedding_model:
+                embeddings_ready = utils.embeddings_available() # Loads the model on first use in lazy mode
+                rag_cache_key = utils.rag_context_cache_key(self.jd_text_raw, self.focus_topics) if embeddings_ready else None
+                cached_context = utils.get_cached_rag_context(rag_cache_key)
+                if not embeddings_ready:
                     logger.warning(f"[{self.interview_id}] RAG enabled but embedding model not loaded. Skipping retrieval.")
+                elif cached_context is not None:
+                    # Same JD + focus topics + unchanged knowledge base: skip query generation, encoding and retrieval
+                    rag_context = cached_context
+                    logger.info(f"[{self.interview_id}] RAG context served from cache (length: {len(rag_context)} chars).")
                 else:
-                    search_queries = utils.generate_search_queries(self.resume_summary, self.jd_summary) # Use summaries
+                    search_queries = utils.generate_search_queries(self.resume_summary, self.jd_summary, jd_keywords=jd_artifacts.query_keywords, role_title=jd_artifacts.query_role_title) # Use summaries
                     if search_queries:
-                        all_retrieved_docs = []
                         logger.info(f"[{self.interview_id}] Retrieving RAG context for {len(search_queries)} queries...")
-                        for query in search_queries:
-                            docs = utils.retrieve_similar_documents(query, top_k=config.RETRIEVAL_TOP_K, threshold=config.RETRIEVAL_SIMILARITY_THRESHOLD)
-                            if docs: all_retrieved_docs.extend(docs)
-
-                        if all_retrieved_docs:
-                            unique_docs_dict = {doc['content']: doc for doc in all_retrieved_docs} # Simple dedupe by content
-                            sorted_unique_docs = sorted(unique_docs_dict.values(), key=lambda x: x.get("score", 0), reverse=True)
-                            rag_context = utils.format_rag_context(sorted_unique_docs, max_length=config.MAX_CONTEXT_LENGTH)
+                        # One batched encode + one SQL round trip; results come back deduped and sorted by score
+                        retrieved_docs = utils.retrieve_similar_documents_batch(search_queries, top_k=config.RETRIEVAL_TOP_K, threshold=config.RETRIEVAL_SIMILARITY_THRESHOLD)
+
+                        if retrieved_docs:
+                            rag_context = utils.format_rag_context(retrieved_docs, max_length=config.MAX_CONTEXT_LENGTH, query_texts=search_queries + list(self.focus_topics or []))
+                            utils.cache_rag_context(rag_cache_key, rag_context)
                             logger.info(f"[{self.interview_id}] RAG context prepared (length: {len(rag_context)} chars).")
                         else:
                             logger.warning(f"[{self.interview_id}] No relevant documents found in knowledge base for RAG.")
@@ -251,17 +592,8 @@ class InterviewSession:
 
 
             # 4. Determine Role-Specific Guidance (Refined based on role title check)
-            role_lower = self.role_title.lower()
-            if "database admin" in role_lower or "dba" in role_lower or "database administrator" in role_lower:
-                q_types_list = ["[DB Concept/Scenario]", "[SQL Query (Scenario)]", "[Troubleshooting Scenario]", "[DB Admin Task/Scenario]", "[Security Scenario]", "[Behavioral/Learning Scenario]"]
-                role_guidance = {"role": "Probe core DB concepts, backup/recovery, performance tuning.", "code": "Focus on practical SQL for administration & querying.", "solve": "Present common DBA challenges (e.g., locking, slow queries, disk space)."}
-            elif "software engineer" in role_lower or "developer" in role_lower or "programmer" in role_lower:
-                q_types_list = ["[Technical Concept/Tradeoff]", "[Coding Challenge (Scenario)]", "[System Design (Scenario)]", "[Debugging Scenario]", "[Behavioral Scenario (Teamwork)]", "[Behavioral Scenario (Learning)]"]
-                role_guidance = {"role": "Assess CS fundamentals, data structures, algorithms.", "code": "Provide small coding problems (logic, syntax).", "solve": "Debugging/design scenarios related to application development."}
-            else: # Default / Analyst / Other
-                q_types_list = ["[Technical Scenario]", "[Problem Solving Scenario]", "[Tool/Concept Question]", "[Data Interpretation (if relevant)]", "[Behavioral Question]", "[Learning Question]"]
-                role_guidance = {"role": "Focus on general tech concepts relevant to the JD.", "code": "Ask about high-level logic or specific tool usage.", "solve": "Present general technical or analytical challenges."}
-            logger.info(f"[{self.interview_id}] Using role guidance for '{role_lower}': {role_guidance}")
+            q_types_list, role_guidance = jd_artifacts.question_types, jd_artifacts.role_guidance
+            logger.info(f"[{self.interview_id}] Using role guidance for '{self.role_title.lower()}': {role_guidance}")
 
 
             # 5. Prepare Prompt Arguments for Question Generation
@@ -325,7 +657,8 @@ class InterviewSession:
             raw_questions_text = llm_interface.query_llm(
                 question_gen_prompt, config.INTERVIEWER_LLM_MODEL_NAME,
                 generation_max_tokens,
-                config.INTERVIEWER_TEMPERATURE
+                config.INTERVIEWER_TEMPERATURE,
+                cache_site=llm_cache.QUESTION_GENERATION
             )
 
             if raw_questions_text is None or raw_questions_text.startswith("Error:"):
@@ -349,6 +682,8 @@ class InterviewSession:
             logger.debug(f"[{self.interview_id}] Prepared Questions: {self.prepared_questions}")
 
             self.state = "READY"
+            self._checkpoint("initialized")
+            self._ensure_context_cache() # The interviewer prompt prefix is fixed from here on
             logger.info(f"[{self.interview_id}] Interview session initialized and ready.")
 
         except Exception as e:
@@ -369,7 +704,7 @@ class InterviewSession:
              logger.warning(f"[{self.interview_id}] Failed to send greeting to NeuroSync Player. Continuing frontend flow.")
 
         self.last_ai_message = greeting_text
-        self.conversation_history.append({"speaker": config.INTERVIEWER_AI_NAME, "text": greeting_text})
+        self.conversation_history.append(HistoryEntry(config.INTERVIEWER_AI_NAME, greeting_text))
         self.state = "AWAITING_RESPONSE" # Wait for user confirmation / first response
         self.current_turn_number = 0 # Turn 0 is greeting, turn 1 starts with first real question
         # No question context set yet for the greeting
@@ -380,6 +715,7 @@ class InterviewSession:
              "detection_method": "Greeting",
              "turn": 0
          }
+        self._checkpoint("greeting")
         return greeting_text
 
     def get_next_ai_turn(self):
@@ -387,14 +723,154 @@ class InterviewSession:
         Generates the AI interviewer's next response or question.
         This should be called *after* processing the candidate's response (or initially after greeting confirmation).
         """
+        prepared = self._prepare_ai_turn()
+        if prepared.message is not None:
+            return prepared.message
+
+        # Call LLM for AI response
+        prefetched = self._take_prefetched_turn(prepared)
+        if prefetched is not None:
+            ai_response_raw, usage = prefetched
+        else:
+            logger.debug(f"[{self.interview_id}] Sending prompt to interviewer LLM (Turn {prepared.turn}). History length: {prepared.history_chars} chars.")
+            usage = {}
+            ai_response_raw = _generate_interviewer_reply(prepared.prompt, prepared.context_cache, usage)
+        self._log_turn_usage(prepared.turn, usage)
+        return self._finalize_ai_turn(prepared, ai_response_raw)
+
+    def stream_next_ai_turn(self):
+        """
+        Streaming variant of get_next_ai_turn: a generator yielding sentence-sized chunks of the AI
+        response as the LLM produces them. Each chunk is also queued to the NeuroSync Player as soon
+        as it is complete, so speech starts before the full reply exists. Prepared-question
+        matching, history and state updates run on the final text; once the generator is exhausted
+        the complete message is in self.last_ai_message.
+        """
+        prepared = self._prepare_ai_turn()
+        if prepared.message is not None:
+            yield prepared.message
+            return
+
+        start_time = time.time()
+        prefetched = self._take_prefetched_turn(prepared)
+        if prefetched is not None: # Already generated: chunk the finished reply for the player and browser
+            fragments, usage = iter([prefetched[0]]), prefetched[1]
+        else:
+            logger.debug(f"[{self.interview_id}] Streaming prompt to interviewer LLM (Turn {prepared.turn}). History length: {prepared.history_chars} chars.")
+            usage = {}
+            fragments = llm_interface.stream_llm(
+                prepared.prompt, config.INTERVIEWER_LLM_MODEL_NAME,
+                config.INTERVIEWER_MAX_TOKENS, config.INTERVIEWER_TEMPERATURE,
+                context_cache=prepared.context_cache, usage=usage
+            )
+        first = next(fragments, "")
+        if not first or first.startswith("Error:"): # Nothing was generated; handled like a failed non-streaming call
+            yield self._finalize_ai_turn(prepared, first or "Error: Empty response from LLM.")
+            return
+
+        raw_parts = []
+        chunker = SentenceChunker(config.STREAM_MIN_CHUNK_CHARS)
+        player = PlayerSentenceStream(self.interview_id)
+        first_chunk_at = None
+        try:
+            for fragment in itertools.chain([first], fragments):
+                raw_parts.append(fragment)
+                for chunk in chunker.feed(fragment):
+                    chunk = llm_interface.clean_llm_output(chunk)
+                    if not chunk:
+                        continue
+                    if first_chunk_at is None:
+                        first_chunk_at = time.time()
+                        logger.info(f"[{self.interview_id}] First streamed chunk of turn {prepared.turn} after {(first_chunk_at - start_time) * 1000:.0f} ms.")
+                    player.send(chunk)
+                    yield chunk
+            tail = llm_interface.clean_llm_output(chunker.flush())
+            if tail:
+                player.send(tail)
+                yield tail
+        finally:
+            spoken = player.close()
+        if not spoken:
+            logger.warning(f"[{self.interview_id}] Some streamed chunks of AI turn {prepared.turn} could not be sent to NeuroSync Player.")
+        self._finalize_ai_turn(prepared, "".join(raw_parts), spoken=True)
+        self._log_turn_usage(prepared.turn, usage)
+        logger.info(f"[{self.interview_id}] Streamed AI turn {prepared.turn} in {(time.time() - start_time) * 1000:.0f} ms.")
+
+    def _conversation_prompt_prefix(self):
+        """The static part of the interviewer prompt, formatted once per session (inputs are fixed after initialization)."""
+        if self._prompt_prefix is None:
+            self._prompt_prefix = prompt_templates.CONVERSATIONAL_INTERVIEW_PREFIX_TEMPLATE.format(
+                interviewer_name=config.INTERVIEWER_AI_NAME,
+                company_name=config.COMPANY_NAME,
+                role_title=self.role_title,
+                candidate_name=config.CANDIDATE_NAME,
+                resume_summary=self.resume_summary,
+                jd_summary=self.jd_summary,
+                project_details=self.project_details,
+                focus_topics_str=', '.join(self.focus_topics),
+                prepared_questions_numbered="\n".join(f"{i+1}. {q}" for i, q in enumerate(self.prepared_questions)),
+            )
+        return self._prompt_prefix
+
+    def _ensure_context_cache(self):
+        """
+        Creates the provider-side cache of the prompt prefix once per session (None if not possible).
+        The handle is persisted with the session, so it is only created again once it has expired
+        or was found deleted.
+        """
+        if self._context_cache is not None and not llm_interface.context_cache_live(self._context_cache):
+            logger.info(f"[{self.interview_id}] Context cache {self._context_cache.name} expired or unavailable; creating a new one.")
+            self._release_context_cache()
+            self._context_cache_checked = False
+        if not self._context_cache_checked:
+            self._context_cache_checked = True
+            try:
+                self._context_cache = llm_interface.create_context_cache(
+                    config.INTERVIEWER_LLM_MODEL_NAME, self._conversation_prompt_prefix(), display_name=f"interview-{self.interview_id}"
+                )
+            except KeyError as fmt_err:
+                logger.error(f"[{self.interview_id}] Missing key in conversational prompt prefix template: {fmt_err}")
+            if self._context_cache is not None:
+                self._checkpoint("context_cache") # A session recovered from the journal reuses it
+        return self._context_cache
+
+    def _release_context_cache(self):
+        if self._context_cache is not None:
+            llm_interface.delete_context_cache(self._context_cache)
+            self._context_cache = None
+
+    def release_resources(self):
+        """Frees provider-side resources of a session that is being dropped (swept, evicted or abandoned)."""
+        self._release_context_cache()
+        prefetch = _turn_prefetches.get(self.interview_id) if _turn_prefetches is not None else None
+        if prefetch is not None and _turn_prefetches.delete(self.interview_id):
+            _drop_turn_prefetch(self.interview_id, prefetch)
+
+    def _log_turn_usage(self, turn, usage):
+        """Reports input tokens served from the context cache and the call latency for one AI turn."""
+        if not usage:
+            return
+        prompt_tokens, cached_tokens = usage["prompt_tokens"], usage["cached_tokens"]
+        share = f" ({cached_tokens / prompt_tokens:.0%} of input)" if prompt_tokens else ""
+        logger.info(
+            f"[{self.interview_id}] Turn {turn} LLM call: {prompt_tokens} input tokens, {cached_tokens} from context cache{share}, "
+            f"{usage['latency_seconds']:.2f}s{'' if usage['context_cache'] else ' (full prompt)'}."
+        )
+
+    def _prepare_ai_turn(self):
+        """
+        State checks, closing remarks and prompt construction for the next AI turn.
+        Returns a PreparedTurn with .message set when the turn was resolved without the LLM
+        (closing remarks, invalid state, template error), else with the prompt to send.
+        """
         if self.state not in ["ASKING", "IN_PROGRESS"]: # Should be triggered internally or after response
             # Allow calling if state is AWAITING_RESPONSE and history suggests user confirmed ready
-             if self.state == "AWAITING_RESPONSE" and len(self.conversation_history) > 1 and self.conversation_history[-1]['speaker'] == config.CANDIDATE_NAME:
+             if self.state == "AWAITING_RESPONSE" and len(self.conversation_history) > 1 and self.conversation_history[-1].speaker == config.CANDIDATE_NAME:
                  logger.info(f"[{self.interview_id}] Proceeding to first question after user confirmation.")
                  self.state = "ASKING" # Set state to indicate AI is about to ask
              else:
                  logger.warning(f"[{self.interview_id}] Attempted to get next AI turn but state is {self.state}. Expected ASKING or IN_PROGRESS.")
-                 return self.last_ai_message or "Interview state invalid for generating next AI turn."
+                 return PreparedTurn(message=self.last_ai_message or "Interview state invalid for generating next AI turn.")
 
         turn = self.current_turn_number + 1 # The turn number AI is about to start
         logger.info(f"[{self.interview_id}] --- Starting AI Turn {turn} ---")
@@ -403,16 +879,17 @@ class InterviewSession:
         # Check if we should conclude the interview
         # If all prepared questions asked AND it's beyond the expected number of turns
         asked_count = len(self.asked_questions_indices)
-        if asked_count >= len(self.prepared_questions) and turn > len(self.prepared_questions):
+        if self._is_closing_turn(turn):
              # Make sure the candidate actually responded to the last question
-             if not self.conversation_history or self.conversation_history[-1]['speaker'] == config.CANDIDATE_NAME:
+             if not self.conversation_history or self.conversation_history[-1].speaker == config.CANDIDATE_NAME:
                   logger.info(f"[{self.interview_id}] All prepared questions asked ({asked_count}/{len(self.prepared_questions)}). Preparing closing remarks.")
                   closing_text = f"Alright, that concludes our planned questions. Thank you very much for your time and for sharing your experience, {config.CANDIDATE_NAME}. We'll evaluate the session and be in touch regarding the next steps."
                   send_text_to_player(closing_text)
                   self.last_ai_message = closing_text
-                  self.conversation_history.append({"speaker": config.INTERVIEWER_AI_NAME, "text": closing_text})
+                  self.conversation_history.append(HistoryEntry(config.INTERVIEWER_AI_NAME, closing_text))
                   self.state = "FINISHED" # Move to finished state, evaluation will follow
-                  return closing_text
+                  self._checkpoint("ai_turn")
+                  return PreparedTurn(message=closing_text)
              else:
                   # AI spoke last, possibly a follow-up after the last question. Let's allow one more cycle or end here.
                   logger.info(f"[{self.interview_id}] All prepared questions asked, AI spoke last. Ending interview.")
@@ -421,16 +898,97 @@ class InterviewSession:
                       # Re-send or just return existing message? Let's return it.
                       # send_text_to_player(self.last_ai_message) # Resend if needed
                       self.state = "FINISHED"
-                      return self.last_ai_message
+                      self._checkpoint("ai_turn")
+                      return PreparedTurn(message=self.last_ai_message)
                   else:
                       closing_text = f"Thank you again, {config.CANDIDATE_NAME}. That's all the questions I have for now. We will be in touch."
                       send_text_to_player(closing_text)
                       self.last_ai_message = closing_text
-                      self.conversation_history.append({"speaker": config.INTERVIEWER_AI_NAME, "text": closing_text})
+                      self.conversation_history.append(HistoryEntry(config.INTERVIEWER_AI_NAME, closing_text))
                       self.state = "FINISHED"
-                      return closing_text
+                      self._checkpoint("ai_turn")
+                      return PreparedTurn(message=closing_text)
 
         # --- Prepare Prompt for Conversational Turn ---
+        try:
+            return self._build_turn_prompt(turn)
+        except KeyError as fmt_err:
+            self._set_error_state(f"Missing key in conversational prompt template: {fmt_err}")
+            return PreparedTurn(message=self.last_ai_message) # Return previous message or error
+
+    def _is_closing_turn(self, turn):
+        """True when every prepared question has been asked and the turn would only close the interview."""
+        return len(self.asked_questions_indices) >= len(self.prepared_questions) and turn > len(self.prepared_questions)
+
+    def _start_turn_prefetch(self, turn):
+        """
+        Starts the LLM call for the next AI turn on the background pool, so it runs while the rest
+        of the response is processed and the client asks for the next message. Session state is
+        only read here; get_next_ai_turn/stream_next_ai_turn apply the reply as usual.
+        """
+        if _turn_prefetches is None or self._is_closing_turn(turn):
+            return
+        try:
+            prepared = self._build_turn_prompt(turn)
+        except KeyError:
+            return # Reported when the turn itself is prepared
+        usage = {}
+        _turn_prefetches.purge_expired() # Cancels prefetches whose turn was never requested
+        previous = _turn_prefetches.get(self.interview_id)
+        if previous is not None:
+            _turn_prefetches.delete(self.interview_id)
+            previous.future.cancel()
+        try:
+            future = _prefetch_pool.submit(_generate_interviewer_reply, prepared.prompt, prepared.context_cache, usage)
+        except background_tasks.PoolSaturatedError:
+            _count_prefetch("not_started")
+            logger.debug(f"[{self.interview_id}] Prefetch pool saturated; turn {turn} will be generated on request.")
+            return
+        _turn_prefetches.put(self.interview_id, TurnPrefetch(prepared.prompt, future, usage, time.time()))
+        _count_prefetch("started")
+        logger.info(f"[{self.interview_id}] Started generating AI turn {turn} in the background.")
+
+    def _take_prefetched_turn(self, prepared):
+        """
+        Returns (raw_reply, usage) from a prefetch started for exactly this prompt, waiting for it
+        if it is still running; None if there is none, the prompt has changed since, it has not
+        left the pool queue yet, or it failed. The caller then generates the turn itself.
+        """
+        if _turn_prefetches is None:
+            return None
+        prefetch = _turn_prefetches.get(self.interview_id)
+        if prefetch is None:
+            return None
+        _turn_prefetches.delete(self.interview_id)
+        if prefetch.prompt != prepared.prompt:
+            prefetch.future.cancel()
+            _count_prefetch("discarded")
+            logger.info(f"[{self.interview_id}] Discarding prefetched AI turn {prepared.turn}: the prompt changed.")
+            return None
+        if prefetch.future.cancel(): # Still queued behind other background jobs: a direct call is faster
+            _count_prefetch("not_started")
+            return None
+        wait_start = time.time()
+        try:
+            ai_response_raw = prefetch.future.result(timeout=config.INTERVIEWER_PREFETCH_WAIT_SECONDS)
+        except Exception as e:
+            _count_prefetch("failed")
+            logger.warning(f"[{self.interview_id}] Prefetched AI turn {prepared.turn} unavailable ({e or type(e).__name__}); generating it now.")
+            return None
+        waited = time.time() - wait_start
+        llm_seconds = prefetch.usage.get("latency_seconds")
+        _count_prefetch("used")
+        if llm_seconds is not None:
+            _count_prefetch("saved_seconds_total", max(0.0, llm_seconds - waited))
+        logger.info(f"[{self.interview_id}] AI turn {prepared.turn} served from prefetch started {wait_start - prefetch.started_at:.2f}s earlier (waited {waited:.2f}s).")
+        return ai_response_raw, prefetch.usage
+
+    def _build_turn_prompt(self, turn):
+        """
+        Builds the LLM prompt for an AI turn from the history and asked/remaining questions.
+        Reads session state only, so it can also run before the turn starts (see _start_turn_prefetch).
+        Raises KeyError if a template placeholder is missing.
+        """
         # Format conversation history for the prompt
         history_str = self._format_conversation_history(max_turns=6) # Limit context window
         # Identify remaining prepared questions
@@ -438,35 +996,26 @@ class InterviewSession:
         asked_str = ", ".join(str(i+1) for i in sorted(list(self.asked_questions_indices))) or "None yet"
         remaining_str = ", ".join(str(i+1) for i in remaining_indices) or "None (proceed with follow-ups or conclude)"
 
-        # Prepare prompt arguments
-        conv_prompt_args = {
-            "interviewer_name": config.INTERVIEWER_AI_NAME,
-            "company_name": config.COMPANY_NAME,
-            "role_title": self.role_title,
-            "candidate_name": config.CANDIDATE_NAME,
-            "resume_summary": self.resume_summary,
-            "jd_summary": self.jd_summary,
-            "project_details": self.project_details,
-            "focus_topics_str": ', '.join(self.focus_topics),
-            "prepared_questions_numbered": "\n".join(f"{i+1}. {q}" for i, q in enumerate(self.prepared_questions)),
-            "asked_questions_str": asked_str,
-            "remaining_questions_str": remaining_str,
-            "conversation_history": history_str,
-            "current_turn_number": turn,
-            "total_questions_planned": len(self.prepared_questions)
-        }
-        try:
-            interview_turn_prompt = prompt_templates.CONVERSATIONAL_INTERVIEW_PROMPT_TEMPLATE.format(**conv_prompt_args)
-        except KeyError as fmt_err:
-            self._set_error_state(f"Missing key in conversational prompt template: {fmt_err}")
-            return self.last_ai_message # Return previous message or error
-
-        # Call LLM for AI response
-        logger.debug(f"[{self.interview_id}] Sending prompt to interviewer LLM (Turn {turn}). History length: {len(history_str)} chars.")
-        ai_response_raw = llm_interface.query_llm(
-            interview_turn_prompt, config.INTERVIEWER_LLM_MODEL_NAME,
-            config.INTERVIEWER_MAX_TOKENS, config.INTERVIEWER_TEMPERATURE
+        # Only the turn part changes between turns; the prefix is sent once via the context cache when available
+        prompt_prefix = self._conversation_prompt_prefix()
+        turn_prompt = prompt_templates.CONVERSATIONAL_INTERVIEW_TURN_TEMPLATE.format(
+            interviewer_name=config.INTERVIEWER_AI_NAME,
+            asked_questions_str=asked_str,
+            remaining_questions_str=remaining_str,
+            conversation_history=history_str,
         )
+        context_cache = self._ensure_context_cache()
+        interview_turn_prompt = turn_prompt if context_cache else prompt_prefix + turn_prompt
+        return PreparedTurn(turn=turn, prompt=interview_turn_prompt, remaining_indices=remaining_indices, history_chars=len(history_str), context_cache=context_cache)
+
+    def _finalize_ai_turn(self, prepared, ai_response_raw, spoken=False):
+        """
+        Applies an LLM reply to the session: cleaning, prepared-question matching, history, player
+        output (skipped when spoken=True, i.e. the streaming path already sent it) and state.
+        Returns the text to display on the frontend.
+        """
+        turn = prepared.turn
+        remaining_indices = prepared.remaining_indices
         ai_response = llm_interface.clean_llm_output(ai_response_raw)
 
         if ai_response is None or ai_response.startswith("Error:"):
@@ -517,18 +1066,19 @@ class InterviewSession:
                   logger.debug(f"[{self.interview_id}] Using last sentence as follow-up question context: '{current_question_text_for_eval[:60]}...'")
 
         # Store AI response in history
-        self.conversation_history.append({"speaker": config.INTERVIEWER_AI_NAME, "text": ai_response})
+        self.conversation_history.append(HistoryEntry(config.INTERVIEWER_AI_NAME, ai_response))
         self.last_ai_message = ai_response # Store the actual AI message sent
 
         # Store context about the question that was just asked (for linking the candidate's *next* response)
         self._set_last_question_for_eval(current_question_text_for_eval, identified_prepared_index, detected_method, turn)
 
         # Send response to NeuroSync Player
-        if not send_text_to_player(ai_response):
+        if not spoken and not send_text_to_player(ai_response):
              logger.warning(f"[{self.interview_id}] Failed to send AI turn {turn} message to NeuroSync Player.")
 
         # Transition state to wait for the candidate's response
         self.state = "AWAITING_RESPONSE"
+        self._checkpoint("ai_turn")
         logger.info(f"[{self.interview_id}] AI Turn {turn} complete. State -> AWAITING_RESPONSE.")
         return ai_response # Return the text to be displayed on the frontend
 
@@ -595,8 +1145,8 @@ class InterviewSession:
         max_entries = max_turns * 2
         recent_history = self.conversation_history[-max_entries:]
         for entry in recent_history:
-            speaker = entry.get('speaker', 'Unknown')
-            text = entry.get('text', '[No text provided]')
+            speaker = entry.speaker or 'Unknown'
+            text = entry.text or '[No text provided]'
             # Truncate long responses in history to keep prompt focused
             text_snippet = (text[:200] + '...') if len(text) > 200 else text
             formatted += f"**{speaker}:** {text_snippet}\n\n"
@@ -639,7 +1189,9 @@ class InterviewSession:
             stt_success = True # Transcription successful
 
         # Add transcription to conversation history immediately
-        self.conversation_history.append({"speaker": config.CANDIDATE_NAME, "text": candidate_response_text})
+        self.conversation_history.append(HistoryEntry(config.CANDIDATE_NAME, candidate_response_text))
+        # The next AI turn only depends on the history: generate it while emotion analysis runs
+        self._start_turn_prefetch(qna_turn_number + 1)
 
         # 2. Call Emotion Analysis API (if STT was successful and yielded speech)
         confidence_results = {'score': None, 'rating': "N/A", 'primary_emotion': "N/A", 'error': True, 'message': 'Analysis not performed'}
@@ -697,7 +1249,7 @@ class InterviewSession:
         if not last_q_context or last_q_context.get('turn') != qna_turn_number:
              logger.warning(f"[{self.interview_id}] Mismatch between QnA turn ({qna_turn_number}) and last question context turn ({last_q_context.get('turn')}). Using fallback question context.")
              # Fallback: try to find the last message from the AI in history
-             ai_messages = [h['text'] for h in self.conversation_history if h['speaker'] == config.INTERVIEWER_AI_NAME]
+             ai_messages = [h.text for h in self.conversation_history if h.speaker == config.INTERVIEWER_AI_NAME]
              question_for_qna = ai_messages[-1] if ai_messages else "Unknown Question (Context Mismatch)"
              is_prepared = False
              prep_q_idx = None
@@ -708,26 +1260,22 @@ class InterviewSession:
              prep_q_idx = last_q_context['prepared_index']
              detect_method = last_q_context['detection_method']
 
-        qna_data = {
-            "question_turn": qna_turn_number,
-            "question": question_for_qna,
-            "response": candidate_response_text, # The transcribed text or error message
-            "is_prepared_question": is_prepared,
-            "prepared_question_index": prep_q_idx,
-            "detection_method": detect_method,
-            "stt_success": stt_success, # Boolean indicating if STT worked
-            "stt_error_message": stt_error, # Specific error message if stt_success is False
-            # --- Confidence Results ---
-            "confidence_score": confidence_results.get('score'),
-            "confidence_rating": confidence_results.get('rating', 'N/A'),
-            "primary_emotion": confidence_results.get('primary_emotion', 'N/A'),
-            "confidence_analysis_error": confidence_results.get('error', True), # True if API call failed OR API reported error
-            "confidence_message": confidence_results.get('message', 'Analysis not performed'),
-            # --- Evaluation Results (Filled later) ---
-            "evaluation": None,
-            "score": None,
-            "score_justification": None,
-        }
+        # `response` is the same string object as the history entry appended above (no duplicate transcript)
+        qna_data = QnATurn(
+            question_turn=qna_turn_number,
+            question=question_for_qna,
+            response=candidate_response_text, # The transcribed text or error message
+            is_prepared_question=is_prepared,
+            prepared_question_index=prep_q_idx,
+            detection_method=_intern_label(detect_method),
+            stt_success=stt_success,
+            stt_error_message=stt_error,
+            confidence_score=confidence_results.get('score'),
+            confidence_rating=_intern_label(confidence_results.get('rating', 'N/A')),
+            primary_emotion=_intern_label(confidence_results.get('primary_emotion', 'N/A')),
+            confidence_analysis_error=confidence_results.get('error', True),
+            confidence_message=confidence_results.get('message', 'Analysis not performed'),
+        )
         self.interview_qna.append(qna_data)
 
         # Increment the main turn number counter AFTER processing the response
@@ -735,6 +1283,7 @@ class InterviewSession:
 
         # Set state ready for the AI's next turn
         self.state = "ASKING" # Ready for get_next_ai_turn() to be called
+        self._checkpoint("response")
         logger.info(f"[{self.interview_id}] Finished processing candidate response for QnA turn {qna_turn_number}. State -> ASKING.")
         return {"status": "success", "message": "Response processed."}
 
@@ -749,20 +1298,21 @@ class InterviewSession:
 
         logger.info(f"[{self.interview_id}] Starting final evaluation of {len(self.interview_qna)} recorded QnA pairs...")
         self.state = "EVALUATING"
+        self._release_context_cache() # No more interviewer turns
         evaluation_errors = 0
 
         for i, item in enumerate(self.interview_qna):
-            q_text = item["question"]
-            c_response_text = item["response"]
-            turn = item["question_turn"]
+            q_text = item.question
+            c_response_text = item.response
+            turn = item.question_turn
 
             # Skip evaluation if STT failed or no meaningful response was captured
-            if not item["stt_success"] or c_response_text == "[Audio detected - No speech recognized]":
-                 skip_reason = item['stt_error_message'] or 'No speech detected'
+            if not item.stt_success or c_response_text == "[Audio detected - No speech recognized]":
+                 skip_reason = item.stt_error_message or 'No speech detected'
                  logger.warning(f"[{self.interview_id}] Skipping text evaluation for turn {turn} due to: {skip_reason}")
-                 item["evaluation"] = f"Evaluation skipped ({skip_reason})"
-                 item["score"] = None
-                 item["score_justification"] = "N/A"
+                 item.evaluation = f"Evaluation skipped ({skip_reason})"
+                 item.score = None
+                 item.score_justification = "N/A"
                  continue # Move to the next item
 
             logger.info(f"[{self.interview_id}] Evaluating response text for turn {turn} ({i+1}/{len(self.interview_qna)})...")
@@ -777,37 +1327,38 @@ class InterviewSession:
                 evaluation_prompt = prompt_templates.EVALUATION_PROMPT_TEMPLATE.format(**eval_prompt_args)
             except KeyError as fmt_err:
                  logger.error(f"[{self.interview_id}] Skipping evaluation for turn {turn}: Missing key in evaluation prompt template: {fmt_err}")
-                 item["evaluation"] = f"Evaluation Error: Prompt template key error ({fmt_err})"
-                 item["score"] = None
-                 item["score_justification"] = "N/A"
+                 item.evaluation = f"Evaluation Error: Prompt template key error ({fmt_err})"
+                 item.score = None
+                 item.score_justification = "N/A"
                  evaluation_errors += 1
                  continue
 
             evaluation_raw = llm_interface.query_llm(
                  evaluation_prompt, config.EVALUATOR_LLM_MODEL_NAME,
-                 config.EVALUATOR_MAX_TOKENS, config.EVALUATOR_TEMPERATURE
+                 config.EVALUATOR_MAX_TOKENS, config.EVALUATOR_TEMPERATURE,
+                 cache_site=llm_cache.EVALUATION
             )
             evaluation = llm_interface.clean_llm_output(evaluation_raw, is_evaluation=True)
 
             if evaluation is None or evaluation.startswith("Error:"):
                  error_detail = evaluation if evaluation else "LLM call failed."
                  logger.error(f"[{self.interview_id}] Evaluator LLM failed for turn {turn}: {error_detail}")
-                 item["evaluation"] = f"Evaluation Error: {error_detail}"
-                 item["score"] = None
-                 item["score_justification"] = "N/A"
+                 item.evaluation = f"Evaluation Error: {error_detail}"
+                 item.score = None
+                 item.score_justification = "N/A"
                  evaluation_errors += 1
             else:
-                 item["evaluation"] = evaluation
+                 item.evaluation = evaluation
                  # Parse score and justification from the evaluation text
                  # Making regex more robust to variations (e.g., "Score: 4/5", "Score (1-5): 3")
                  score_match = re.search(r"Overall Score\s*(?:\(1-5\)|out of 5)?\s*[:\-]?\s*([1-5])(?:/\s*5)?", evaluation, re.IGNORECASE)
                  just_match = re.search(r"Justification\s*[:\-]?\s*(.*)", evaluation, re.IGNORECASE | re.DOTALL)
 
                  if score_match:
-                      item["score"] = int(score_match.group(1))
-                      logger.info(f"[{self.interview_id}] Parsed score for turn {turn}: {item['score']}")
+                      item.score = int(score_match.group(1))
+                      logger.info(f"[{self.interview_id}] Parsed score for turn {turn}: {item.score}")
                  else:
-                      item["score"] = None
+                      item.score = None
                       logger.warning(f"[{self.interview_id}] Could not parse score (1-5) for turn {turn}. Evaluation text: '{evaluation[:100]}...'")
 
                  if just_match:
@@ -823,18 +1374,17 @@ class InterviewSession:
                            match = re.search(pattern, just_text, re.IGNORECASE)
                            if match:
                                 just_text = just_text[:match.start()].strip()
-                      item["score_justification"] = just_text if just_text else "N/A"
-                      logger.debug(f"[{self.interview_id}] Parsed justification for turn {turn}: {item['score_justification'][:60]}...")
+                      item.score_justification = just_text if just_text else "N/A"
+                      logger.debug(f"[{self.interview_id}] Parsed justification for turn {turn}: {item.score_justification[:60]}...")
                  else:
-                      item["score_justification"] = "N/A"
+                      item.score_justification = "N/A"
                       logger.warning(f"[{self.interview_id}] Could not parse justification for turn {turn}. Evaluation text: '{evaluation[:100]}...'")
 
-            # Optional delay to avoid hitting API rate limits
-            time.sleep(0.5) # Adjust as needed
 
         self.evaluation_complete = True
         # Keep state as EVALUATING or FINISHED? Let's keep it FINISHED as evaluation is post-interview.
         self.state = "FINISHED"
+        self._checkpoint("evaluation")
         if evaluation_errors > 0:
              logger.warning(f"[{self.interview_id}] Evaluation phase completed with {evaluation_errors} errors.")
         else:
@@ -866,7 +1416,7 @@ class InterviewSession:
 
             # Call the report generator function from the dedicated module
             report_generator.generate_pdf_report(
-                evaluated_data=self.interview_qna,
+                evaluated_data=[turn.to_dict() for turn in self.interview_qna],
                 resume_text=self.resume_text_raw, # Pass raw texts for inclusion if needed
                 jd_text=self.jd_text_raw,
                 role_title=self.role_title,
@@ -878,6 +1428,7 @@ class InterviewSession:
             )
             self.report_generated = True
             self.report_path = output_path
+            self._checkpoint("report")
             logger.info(f"[{self.interview_id}] PDF report generated successfully: {output_path}")
             return output_path
         except ImportError as imp_err:
@@ -902,4 +1453,43 @@ class InterviewSession:
 
     def get_full_conversation(self):
          """Returns the full conversation history."""
-         return self.conversation_history
\ No newline at end of file
+         return self.conversation_history
+
+    def to_dict(self):
+        """Serializes the session state into JSON-compatible primitives."""
+        data = {field: getattr(self, field) for field in self.PERSISTED_FIELDS}
+        data["asked_questions_indices"] = sorted(self.asked_questions_indices)
+        data["conversation_history"] = [entry.to_dict() for entry in self.conversation_history]
+        data["interview_qna"] = [turn.to_dict() for turn in self.interview_qna]
+        data["context_cache"] = self._context_cache_state()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuilds a session from to_dict() output without re-running initialization."""
+        session_obj = cls.__new__(cls) # Bypass __init__ (no text analysis / LLM calls)
+        for field in cls.PERSISTED_FIELDS:
+            setattr(session_obj, field, data.get(field))
+        session_obj.focus_topics = session_obj.focus_topics or []
+        session_obj.prepared_questions = session_obj.prepared_questions or []
+        # Deserialization creates a fresh string per occurrence; map repeated texts back onto one
+        # shared object so questions/transcripts are stored once, as in a live session.
+        shared_texts = {q: q for q in session_obj.prepared_questions}
+        def share(text):
+            return shared_texts.setdefault(text, text) if isinstance(text, str) else text
+        session_obj.conversation_history = [
+            HistoryEntry(_intern_label(entry.get("speaker")), share(entry.get("text")))
+            for entry in (session_obj.conversation_history or [])
+        ]
+        session_obj.interview_qna = []
+        for turn_data in (data.get("interview_qna") or []):
+            turn = QnATurn.from_dict(turn_data)
+            turn.question = share(turn.question)
+            turn.response = share(turn.response)
+            turn.detection_method = _intern_label(turn.detection_method)
+            session_obj.interview_qna.append(turn)
+        session_obj._reset_journal_marks(started=True)
+        session_obj._restore_context_cache(data.get("context_cache")) # Same server-side cache as before serialization
+        session_obj.asked_questions_indices = set(session_obj.asked_questions_indices or [])
+        session_obj.last_question_context = session_obj.last_question_context or {}
+        return session_obj
\ No newline at end of file
@@ -0,0 +1,122 @@
+# modules/llm_cache.py
+"""
+Content-addressed cache of LLM responses, consulted by llm_interface.query_llm (opt-in: LLM_CACHE_ENABLED).
+
+Entries are keyed by a SHA-256 of the model, the generation parameters and the full prompt, so
+only byte-identical requests share a response: the same JD and resume uploaded again after a
+failed session, the same question/answer pair evaluated again, a retry after a frontend timeout.
+
+Each call site passes its name and caching is decided per site: only sites listed in
+LLM_CACHE_SITES are cached, and the conversational turn is never cached while it samples
+(temperature > 0), since a replayed turn would ignore where the conversation went. Lookups go
+to a per-process LRU first, then to an optional SQLite file (LLM_CACHE_PATH) shared by all
+workers and kept across restarts. Only successful responses from the requested model are stored.
+"""
+import time
+import hashlib
+import logging
+from threading import Lock
+
+# Local module imports
+import config
+from modules.cache import LRUCache, SqliteBlobStore
+
+logger = logging.getLogger(__name__)
+
+QUESTION_GENERATION = "question_generation"
+CONVERSATION = "conversation"
+EVALUATION = "evaluation"
+UNCACHEABLE_WHEN_SAMPLED = frozenset({CONVERSATION})
+TRIM_EVERY_WRITES = 100 # Disk size limit is enforced every this many stores
+
+_memory = LRUCache(config.LLM_CACHE_SIZE, ttl_seconds=config.LLM_CACHE_TTL_SECONDS) if config.LLM_CACHE_SIZE > 0 else None
+_disk = None # SqliteBlobStore, opened on first use when LLM_CACHE_PATH is set
+_lock = Lock()
+_stats = {} # site -> counters
+_writes = 0
+
+
+def is_cacheable(site, temperature):
+    """True if responses for this call site (at this temperature) may be served from the cache."""
+    if not config.LLM_CACHE_ENABLED or not site or site not in config.LLM_CACHE_SITES:
+        return False
+    return not (temperature > 0 and site in UNCACHEABLE_WHEN_SAMPLED)
+
+
+def cache_key(model_name, prompt, max_tokens, temperature):
+    digest = hashlib.sha256()
+    for part in (model_name, str(max_tokens), repr(float(temperature)), prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _get_disk():
+    global _disk
+    if _disk is None and config.LLM_CACHE_PATH:
+        try:
+            _disk = SqliteBlobStore(config.LLM_CACHE_PATH, table="llm_responses", ttl_seconds=config.LLM_CACHE_TTL_SECONDS)
+            logger.info(f"LLM response disk cache ready: {_disk.path}")
+        except Exception as e:
+            logger.error(f"Could not open LLM response cache '{config.LLM_CACHE_PATH}': {e}. Continuing without it.")
+            config.LLM_CACHE_PATH = ""
+    return _disk
+
+
+def _count(site, counter, amount=1):
+    with _lock:
+        site_stats = _stats.setdefault(site, {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "too_large": 0, "lookup_seconds_total": 0.0})
+        site_stats[counter] += amount
+
+
+def get(key, site):
+    """Returns the cached response text, or None."""
+    start = time.perf_counter()
+    text = _memory.get(key) if _memory is not None else None
+    if text is None:
+        disk = _get_disk()
+        blob = disk.get(key) if disk is not None else None
+        if blob is not None:
+            text = bytes(blob).decode("utf-8")
+            if _memory is not None:
+                _memory.put(key, text)
+            _count(site, "disk_hits")
+    _count(site, "lookup_seconds_total", time.perf_counter() - start)
+    _count(site, "hits" if text is not None else "misses")
+    if text is not None:
+        logger.debug(f"LLM response cache hit ({site}, key {key[:12]}).")
+    return text
+
+
+def put(key, site, text):
+    global _writes
+    if len(text.encode("utf-8")) > config.LLM_CACHE_MAX_ENTRY_BYTES:
+        _count(site, "too_large")
+        return
+    if _memory is not None:
+        _memory.put(key, text)
+    disk = _get_disk()
+    if disk is not None:
+        disk.put(key, text.encode("utf-8"))
+        with _lock:
+            _writes += 1
+            trim_now = _writes % TRIM_EVERY_WRITES == 0
+        if trim_now and config.LLM_CACHE_MAX_DISK_ENTRIES > 0:
+            disk.trim(config.LLM_CACHE_MAX_DISK_ENTRIES)
+    _count(site, "stores")
+
+
+def get_stats():
+    with _lock:
+        sites = {site: dict(counters) for site, counters in _stats.items()}
+    for counters in sites.values():
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else None
+        counters["lookup_us_avg"] = round(counters.pop("lookup_seconds_total") / lookups * 1e6, 1) if lookups else None
+    disk = _disk
+    return {
+        "enabled": config.LLM_CACHE_ENABLED,
+        "sites": sites,
+        "memory": _memory.get_stats() if _memory is not None else None,
+        "disk_entries": disk.count() if disk is not None else None,
+    }
@@ -4,8 +4,17 @@ import logging
 import time
 import re
 import os # Added to potentially access API key if not passed directly
+import datetime
+from dataclasses import dataclass
+from threading import Lock
 
 import config # Import the central config
+from modules import llm_cache, llm_limiter, llm_resilience
+
+try:
+    from google.generativeai import caching as genai_caching
+except ImportError: # google-generativeai releases before context caching
+    genai_caching = None
 
 logger = logging.getLogger(__name__)
 
@@ -43,8 +52,164 @@ def initialize_llm(model_name):
             raise ConnectionError(f"Failed to initialize Gemini model {model_name}.") from e
     return LLM_CLIENTS[model_name]
 
+# --- Context Caching (static prompt prefixes stored by Gemini) ---
+@dataclass(slots=True)
+class ContextCache:
+    """A prompt prefix stored server-side; calls made with it send only the text that follows."""
+    name: str
+    model_name: str
+    prefix: str
+    prefix_tokens: int
+    expires_at: float # time.time() after which Gemini will have dropped it
+
+    def to_dict(self):
+        """Reference to the server-side cache; the prefix itself is rebuilt by the owner."""
+        return {"name": self.name, "model_name": self.model_name, "prefix_tokens": self.prefix_tokens, "expires_at": self.expires_at}
+
+    @classmethod
+    def from_dict(cls, data, prefix):
+        return cls(data["name"], data["model_name"], prefix, data.get("prefix_tokens", 0), data["expires_at"])
+
+
+# Failure reasons after which a context-cache call is resent as a full prompt (cache expired or
+# deleted, model without caching support); outages and rate limits are handled by the retry logic.
+CONTEXT_CACHE_FAILURE_REASONS = ("auth_or_model", "bad_request", "init")
+CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS = 60 # Stop using a cache shortly before its TTL runs out
+
+_context_cache_models = {} # cache name -> GenerativeModel bound to it
+_dead_context_caches = set() # Names that failed; their sessions fall back to full prompts
+_context_cache_lock = Lock()
+_context_cache_stats = {
+    "created": 0, "skipped_below_minimum": 0, "create_errors": 0, "deleted": 0, "invalidated": 0,
+    "cached_turns": 0, "uncached_turns": 0, "prompt_tokens_total": 0, "cached_tokens_total": 0,
+    "latency_seconds_cached_total": 0.0, "latency_seconds_uncached_total": 0.0,
+}
+
+
+def _count_context_cache_stat(name, amount=1):
+    with _context_cache_lock:
+        _context_cache_stats[name] += amount
+
+
+def create_context_cache(model_name, prefix, display_name=None):
+    """
+    Stores prefix with Gemini context caching for LLM_CONTEXT_CACHE_TTL_SECONDS. Returns a
+    ContextCache, or None when caching is disabled or unavailable, the prefix is below
+    LLM_CONTEXT_CACHE_MIN_TOKENS (the provider's minimum cacheable size) or creation fails;
+    callers then send the full prompt every time.
+    """
+    if not config.LLM_CONTEXT_CACHE_ENABLED:
+        return None
+    if genai_caching is None:
+        logger.warning("Context caching requested but this google-generativeai version has no caching module. Sending full prompts.")
+        return None
+    # Cheap estimate first: most prefixes are far below the minimum, so skip the count_tokens round trip
+    if len(prefix) / 4 < config.LLM_CONTEXT_CACHE_MIN_TOKENS * 0.8:
+        logger.info(f"Prompt prefix (~{len(prefix) // 4} tokens) is below the {config.LLM_CONTEXT_CACHE_MIN_TOKENS}-token context cache minimum; sending full prompts.")
+        _count_context_cache_stat("skipped_below_minimum")
+        return None
+    try:
+        prefix_tokens = initialize_llm(model_name).count_tokens(prefix).total_tokens
+        if prefix_tokens < config.LLM_CONTEXT_CACHE_MIN_TOKENS:
+            logger.info(f"Prompt prefix ({prefix_tokens} tokens) is below the {config.LLM_CONTEXT_CACHE_MIN_TOKENS}-token context cache minimum; sending full prompts.")
+            _count_context_cache_stat("skipped_below_minimum")
+            return None
+        cached_content = genai_caching.CachedContent.create(
+            model=model_name,
+            display_name=display_name,
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=config.LLM_CONTEXT_CACHE_TTL_SECONDS),
+        )
+    except Exception as e:
+        logger.warning(f"Could not create context cache for {model_name}: {e}. Sending full prompts.")
+        _count_context_cache_stat("create_errors")
+        return None
+    _count_context_cache_stat("created")
+    logger.info(f"Context cache {cached_content.name} created for {model_name} ({prefix_tokens} prefix tokens).")
+    return ContextCache(cached_content.name, model_name, prefix, prefix_tokens, time.time() + config.LLM_CONTEXT_CACHE_TTL_SECONDS)
+
+
+def delete_context_cache(context_cache):
+    """Deletes the server-side cache early (it would otherwise expire with its TTL). Never raises."""
+    if context_cache is None or genai_caching is None:
+        return
+    if time.time() >= context_cache.expires_at:
+        with _context_cache_lock:
+            _context_cache_models.pop(context_cache.name, None)
+        return # Already dropped by Gemini; nothing to delete
+    with _context_cache_lock:
+        _context_cache_models.pop(context_cache.name, None)
+    try:
+        genai_caching.CachedContent.get(context_cache.name).delete()
+        _count_context_cache_stat("deleted")
+    except Exception as e:
+        logger.debug(f"Could not delete context cache {context_cache.name}: {e}")
+
+
+def _context_cache_usable(context_cache, model_name):
+    return (
+        context_cache is not None
+        and context_cache.model_name == model_name
+        and context_cache.name not in _dead_context_caches
+        and time.time() < context_cache.expires_at - CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS
+    )
+
+
+def context_cache_live(context_cache):
+    """True while a cache can still be used: not expiring within the margin and not found dead by this process."""
+    return _context_cache_usable(context_cache, context_cache.model_name) if context_cache is not None else False
+
+
+def _forget_context_cache(context_cache):
+    with _context_cache_lock:
+        _dead_context_caches.add(context_cache.name)
+        _context_cache_models.pop(context_cache.name, None)
+        _context_cache_stats["invalidated"] += 1
+
+
+def _context_cache_model(context_cache):
+    """GenerativeModel bound to a context cache (created once per cache and process)."""
+    with _context_cache_lock:
+        model = _context_cache_models.get(context_cache.name)
+    if model is None:
+        initialize_llm(context_cache.model_name) # Configures the API key
+        try:
+            model = genai.GenerativeModel.from_cached_content(cached_content=context_cache.name)
+        except Exception as e:
+            raise ConnectionError(f"Context cache {context_cache.name} unavailable: {e}") from e
+        with _context_cache_lock:
+            _context_cache_models[context_cache.name] = model
+    return model
+
+
+def _record_usage(usage, response, latency_seconds, context_cache):
+    """Fills the caller's usage dict from Gemini's usage metadata; calls that report usage (interviewer turns) feed the stats."""
+    if usage is None:
+        return
+    metadata = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(metadata, "prompt_token_count", None) or 0
+    cached_tokens = getattr(metadata, "cached_content_token_count", None) or 0
+    usage.update({"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "latency_seconds": latency_seconds, "context_cache": context_cache is not None})
+    kind = "cached" if context_cache is not None else "uncached"
+    with _context_cache_lock:
+        _context_cache_stats[f"{kind}_turns"] += 1
+        _context_cache_stats[f"latency_seconds_{kind}_total"] += latency_seconds
+        _context_cache_stats["prompt_tokens_total"] += prompt_tokens
+        _context_cache_stats["cached_tokens_total"] += cached_tokens
+
+
+def get_context_cache_stats():
+    with _context_cache_lock:
+        stats = dict(_context_cache_stats)
+    for kind in ("cached", "uncached"):
+        total = stats.pop(f"latency_seconds_{kind}_total")
+        stats[f"latency_seconds_{kind}_avg"] = round(total / stats[f"{kind}_turns"], 3) if stats[f"{kind}_turns"] else None
+    stats["cached_token_share"] = round(stats["cached_tokens_total"] / stats["prompt_tokens_total"], 4) if stats["prompt_tokens_total"] else None
+    return stats
+
+
 # --- Query LLM Function ---
-def query_llm(prompt, model_name, max_tokens, temperature, retries=2, delay=5):
+def query_llm(prompt, model_name, max_tokens, temperature, retries=None, delay=None, cache_site=None, context_cache=None, usage=None):
     """
     Sends a prompt to the specified Google Gemini model and returns the response.
 
@@ -53,18 +218,147 @@ def query_llm(prompt, model_name, max_tokens, temperature, retries=2, delay=5):
         model_name (str): The name of the Gemini model to use (e.g., "gemini-1.5-flash-latest").
         max_tokens (int): The maximum number of tokens to generate.
         temperature (float): The sampling temperature for generation.
-        retries (int): Number of times to retry on failure.
-        delay (int): Delay in seconds between retries.
+        retries (int): Retries for retryable errors (defaults to LLM_MAX_RETRIES).
+        delay (float): Base of the exponential backoff in seconds (defaults to LLM_RETRY_BASE_DELAY_SECONDS).
+
+    If the model's circuit breaker is open, or every attempt fails with a provider fault, the
+    prompt is sent once more to the model's LLM_FALLBACK_MODELS entry (if any).
+
+    cache_site names the call site (llm_cache.QUESTION_GENERATION, CONVERSATION, EVALUATION); when
+    llm_cache.is_cacheable() allows it, identical requests are answered from the response cache.
+
+    context_cache (ContextCache from create_context_cache): when given, prompt is only the part
+    after the cached prefix. If the cache cannot be used (expired, deleted, fallback model) the
+    full prefix + prompt is sent instead. usage (dict, optional) receives prompt_tokens,
+    cached_tokens and latency_seconds of the call that answered.
 
     Returns:
         str: The generated text content from the LLM, or an error message string starting with "Error:".
     """
+    full_prompt = context_cache.prefix + prompt if context_cache else prompt
+    cache_key = None
+    if llm_cache.is_cacheable(cache_site, temperature):
+        cache_key = llm_cache.cache_key(model_name, full_prompt, max_tokens, temperature)
+        cached = llm_cache.get(cache_key, cache_site)
+        if cached is not None:
+            return cached
+
+    text = None
+    if _context_cache_usable(context_cache, model_name):
+        text, failure = _query_model(prompt, model_name, max_tokens, temperature, retries, delay, context_cache, usage)
+        if failure is not None and failure.reason in CONTEXT_CACHE_FAILURE_REASONS:
+            logger.warning(f"LLM ({model_name}) call with context cache {context_cache.name} failed ({failure.reason}); resending the full prompt.")
+            _forget_context_cache(context_cache)
+            text = None
+    if text is None:
+        text, failure = _query_model(full_prompt, model_name, max_tokens, temperature, retries, delay, usage=usage)
+    if cache_key and failure is None and text and not text.startswith("Error:"):
+        llm_cache.put(cache_key, cache_site, text)
+    fallback = llm_resilience.fallback_model(model_name)
+    if failure is None or not failure.provider_fault or fallback is None:
+        return text
+    logger.warning(f"LLM ({model_name}) unavailable ({failure.reason}); falling back to {fallback}.")
+    fallback_text, fallback_failure = _query_model(full_prompt, fallback, max_tokens, temperature, retries, delay, usage=usage)
+    llm_resilience.get_breaker(model_name).record_fallback(fallback_failure is None)
+    return fallback_text if fallback_failure is None else text
+
+
+def _query_model(prompt, model_name, max_tokens, temperature, retries, delay, context_cache=None, usage=None):
+    """
+    query_llm against a single model. Returns (text, failure); failure is None when the provider
+    answered (including safety blocks), else the llm_resilience.Failure of the last attempt.
+    """
     try:
-        model = initialize_llm(model_name) # Get or initialize the model
+        model = _context_cache_model(context_cache) if context_cache else initialize_llm(model_name) # Get or initialize the model
     except (ValueError, ConnectionError) as init_err:
         logger.error(f"LLM Initialization Error for {model_name}: {init_err}")
-        return f"Error: LLM Initialization Failed - {init_err}"
+        return f"Error: LLM Initialization Failed - {init_err}", llm_resilience.Failure(retryable=False, provider_fault=False, reason="init")
+
+    generation_config, safety_settings = _generation_settings(max_tokens, temperature)
+    breaker = llm_resilience.get_breaker(model_name)
+    retries = config.LLM_MAX_RETRIES if retries is None else retries
+    start = time.monotonic()
 
+    logger.debug(f"Sending prompt to {model_name} (approx {len(prompt)} chars). Max Tokens: {max_tokens}, Temp: {temperature}")
+
+    error_text, failure = None, None
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            logger.warning(f"LLM ({model_name}) circuit open; not sending the request.")
+            return error_text or _circuit_open_error(model_name, breaker), llm_resilience.Failure(retryable=False, provider_fault=True, reason="circuit_open")
+        try:
+            with llm_limiter.admit(model_name, prompt) as admission: # Waits for RPM/TPM/concurrency capacity
+                call_start = time.monotonic()
+                response = model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    request_options=_request_options()
+                )
+                admission["actual_tokens"] = _prompt_token_count(response)
+            breaker.record_success()
+            _record_usage(usage, response, time.monotonic() - call_start, context_cache)
+            return _response_text(response, model_name, prompt, max_tokens), None
+
+        except llm_limiter.LimiterTimeout as e:
+            breaker.cancel()
+            logger.error(f"LLM ({model_name}) call not admitted: {e}")
+            return f"Error: LLM capacity for model {model_name} exhausted. Please try again shortly.", llm_resilience.Failure(retryable=False, provider_fault=False, reason="capacity")
+        except Exception as e:
+            failure = llm_resilience.classify_error(e)
+            if failure.provider_fault:
+                breaker.record_failure()
+            else:
+                breaker.record_success() # The provider answered; the request itself was rejected
+            logger.error(f"Error querying LLM ({model_name}) on attempt {attempt + 1}/{retries + 1} ({failure.reason}): {e}", exc_info=failure.reason == "unknown")
+            error_text = _describe_llm_error(e, model_name, attempt + 1)
+            if not failure.retryable or attempt >= retries or not _wait_before_retry(model_name, failure, attempt, delay, start):
+                break
+
+    return error_text or f"Error: LLM query failed for {model_name} after retries.", failure
+
+
+def _response_text(response, model_name, prompt, max_tokens):
+    """Extracts the text of a completed response, or the "Error: ..." string for blocked/empty ones."""
+    # --- Handle potential safety blocks or empty responses ---
+    if not response.candidates:
+         # Check prompt feedback for blockage reason
+         block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown'
+         block_details = response.prompt_feedback.safety_ratings if response.prompt_feedback else 'No details'
+         logger.warning(f"LLM ({model_name}) response blocked. Reason: {block_reason}. Details: {block_details}. Prompt length: {len(prompt)} chars.")
+         # Return a specific error message for blocked content
+         # Shorten prompt in log/error message if it's too long
+         prompt_snippet = (prompt[:200] + '...') if len(prompt) > 200 else prompt
+         return f"Error: Response blocked due to safety settings (Reason: {block_reason}). Review prompt content near: '{prompt_snippet}'"
+
+    # Check the first candidate for finish reason
+    candidate = response.candidates[0]
+    finish_reason = candidate.finish_reason.name if candidate.finish_reason else 'UNKNOWN'
+
+    if finish_reason == "STOP": # Normal completion
+        logger.debug(f"LLM ({model_name}) generated response successfully. Finish reason: {finish_reason}")
+        return candidate.content.parts[0].text
+    elif finish_reason == "MAX_TOKENS":
+         logger.warning(f"LLM ({model_name}) response truncated due to max_tokens ({max_tokens}). Consider increasing limit or refining prompt.")
+         return candidate.content.parts[0].text # Return truncated text
+    elif finish_reason == "SAFETY":
+         safety_ratings = candidate.safety_ratings if candidate.safety_ratings else 'No details'
+         logger.warning(f"LLM ({model_name}) response generation stopped due to safety settings. Finish Reason: {finish_reason}. Details: {safety_ratings}")
+         return f"Error: Response generation stopped by safety settings (Reason: {finish_reason})."
+    elif finish_reason == "RECITATION":
+         logger.warning(f"LLM ({model_name}) response generation stopped due to recitation concerns. Finish Reason: {finish_reason}.")
+         return f"Error: Response generation stopped due to recitation concerns (Reason: {finish_reason})."
+    else: # OTHER, UNKNOWN, etc.
+         logger.warning(f"LLM ({model_name}) response generation finished with unexpected reason: {finish_reason}. Response text (if any): {candidate.content.parts[0].text[:100] if candidate.content.parts else 'N/A'}...")
+         # Return text if available, otherwise indicate an issue
+         if candidate.content and candidate.content.parts:
+              return candidate.content.parts[0].text
+         else:
+              return f"Error: Response generation finished unexpectedly (Reason: {finish_reason}). No content returned."
+
+
+def _generation_settings(max_tokens, temperature):
+    """Returns (generation_config, safety_settings) shared by query_llm and stream_llm."""
     # Configure generation parameters
     generation_config = genai.types.GenerationConfig(
         max_output_tokens=max_tokens,
@@ -81,73 +375,176 @@ def query_llm(prompt, model_name, max_tokens, temperature, retries=2, delay=5):
         {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
         {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
     ]
+    return generation_config, safety_settings
 
-    logger.debug(f"Sending prompt to {model_name} (approx {len(prompt)} chars). Max Tokens: {max_tokens}, Temp: {temperature}")
 
+def _prompt_token_count(response):
+    """Input tokens reported by Gemini for a response (or stream chunk), if present."""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "prompt_token_count", None) or None
+
+
+def _request_options():
+    """Per-request deadline, so a hung call cannot hold a turn (and a limiter slot) indefinitely."""
+    return {"timeout": config.LLM_REQUEST_TIMEOUT_SECONDS} if config.LLM_REQUEST_TIMEOUT_SECONDS > 0 else None
+
+
+def _wait_before_retry(model_name, failure, attempt, delay, start):
+    """
+    Waits out the backoff before the next attempt. Returns False (without waiting) if that would
+    run past LLM_RETRY_BUDGET_SECONDS since the first attempt. Rate-limit errors pause the model's
+    limiter instead, so every other caller of the model holds back for the same time.
+    """
+    wait = llm_resilience.backoff_delay(attempt, failure, delay)
+    if time.monotonic() - start + wait > config.LLM_RETRY_BUDGET_SECONDS:
+        logger.warning(f"LLM ({model_name}) not retrying: a {wait:.1f}s backoff would exceed the {config.LLM_RETRY_BUDGET_SECONDS:g}s retry budget.")
+        return False
+    if failure.rate_limited:
+        llm_limiter.get_limiter(model_name).pause(wait)
+        return True
+    logger.info(f"Retrying {model_name} in {wait:.1f} seconds...")
+    time.sleep(wait)
+    return True
+
+
+def _circuit_open_error(model_name, breaker):
+    return f"Error: LLM {model_name} is temporarily unavailable (circuit open, next probe in {breaker.retry_in():.0f}s). Please try again shortly."
+
+
+def _describe_llm_error(e, model_name, attempts):
+    """Maps the last exception of a failed query to the "Error: ..." string returned to callers."""
+    # Check for common API errors in the exception message
+    error_str = str(e)
+    if "API key not valid" in error_str:
+         return "Error: Invalid Google API Key. Please check your configuration."
+    elif "quota" in error_str.lower():
+         return f"Error: API quota exceeded for model {model_name}. Please check your Google Cloud project limits."
+    elif "resource_exhausted" in error_str.lower():
+          return f"Error: Resource exhausted for model {model_name}. The service might be temporarily overloaded. Please try again later."
+    # Generic error if specific checks fail
+    return f"Error: Failed to query LLM {model_name} after {attempts} attempts. Last error: {e}"
+
+
+# --- Streaming Query Function ---
+def stream_llm(prompt, model_name, max_tokens, temperature, retries=None, delay=None, context_cache=None, usage=None):
+    """
+    Streaming variant of query_llm: yields text fragments as Gemini generates them.
+
+    Failures before the first fragment are retried (and fall back) like query_llm; if every attempt
+    fails (or the response is blocked), a single "Error: ..." string is yielded instead. A failure
+    after text was yielded ends the stream early and the caller keeps the partial text, as with a
+    MAX_TOKENS cut. context_cache and usage work as in query_llm.
+    """
+    full_prompt = context_cache.prefix + prompt if context_cache else prompt
+    settled = False # True once a call with the context cache answered, or failed for a reason resending would not fix
+    if _context_cache_usable(context_cache, model_name):
+        error_text, failure = yield from _stream_model(prompt, model_name, max_tokens, temperature, retries, delay, context_cache, usage)
+        settled = failure is None or failure.reason not in CONTEXT_CACHE_FAILURE_REASONS
+        if not settled:
+            logger.warning(f"LLM ({model_name}) stream with context cache {context_cache.name} failed ({failure.reason}); resending the full prompt.")
+            _forget_context_cache(context_cache)
+    if not settled:
+        error_text, failure = yield from _stream_model(full_prompt, model_name, max_tokens, temperature, retries, delay, usage=usage)
+    fallback = llm_resilience.fallback_model(model_name)
+    if failure is not None and failure.provider_fault and fallback is not None:
+        logger.warning(f"LLM ({model_name}) unavailable for streaming ({failure.reason}); falling back to {fallback}.")
+        _, fallback_failure = yield from _stream_model(full_prompt, fallback, max_tokens, temperature, retries, delay, usage=usage)
+        llm_resilience.get_breaker(model_name).record_fallback(fallback_failure is None)
+        if fallback_failure is None:
+            return
+    if error_text:
+        yield error_text
+
+
+def _stream_model(prompt, model_name, max_tokens, temperature, retries, delay, context_cache=None, usage=None):
+    """
+    stream_llm against a single model. Yields text fragments and returns (error_text, failure):
+    both None once the provider answered; otherwise nothing was yielded and the caller decides
+    whether to report error_text or try a fallback.
+    """
+    try:
+        model = _context_cache_model(context_cache) if context_cache else initialize_llm(model_name)
+    except (ValueError, ConnectionError) as init_err:
+        logger.error(f"LLM Initialization Error for {model_name}: {init_err}")
+        return f"Error: LLM Initialization Failed - {init_err}", llm_resilience.Failure(retryable=False, provider_fault=False, reason="init")
+
+    generation_config, safety_settings = _generation_settings(max_tokens, temperature)
+    breaker = llm_resilience.get_breaker(model_name)
+    retries = config.LLM_MAX_RETRIES if retries is None else retries
+    start = time.monotonic()
+    logger.debug(f"Streaming prompt to {model_name} (approx {len(prompt)} chars). Max Tokens: {max_tokens}, Temp: {temperature}")
+
+    error_text, failure = None, None
     for attempt in range(retries + 1):
+        if not breaker.allow():
+            logger.warning(f"LLM ({model_name}) circuit open; not sending the streaming request.")
+            return error_text or _circuit_open_error(model_name, breaker), llm_resilience.Failure(retryable=False, provider_fault=True, reason="circuit_open")
+        yielded = False
+        answered = False # Set at the first chunk: from then on the breaker has its outcome
         try:
-            response = model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-                # stream=False # Set to True for streaming responses if needed later
-            )
-
-            # --- Handle potential safety blocks or empty responses ---
-            if not response.candidates:
-                 # Check prompt feedback for blockage reason
-                 block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'Unknown'
-                 block_details = response.prompt_feedback.safety_ratings if response.prompt_feedback else 'No details'
-                 logger.warning(f"LLM ({model_name}) response blocked. Reason: {block_reason}. Details: {block_details}. Prompt length: {len(prompt)} chars.")
-                 # Return a specific error message for blocked content
-                 # Shorten prompt in log/error message if it's too long
-                 prompt_snippet = (prompt[:200] + '...') if len(prompt) > 200 else prompt
-                 return f"Error: Response blocked due to safety settings (Reason: {block_reason}). Review prompt content near: '{prompt_snippet}'"
-
-            # Check the first candidate for finish reason
-            candidate = response.candidates[0]
-            finish_reason = candidate.finish_reason.name if candidate.finish_reason else 'UNKNOWN'
-
-            if finish_reason == "STOP": # Normal completion
-                logger.debug(f"LLM ({model_name}) generated response successfully. Finish reason: {finish_reason}")
-                return candidate.content.parts[0].text
-            elif finish_reason == "MAX_TOKENS":
-                 logger.warning(f"LLM ({model_name}) response truncated due to max_tokens ({max_tokens}). Consider increasing limit or refining prompt.")
-                 return candidate.content.parts[0].text # Return truncated text
-            elif finish_reason == "SAFETY":
-                 safety_ratings = candidate.safety_ratings if candidate.safety_ratings else 'No details'
-                 logger.warning(f"LLM ({model_name}) response generation stopped due to safety settings. Finish Reason: {finish_reason}. Details: {safety_ratings}")
-                 return f"Error: Response generation stopped by safety settings (Reason: {finish_reason})."
-            elif finish_reason == "RECITATION":
-                 logger.warning(f"LLM ({model_name}) response generation stopped due to recitation concerns. Finish Reason: {finish_reason}.")
-                 return f"Error: Response generation stopped due to recitation concerns (Reason: {finish_reason})."
-            else: # OTHER, UNKNOWN, etc.
-                 logger.warning(f"LLM ({model_name}) response generation finished with unexpected reason: {finish_reason}. Response text (if any): {candidate.content.parts[0].text[:100] if candidate.content.parts else 'N/A'}...")
-                 # Return text if available, otherwise indicate an issue
-                 if candidate.content and candidate.content.parts:
-                      return candidate.content.parts[0].text
-                 else:
-                      return f"Error: Response generation finished unexpectedly (Reason: {finish_reason}). No content returned."
-
+            with llm_limiter.admit(model_name, prompt) as admission: # Slot is held until the stream ends
+                call_start = time.monotonic()
+                last_chunk = None
+                response = model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    stream=True,
+                    request_options=_request_options()
+                )
+                for chunk in response:
+                    if not answered:
+                        answered = True
+                        breaker.record_success()
+                    last_chunk = chunk
+                    admission["actual_tokens"] = _prompt_token_count(chunk) or admission["actual_tokens"]
+                    if not chunk.candidates:
+                        block_reason = chunk.prompt_feedback.block_reason if chunk.prompt_feedback else 'Unknown'
+                        logger.warning(f"LLM ({model_name}) streamed response blocked. Reason: {block_reason}. Prompt length: {len(prompt)} chars.")
+                        if not yielded:
+                            yield f"Error: Response blocked due to safety settings (Reason: {block_reason})."
+                        return None, None
+                    candidate = chunk.candidates[0]
+                    parts = candidate.content.parts if candidate.content else []
+                    text = "".join(part.text for part in parts if getattr(part, "text", None))
+                    if text:
+                        yielded = True
+                        yield text
+                    finish_reason = candidate.finish_reason.name if candidate.finish_reason else None
+                    if finish_reason in ("SAFETY", "RECITATION"):
+                        logger.warning(f"LLM ({model_name}) streamed response stopped. Finish Reason: {finish_reason}.")
+                        if not yielded:
+                            yield f"Error: Response generation stopped (Reason: {finish_reason})."
+                        return None, None
+                    if finish_reason == "MAX_TOKENS":
+                        logger.warning(f"LLM ({model_name}) streamed response truncated due to max_tokens ({max_tokens}).")
+            if not answered:
+                breaker.record_success() # Empty stream: the provider still answered
+            _record_usage(usage, last_chunk, time.monotonic() - call_start, context_cache) # Usage metadata arrives with the last chunk
+            return None, None
+        except llm_limiter.LimiterTimeout as e:
+            breaker.cancel()
+            logger.error(f"LLM ({model_name}) stream not admitted: {e}")
+            return f"Error: LLM capacity for model {model_name} exhausted. Please try again shortly.", llm_resilience.Failure(retryable=False, provider_fault=False, reason="capacity")
+        except GeneratorExit:
+            if not answered:
+                breaker.cancel() # Consumer went away before the provider answered: no outcome to record
+            raise
         except Exception as e:
-            logger.error(f"Error querying LLM ({model_name}) on attempt {attempt + 1}/{retries + 1}: {e}", exc_info=True)
-            if attempt < retries:
-                logger.info(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
+            if yielded:
+                logger.error(f"LLM ({model_name}) stream interrupted after partial output: {e}")
+                return None, None
+            failure = llm_resilience.classify_error(e)
+            if failure.provider_fault:
+                breaker.record_failure()
             else:
-                # Check for common API errors in the exception message
-                error_str = str(e)
-                if "API key not valid" in error_str:
-                     return "Error: Invalid Google API Key. Please check your configuration."
-                elif "quota" in error_str.lower():
-                     return f"Error: API quota exceeded for model {model_name}. Please check your Google Cloud project limits."
-                elif "resource_exhausted" in error_str.lower():
-                      return f"Error: Resource exhausted for model {model_name}. The service might be temporarily overloaded. Please try again later."
-                # Generic error if specific checks fail
-                return f"Error: Failed to query LLM {model_name} after {retries + 1} attempts. Last error: {e}"
-
-    # Should not be reachable if loop completes, but added for safety
-    return f"Error: LLM query failed for {model_name} after retries."
+                breaker.record_success()
+            logger.error(f"Error streaming from LLM ({model_name}) on attempt {attempt + 1}/{retries + 1} ({failure.reason}): {e}", exc_info=failure.reason == "unknown")
+            error_text = _describe_llm_error(e, model_name, attempt + 1)
+            if not failure.retryable or attempt >= retries or not _wait_before_retry(model_name, failure, attempt, delay, start):
+                break
+
+    return error_text or f"Error: LLM stream failed for {model_name} after retries.", failure
 
 
 # --- Clean LLM Output Function ---
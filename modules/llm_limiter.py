@@ -0,0 +1,211 @@
+# modules/llm_limiter.py
+"""
+Client-side admission control for Gemini calls, shared by every thread of a worker process.
+
+Each model gets a requests-per-minute and a tokens-per-minute token bucket; calls in flight are
+capped per model and across all models (LLM_MAX_CONCURRENT). A caller that would exceed a limit
+waits on a condition variable until the bucket has refilled enough (or the deadline passes)
+instead of sleeping blindly, so the process runs at the configured ceiling without provoking 429s. When Gemini does answer 429, pause() holds back
+every caller for that model, not just the one that got the error.
+
+Limits are per process; config divides the project quota by LLM_RATE_LIMIT_PROCESSES.
+"""
+import time
+import logging
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+# Local module imports
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class LimiterTimeout(RuntimeError):
+    """Raised when a call could not be admitted within the queue timeout."""
+
+
+# One condition for all models: the global in-flight cap couples them, and LLM call rates are far
+# too low for a shared lock to be contended.
+_condition = Condition(Lock())
+_global = {"in_flight": 0, "max_in_flight": 0}
+
+
+class TokenBucket:
+    """Holds up to `per_minute` units, refilled continuously. Not thread-safe; guarded by _condition."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0 # Units per second
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount, now):
+        """0 if `amount` units are available now, else the time until they will be."""
+        self._refill(now)
+        amount = min(amount, self.capacity) # Oversized requests wait for a full bucket instead of forever
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ModelLimiter:
+    """RPM/TPM buckets and an in-flight cap for one model."""
+
+    def __init__(self, model_name, rpm, tpm, max_concurrent):
+        self.model_name = model_name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self.stats = {
+            "admitted": 0, "waited": 0, "timeouts": 0, "pauses": 0,
+            "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "tokens_reserved": 0, "tokens_used": 0,
+        }
+
+    def _has_free_slot(self):
+        if self.max_concurrent > 0 and self.in_flight >= self.max_concurrent:
+            return False
+        return config.LLM_MAX_CONCURRENT <= 0 or _global["in_flight"] < config.LLM_MAX_CONCURRENT
+
+    def _seconds_until_admissible(self, estimated_tokens, now):
+        waits = [self.paused_until - now]
+        if self.requests:
+            waits.append(self.requests.seconds_until(1, now))
+        if self.tokens:
+            waits.append(self.tokens.seconds_until(estimated_tokens, now))
+        return max(waits)
+
+    def acquire(self, estimated_tokens, timeout):
+        """Blocks until the call may start. Returns the seconds waited; raises LimiterTimeout."""
+        start = time.monotonic()
+        deadline = start + timeout
+        with _condition:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._has_free_slot():
+                        wait = self._seconds_until_admissible(estimated_tokens, now)
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None # Woken by a release()
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise LimiterTimeout(f"No capacity for {self.model_name} within {timeout:g}s ({self.in_flight} in flight, {self.waiting - 1} queued).")
+                    _condition.wait(remaining if wait is None else min(wait, remaining))
+                if self.requests:
+                    self.requests.take(1)
+                if self.tokens:
+                    self.tokens.take(estimated_tokens)
+                self.in_flight += 1
+                _global["in_flight"] += 1
+                _global["max_in_flight"] = max(_global["max_in_flight"], _global["in_flight"])
+            finally:
+                self.waiting -= 1
+            waited = time.monotonic() - start
+            self.stats["admitted"] += 1
+            self.stats["tokens_reserved"] += estimated_tokens
+            if waited > 0.001:
+                self.stats["waited"] += 1
+                self.stats["wait_seconds_total"] += waited
+                self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+            return waited
+
+    def release(self, estimated_tokens, actual_tokens=None):
+        """Ends a call. actual_tokens (from usage metadata) corrects the TPM reservation."""
+        with _condition:
+            self.in_flight -= 1
+            _global["in_flight"] -= 1
+            if actual_tokens is not None:
+                self.stats["tokens_used"] += actual_tokens
+                if self.tokens:
+                    if actual_tokens < estimated_tokens:
+                        self.tokens.give_back(estimated_tokens - actual_tokens)
+                    else:
+                        self.tokens.take(actual_tokens - estimated_tokens)
+            _condition.notify_all()
+
+    def pause(self, seconds):
+        """Holds back all new calls for this model (after a 429 from the provider)."""
+        with _condition:
+            until = time.monotonic() + seconds
+            if until > self.paused_until:
+                self.paused_until = until
+                self.stats["pauses"] += 1
+                logger.warning(f"LLM limiter: pausing {self.model_name} for {seconds:.1f}s after a rate-limit response.")
+            _condition.notify_all()
+
+    def snapshot(self):
+        with _condition:
+            stats = dict(self.stats)
+            stats.update({
+                "in_flight": self.in_flight,
+                "queued": self.waiting,
+                "max_concurrent": self.max_concurrent,
+                "rpm_limit": self.requests.capacity if self.requests else 0,
+                "tpm_limit": self.tokens.capacity if self.tokens else 0,
+                "paused_for_seconds": max(0.0, round(self.paused_until - time.monotonic(), 2)),
+                "wait_seconds_avg": round(stats["wait_seconds_total"] / stats["admitted"], 4) if stats["admitted"] else 0.0,
+            })
+            return stats
+
+
+# --- Registry (one limiter per model and process) ---
+_limiters = {}
+_registry_lock = Lock()
+
+
+def get_limiter(model_name):
+    with _registry_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            rpm, tpm = config.LLM_RATE_LIMITS.get(model_name, (config.LLM_DEFAULT_RPM, config.LLM_DEFAULT_TPM))
+            processes = max(1, config.LLM_RATE_LIMIT_PROCESSES)
+            limiter = ModelLimiter(model_name, rpm / processes, tpm / processes, config.LLM_MAX_CONCURRENT_PER_MODEL)
+            _limiters[model_name] = limiter
+        return limiter
+
+
+def estimate_prompt_tokens(prompt):
+    return max(1, len(prompt) // 4) # ~4 characters per token; corrected from usage metadata after the call
+
+
+@contextmanager
+def admit(model_name, prompt):
+    """
+    Context manager around one LLM call. Yields a dict; set ["actual_tokens"] from the response's
+    usage metadata to correct the TPM reservation. Raises LimiterTimeout if not admitted in time.
+    """
+    limiter = get_limiter(model_name)
+    estimated = estimate_prompt_tokens(prompt)
+    waited = limiter.acquire(estimated, config.LLM_QUEUE_TIMEOUT_SECONDS)
+    if waited > 1.0:
+        logger.info(f"LLM limiter: {model_name} call waited {waited:.2f}s for capacity.")
+    usage = {"actual_tokens": None, "waited_seconds": waited}
+    try:
+        yield usage
+    finally:
+        limiter.release(estimated, usage["actual_tokens"])
+
+
+def get_stats():
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    with _condition:
+        overall = {"in_flight": _global["in_flight"], "max_in_flight": _global["max_in_flight"], "max_concurrent": config.LLM_MAX_CONCURRENT}
+    return {"global": overall, "models": {limiter.model_name: limiter.snapshot() for limiter in limiters}}
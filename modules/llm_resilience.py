@@ -0,0 +1,269 @@
+# modules/llm_resilience.py
+"""
+Failure handling for Gemini calls: error classification, retry backoff and per-model circuit breakers.
+
+classify_error() separates retryable failures (429, 5xx, timeouts, dropped connections) from
+terminal ones (invalid key, unknown model, bad request, safety blocks) that would fail the same
+way on every retry. Retries back off exponentially with jitter, never sooner than a retry delay
+sent by the server, and stop once LLM_RETRY_BUDGET_SECONDS would be exceeded.
+
+Each model has a circuit breaker: after LLM_BREAKER_FAILURE_THRESHOLD consecutive provider
+failures it opens and calls fail (or go to the model's LLM_FALLBACK_MODELS entry) without
+touching the network; after LLM_BREAKER_RESET_SECONDS one probe call is let through, and its
+outcome closes or re-opens the breaker. State is per process, like the limiter.
+"""
+import re
+import time
+import random
+import logging
+from dataclasses import dataclass
+from threading import Lock
+
+# Local module imports
+import config
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_RETRY_IN_RE = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY_RE = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+# Status codes in message text only count as a whole token at the start of the message (api_core's
+# "429 Resource has been exhausted") or right after "status"/"code"/"HTTP"; a bare "500" elsewhere may
+# be a token count, a model name or a request id.
+_STATUS_IN_TEXT_RE = re.compile(r"(?:^|\b(?:status(?:\s+code)?|code|http(?:/[\d.]+)?)\s*[:=]?\s*)([1-5]\d\d)\b", re.IGNORECASE)
+# gRPC status names (grpc.StatusCode or the name in an error message) mapped to the HTTP status api_core uses
+_GRPC_STATUS_CODES = {
+    "RESOURCE_EXHAUSTED": 429, "UNAVAILABLE": 503, "INTERNAL": 500, "DEADLINE_EXCEEDED": 504, "ABORTED": 409,
+    "UNAUTHENTICATED": 401, "PERMISSION_DENIED": 403, "NOT_FOUND": 404, "INVALID_ARGUMENT": 400, "FAILED_PRECONDITION": 400,
+}
+_RATE_LIMIT_MARKERS = ("resource exhausted", "quota", "too many requests")
+_RETRYABLE_MARKERS = ("overloaded", "internal error", "deadline", "timed out", "timeout", "connection reset", "connection aborted")
+_AUTH_MARKERS = ("api key not valid", "api_key_invalid", "permission denied")
+_CONTENT_MARKERS = ("blocked", "safety", "invalid argument")
+# Raised by google.generativeai itself when a prompt or candidate is blocked
+_CONTENT_EXCEPTION_NAMES = ("BlockedPromptException", "StopCandidateException", "IncompleteIterationError")
+
+
+@dataclass(slots=True)
+class Failure:
+    """How a failed call should be handled."""
+    retryable: bool
+    provider_fault: bool # Counts against the model's circuit breaker (vs. caused by this prompt)
+    rate_limited: bool = False
+    retry_after: float = None # Seconds the server asked us to wait, if it said
+    reason: str = ""
+
+
+def _server_retry_after(e):
+    """Retry delay from a RetryInfo error detail, a Retry-After header or the error message."""
+    for detail in getattr(e, "details", None) or ():
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if headers:
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+    message = str(e)
+    match = _RETRY_IN_RE.search(message) or _RETRY_DELAY_RE.search(message)
+    return float(match.group(1)) if match else None
+
+
+def _status_code(e):
+    """HTTP status of a failed call from the exception's code attributes or, failing that, its message."""
+    code = getattr(e, "code", None)
+    if callable(code): # grpc.RpcError.code() returns a grpc.StatusCode
+        try:
+            code = code()
+        except Exception:
+            code = None
+    if code is None:
+        code = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(code, int) and 100 <= code <= 599:
+        return code
+    name = getattr(code, "name", None)
+    if name in _GRPC_STATUS_CODES:
+        return _GRPC_STATUS_CODES[name]
+
+    message = str(e)
+    match = _STATUS_IN_TEXT_RE.search(message)
+    if match:
+        return int(match.group(1))
+    for name, status in _GRPC_STATUS_CODES.items():
+        if re.search(rf"\b{name}\b", message):
+            return status
+    return None
+
+
+def _classify_status(status, retry_after):
+    if status == 429:
+        return Failure(retryable=True, provider_fault=True, rate_limited=True, retry_after=retry_after, reason="rate_limited")
+    if status >= 500 or status in (408, 409):
+        return Failure(retryable=True, provider_fault=True, retry_after=retry_after, reason="unavailable")
+    if status in (401, 403, 404):
+        return Failure(retryable=False, provider_fault=True, reason="auth_or_model")
+    return Failure(retryable=False, provider_fault=False, reason="bad_request") # Other 4xx: this request is at fault
+
+
+def classify_error(e):
+    """Returns a Failure for an exception raised by generate_content (or while iterating a stream)."""
+    retry_after = _server_retry_after(e)
+    if type(e).__name__ in _CONTENT_EXCEPTION_NAMES:
+        return Failure(retryable=False, provider_fault=False, reason="content")
+
+    if google_exceptions is not None and isinstance(e, google_exceptions.GoogleAPICallError):
+        if isinstance(e, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)):
+            return Failure(retryable=True, provider_fault=True, rate_limited=True, retry_after=retry_after, reason="rate_limited")
+        if isinstance(e, (google_exceptions.ServerError, google_exceptions.DeadlineExceeded, google_exceptions.Aborted)):
+            return Failure(retryable=True, provider_fault=True, retry_after=retry_after, reason="unavailable")
+        if isinstance(e, (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied, google_exceptions.NotFound)):
+            return Failure(retryable=False, provider_fault=True, reason="auth_or_model")
+        return Failure(retryable=False, provider_fault=False, reason="bad_request")
+
+    status = _status_code(e)
+    if status is not None and status >= 400:
+        return _classify_status(status, retry_after)
+
+    # No status anywhere: fall back to wording that doesn't involve numbers
+    message = str(e).lower()
+    if any(marker in message for marker in _RATE_LIMIT_MARKERS):
+        return Failure(retryable=True, provider_fault=True, rate_limited=True, retry_after=retry_after, reason="rate_limited")
+    if any(marker in message for marker in _AUTH_MARKERS):
+        return Failure(retryable=False, provider_fault=True, reason="auth_or_model")
+    if any(marker in message for marker in _CONTENT_MARKERS):
+        return Failure(retryable=False, provider_fault=False, reason="content")
+    if isinstance(e, (TimeoutError, ConnectionError)) or any(marker in message for marker in _RETRYABLE_MARKERS):
+        return Failure(retryable=True, provider_fault=True, retry_after=retry_after, reason="unavailable")
+    # Unknown errors keep the old behaviour (retried), bounded by the retry budget and the breaker
+    return Failure(retryable=True, provider_fault=True, retry_after=retry_after, reason="unknown")
+
+
+def backoff_delay(attempt, failure, base_delay=None):
+    """
+    Seconds to wait before retry number attempt+1: exponential in attempt, capped at
+    LLM_RETRY_MAX_DELAY_SECONDS, with "equal jitter" (half fixed, half random) so callers that
+    failed together don't retry together. Never shorter than the server's retry delay.
+    """
+    base_delay = config.LLM_RETRY_BASE_DELAY_SECONDS if base_delay is None else base_delay
+    ceiling = min(config.LLM_RETRY_MAX_DELAY_SECONDS, base_delay * (2 ** attempt))
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    if failure.retry_after:
+        delay = max(delay, failure.retry_after + random.uniform(0, base_delay))
+    return delay
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive provider failures -> half-open (one probe) after a cooldown."""
+
+    def __init__(self, model_name, failure_threshold, reset_seconds):
+        self.model_name = model_name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._lock = Lock()
+        self.stats = {"successes": 0, "failures": 0, "opened": 0, "short_circuited": 0, "fallbacks": 0, "fallback_failures": 0}
+
+    def allow(self):
+        """True if a call may go to the model now. A half-open breaker admits a single probe."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+                logger.info(f"LLM breaker for {self.model_name} half-open; sending a probe call.")
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        """The provider answered (a content block counts: the model is up)."""
+        with self._lock:
+            self.stats["successes"] += 1
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+            if self.state != CLOSED:
+                logger.info(f"LLM breaker for {self.model_name} closed.")
+            self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and 0 < self.failure_threshold <= self.consecutive_failures):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.stats["opened"] += 1
+                logger.error(f"LLM breaker for {self.model_name} opened after {self.consecutive_failures} consecutive failures; failing fast for {self.reset_seconds:g}s.")
+
+    def cancel(self):
+        """The allowed call never reached the provider (e.g. limiter timeout); frees the probe slot."""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_fallback(self, succeeded):
+        with self._lock:
+            self.stats["fallbacks"] += 1
+            if not succeeded:
+                self.stats["fallback_failures"] += 1
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through (0 if not open)."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def snapshot(self):
+        retry_in = self.retry_in()
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_in_seconds": round(retry_in, 2),
+                "fallback_model": config.LLM_FALLBACK_MODELS.get(self.model_name),
+            })
+            return stats
+
+
+# --- Registry (one breaker per model and process) ---
+_breakers = {}
+_registry_lock = Lock()
+
+
+def get_breaker(model_name):
+    with _registry_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = CircuitBreaker(model_name, config.LLM_BREAKER_FAILURE_THRESHOLD, config.LLM_BREAKER_RESET_SECONDS)
+            _breakers[model_name] = breaker
+        return breaker
+
+
+def fallback_model(model_name):
+    fallback = config.LLM_FALLBACK_MODELS.get(model_name)
+    return fallback if fallback and fallback != model_name else None
+
+
+def get_stats():
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.model_name: breaker.snapshot() for breaker in breakers}
@@ -63,7 +63,10 @@ Based *only* on the information provided above, generate **exactly {num_question
 # This prompt guides the AI interviewer on how to behave during the conversation,
 # including when to ask prepared questions vs. follow-ups, and how to format
 # the output for Text-to-Speech (TTS) clarity.
-CONVERSATIONAL_INTERVIEW_PROMPT_TEMPLATE = """
+# The interviewer prompt is split so the part that is fixed for a whole interview (background,
+# prepared questions, instructions) can be sent once and cached by the provider; only the turn
+# template (interview state + history) changes between turns. Prefix + turn is the full prompt.
+CONVERSATIONAL_INTERVIEW_PREFIX_TEMPLATE = """
 **SYSTEM PROMPT**
 
 You are **{interviewer_name}**, an AI Interviewer from **{company_name}**, conducting a technical and project-focused interview for the **{role_title}** role with **{candidate_name}**.
@@ -79,19 +82,9 @@ Your goal is to have a natural, professional, and encouraging conversation. You
 *   Full List of Prepared Questions (Includes a project question):
 {prepared_questions_numbered}
 
-**Interview State:**
-
-*   Prepared Questions Asked So Far (Indices): {asked_questions_str}
-*   Prepared Questions Remaining (Indices): {remaining_questions_str}
-
----
-**CONVERSATION HISTORY (Most Recent Turns First)**
-{conversation_history}
----
+**How To Take Each Turn:**
 
-**YOUR TURN, {interviewer_name}:**
-
-Your task is to analyze the candidate's last response and decide whether to ask a **targeted follow-up question** or proceed to the next **prepared question**.
+On each turn you will receive the current Interview State and the CONVERSATION HISTORY. Your task is to analyze the candidate's last response and decide whether to ask a **targeted follow-up question** or proceed to the next **prepared question**.
 
 1.  **Review Last Response:** Carefully consider the candidate's most recent answer in the CONVERSATION HISTORY. Assess its clarity, depth, and completeness relative to the question asked.
 
@@ -128,6 +121,22 @@ Your task is to analyze the candidate's last response and decide whether to ask
 **Output ONLY your response as {interviewer_name}. Do NOT include meta-commentary, your reasoning, bracketed notes, or any text other than what you would say clearly to the candidate for TTS conversion.**
 """
 
+CONVERSATIONAL_INTERVIEW_TURN_TEMPLATE = """
+**Interview State:**
+
+*   Prepared Questions Asked So Far (Indices): {asked_questions_str}
+*   Prepared Questions Remaining (Indices): {remaining_questions_str}
+
+---
+**CONVERSATION HISTORY (Most Recent Turns First)**
+{conversation_history}
+---
+
+**YOUR TURN, {interviewer_name}:** Respond to the candidate following the instructions above. Output ONLY what you would say to the candidate.
+"""
+
+CONVERSATIONAL_INTERVIEW_PROMPT_TEMPLATE = CONVERSATIONAL_INTERVIEW_PREFIX_TEMPLATE + CONVERSATIONAL_INTERVIEW_TURN_TEMPLATE
+
 # --- Prompt for Evaluation ---
 # This prompt guides the LLM to evaluate a single question-answer pair
 # based on provided criteria and context.
@@ -0,0 +1,177 @@
+# modules/rag_admin.py
+"""Maintenance helpers for the RAG knowledge base (pgvector ANN indexes, vector storage, query plans). Used by the `flask rag-*` commands."""
+import json
+import math
+import time
+import logging
+
+# Local module imports
+import config
+from modules import utils
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "knowledge_documents"
+INDEX_NAMES = {"hnsw": "knowledge_documents_embedding_hnsw_idx", "ivfflat": "knowledge_documents_embedding_ivfflat_idx"}
+STORAGES = ("vector", "halfvec", "binary")
+# Indexed expression and operator class per storage; the expressions match utils.coarse_distance_sql
+STORAGE_OPCLASSES = {"vector": "vector_cosine_ops", "halfvec": "halfvec_cosine_ops", "binary": "bit_hamming_ops"}
+
+
+def index_name(method, storage="vector"):
+    if storage == "vector":
+        return INDEX_NAMES[method]
+    return f"knowledge_documents_embedding_{storage}_{method}_idx"
+
+
+def index_expression(storage):
+    dim = int(config.EMBEDDING_DIMENSIONS)
+    if storage == "halfvec":
+        return f"(embedding::halfvec({dim}))"
+    if storage == "binary":
+        return f"(binary_quantize(embedding)::bit({dim}))"
+    return "embedding"
+
+
+def probe_query(storage="vector"):
+    """Same shape as the per-query branch of utils.retrieve_similar_documents_batch. Params: (embedding, *utils.top_k_search_params)."""
+    return f"""
+    SELECT d.id, d.distance
+    FROM (SELECT %s::vector AS embedding) AS q
+    CROSS JOIN LATERAL ({utils.top_k_search_sql(storage, "q.embedding")}
+    ) AS d
+    ORDER BY d.distance
+"""
+
+
+def open_admin_connection():
+    """
+    Dedicated autocommit connection (outside the request pool and without its statement_timeout),
+    since CREATE INDEX CONCURRENTLY cannot run inside a transaction and may take minutes.
+    """
+    if not utils.RAG_DEPENDENCIES_AVAILABLE:
+        raise RuntimeError("psycopg2 is not installed.")
+    conn = utils.psycopg2.connect(
+        dbname=config.RAG_DB_NAME,
+        user=config.RAG_DB_USER,
+        password=config.RAG_DB_PASSWORD,
+        host=config.RAG_DB_HOST,
+        port=config.RAG_DB_PORT,
+        connect_timeout=10,
+    )
+    conn.autocommit = True
+    return conn
+
+
+def count_documents(cur):
+    cur.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
+    return cur.fetchone()[0]
+
+
+def list_vector_indexes(cur):
+    """Returns [(index_name, index_definition)] for ANN indexes on the embedding column."""
+    cur.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND (indexdef ILIKE '%%USING hnsw%%' OR indexdef ILIKE '%%USING ivfflat%%')",
+        (TABLE_NAME,),
+    )
+    return cur.fetchall()
+
+
+def index_sizes(cur):
+    """Returns ({index_name: bytes} for the ANN indexes, shared_buffers in bytes)."""
+    cur.execute(
+        "SELECT indexname, pg_relation_size(format('%%I', indexname)::regclass) FROM pg_indexes "
+        "WHERE tablename = %s AND (indexdef ILIKE '%%USING hnsw%%' OR indexdef ILIKE '%%USING ivfflat%%')",
+        (TABLE_NAME,),
+    )
+    sizes = dict(cur.fetchall())
+    cur.execute("SELECT setting::bigint * pg_size_bytes(unit) FROM pg_settings WHERE name = 'shared_buffers'")
+    return sizes, cur.fetchone()[0]
+
+
+def default_ivfflat_lists(row_count):
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond."""
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+def create_ann_index(cur, method, lists=None, m=16, ef_construction=64, replace=False, storage="vector"):
+    """
+    Builds an HNSW or IVFFlat index on knowledge_documents.embedding (CONCURRENTLY, so retrieval
+    keeps working during the build). storage 'halfvec'/'binary' indexes the float16 cast or the
+    binary quantization of the column instead of the full vectors; the table itself is unchanged,
+    so the exact re-rank still reads the full-precision embedding. Returns the build time in seconds.
+    """
+    if method not in INDEX_NAMES:
+        raise ValueError(f"Unknown index method '{method}'. Use one of: {', '.join(INDEX_NAMES)}")
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown vector storage '{storage}'. Use one of: {', '.join(STORAGES)}")
+    name = index_name(method, storage)
+    if replace:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    if method == "hnsw":
+        with_clause = f"(m = {int(m)}, ef_construction = {int(ef_construction)})"
+    else:
+        lists = int(lists) if lists else default_ivfflat_lists(count_documents(cur))
+        with_clause = f"(lists = {lists})"
+    sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {TABLE_NAME} USING {method} ({index_expression(storage)} {STORAGE_OPCLASSES[storage]}) WITH {with_clause}"
+    logger.info(f"Building ANN index: {sql}")
+    start = time.time()
+    cur.execute(sql)
+    cur.execute(f"ANALYZE {TABLE_NAME}")
+    return time.time() - start
+
+
+def sample_query_embeddings(cur, text=None, count=1):
+    """
+    Embeddings for EXPLAIN runs: the encoded text if given (and the model is loaded), else
+    `count` randomly chosen stored document embeddings.
+    """
+    if text and utils.embeddings_available():
+        return [utils.encode_texts([text])[0].tolist()]
+    cur.execute(f"SELECT embedding::text FROM {TABLE_NAME} ORDER BY random() LIMIT %s", (max(1, count),))
+    rows = cur.fetchall()
+    if not rows:
+        raise RuntimeError(f"Table {TABLE_NAME} is empty; nothing to explain.")
+    return [json.loads(row[0]) for row in rows]
+
+
+def explain_probe(cur, embedding, top_k, ef_search=0, probes=0, exact=False, storage="vector", candidates=None):
+    """
+    Runs EXPLAIN ANALYZE for one top-k probe inside a transaction with the given search knobs.
+    exact=True disables index scans to get the sequential-scan baseline. storage/candidates select
+    the coarse search + re-rank variant (candidates defaults to RAG_RERANK_CANDIDATES).
+    Returns {"execution_ms", "planning_ms", "uses_index", "ids"}.
+    """
+    vector_literal = "[" + ",".join(str(float(x)) for x in embedding) + "]"
+    if storage == "vector":
+        limits = (top_k,)
+    else:
+        candidates = max(candidates or config.RAG_RERANK_CANDIDATES, top_k)
+        limits = (candidates, top_k)
+        ef_search = max(ef_search or 0, candidates) # Same rule as utils.apply_ann_search_settings
+    query = probe_query(storage)
+    cur.execute("BEGIN")
+    try:
+        if exact:
+            cur.execute("SET LOCAL enable_indexscan = off")
+        if ef_search > 0:
+            cur.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+        if probes > 0:
+            cur.execute("SET LOCAL ivfflat.probes = %s", (probes,))
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, (vector_literal, *limits))
+        plan = cur.fetchone()[0]
+        plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+        cur.execute(query, (vector_literal, *limits))
+        ids = [row[0] for row in cur.fetchall()]
+    finally:
+        cur.execute("ROLLBACK")
+
+    plan_text = json.dumps(plan["Plan"])
+    return {
+        "execution_ms": plan.get("Execution Time"),
+        "planning_ms": plan.get("Planning Time"),
+        "uses_index": '"Index Scan"' in plan_text,
+        "ids": ids,
+    }
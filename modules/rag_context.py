@@ -0,0 +1,140 @@
+# modules/rag_context.py
+"""
+Packs retrieved knowledge-base documents into the question-generation prompt under a token budget.
+
+Documents are visited by similarity score. Each one is trimmed to its sentences that share the
+most terms with the search queries / focus topics (kept in their original order), dropped if it
+is a near-duplicate of a document already packed, and added if it still fits the budget. A
+document that does not fit is cut down to fewer sentences before it is skipped, so the budget
+is filled by score rather than abandoned at the first large document.
+"""
+import re
+import math
+import logging
+
+# Local module imports
+import config
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_HEADER = "--- Relevant Context from Knowledge Base ---"
+NO_CONTEXT = "No relevant context found in the knowledge base."
+SHINGLE_SIZE = 3 # Word n-grams compared for near-duplicate detection
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])|\n+")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+_STOPWORDS = frozenset("""
+    a an and are as at be been but by can could did do does for from had has have how if in into is it its may more
+    most must not of on or our should so such than that the their then there these they this those to was we were
+    what when where which while who will with would you your about also any each other over under using use used
+""".split())
+
+
+def estimate_tokens(text):
+    """Approximate LLM token count (Gemini averages ~4 characters per token on English text)."""
+    return int(math.ceil(len(text) / config.RAG_CONTEXT_CHARS_PER_TOKEN)) if text else 0
+
+
+def _terms(text):
+    return {w for w in _WORD_RE.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS}
+
+
+def _shingles(text):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text or "") if s and s.strip()]
+
+
+def _rank_sentences(sentences, query_terms):
+    """Sentence indexes, most relevant first: query-term overlap (length-normalized), ties broken by position."""
+    def relevance(i):
+        terms = _terms(sentences[i])
+        if not terms:
+            return 0.0
+        return len(terms & query_terms) / math.sqrt(len(terms))
+    return sorted(range(len(sentences)), key=lambda i: (-relevance(i), i))
+
+
+def _join_selected(sentences, selected):
+    """Joins the selected sentences in document order, marking skipped text with an ellipsis."""
+    parts, previous = [], -1
+    for i in sorted(selected):
+        if parts and i != previous + 1:
+            parts.append("...")
+        parts.append(sentences[i])
+        previous = i
+    return " ".join(parts)
+
+
+def _format_entry(doc, body):
+    return f"**Source ID {doc.get('id', 'N/A')} (Similarity: {doc.get('score', 0):.2f}):**\n{body}\n\n"
+
+
+def pack_context(documents, query_texts=None, token_budget=None, max_length=None):
+    """
+    Returns the formatted context string for the prompt.
+    query_texts: search queries and focus topics the sentences are ranked against (without them,
+    documents keep their leading sentences). token_budget defaults to RAG_CONTEXT_TOKEN_BUDGET;
+    max_length (characters) is an additional hard cap.
+    """
+    if not documents:
+        return NO_CONTEXT
+    token_budget = token_budget if token_budget is not None else config.RAG_CONTEXT_TOKEN_BUDGET
+    max_sentences = max(1, config.RAG_CONTEXT_MAX_SENTENCES_PER_DOC)
+    query_terms = set().union(*(_terms(q) for q in query_texts)) if query_texts else set()
+
+    header = CONTEXT_HEADER + "\n\n"
+    used_tokens = estimate_tokens(header)
+    used_chars = len(header)
+    entries, packed_shingles, seen_sentences = [], [], set()
+    dropped_duplicates = trimmed = skipped = 0
+
+    for doc in sorted(documents, key=lambda d: d.get("score", 0), reverse=True):
+        content = doc.get("content", "")
+        shingles = _shingles(content)
+        if any(_jaccard(shingles, other) >= config.RAG_CONTEXT_DEDUP_THRESHOLD for other in packed_shingles):
+            dropped_duplicates += 1
+            continue
+        # Sentences already packed from another document (overlapping chunks) are not repeated
+        sentences = [s for s in split_sentences(content) if " ".join(s.lower().split()) not in seen_sentences]
+        if not sentences:
+            dropped_duplicates += 1
+            continue
+        ranked = _rank_sentences(sentences, query_terms) if query_terms else list(range(len(sentences)))
+
+        # Most relevant sentences first; shrink until the entry fits what is left of the budget
+        entry = None
+        for count in range(min(max_sentences, len(sentences)), 0, -1):
+            candidate = _format_entry(doc, _join_selected(sentences, ranked[:count]))
+            if used_tokens + estimate_tokens(candidate) <= token_budget and (max_length is None or used_chars + len(candidate) <= max_length):
+                entry, kept = candidate, ranked[:count]
+                break
+        if entry is None:
+            skipped += 1
+            continue
+        if len(kept) < len(sentences):
+            trimmed += 1
+        entries.append(entry)
+        packed_shingles.append(shingles)
+        seen_sentences.update(" ".join(sentences[i].lower().split()) for i in kept)
+        used_tokens += estimate_tokens(entry)
+        used_chars += len(entry)
+
+    if not entries:
+        return NO_CONTEXT
+    logger.info(
+        f"RAG context packed: {len(entries)}/{len(documents)} documents, ~{used_tokens}/{token_budget} tokens "
+        f"({trimmed} trimmed, {dropped_duplicates} near-duplicates dropped, {skipped} did not fit)."
+    )
+    return (header + "".join(entries)).strip()
@@ -0,0 +1,232 @@
+# modules/rag_ingest.py
+"""
+Bulk ingestion into knowledge_documents (run with `flask rag-ingest`).
+
+Each source file is chunked, encoded in large batches with the same EMBEDDING_MODEL_NAME (and
+EMBEDDING_BACKEND) used for retrieval, and bulk-loaded with COPY. A source is replaced in one
+transaction together with its row in knowledge_ingest_log, so an interrupted run resumes by
+skipping every source whose content hash and model are already logged. Files are spread over
+a pool of worker processes, each holding one model copy.
+"""
+import os
+import io
+import csv
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+
+# Local module imports
+import config
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf", ".jsonl")
+LOG_TABLE = "knowledge_ingest_log"
+
+SCHEMA_SQL = f"""
+    ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS source TEXT;
+    CREATE INDEX IF NOT EXISTS knowledge_documents_source_idx ON knowledge_documents (source);
+    CREATE TABLE IF NOT EXISTS {LOG_TABLE} (
+        source TEXT PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        chunks INTEGER NOT NULL,
+        ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+
+def model_signature():
+    """Identifies the vectors' origin; a different signature means every source must be re-embedded."""
+    return f"{config.EMBEDDING_MODEL_NAME}|{config.EMBEDDING_BACKEND}"
+
+
+# --- Chunking ---
+def chunk_text(text, max_chars=None, overlap_chars=None):
+    """
+    Splits text into chunks of at most max_chars, breaking at paragraph, then sentence boundaries.
+    Consecutive chunks share up to overlap_chars of trailing context.
+    """
+    import re
+    max_chars = max_chars or config.RAG_INGEST_CHUNK_CHARS
+    overlap_chars = config.RAG_INGEST_CHUNK_OVERLAP_CHARS if overlap_chars is None else overlap_chars
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > max_chars: # Hard split of oversized sentences
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            tail = current[-overlap_chars:] if overlap_chars else ""
+            tail = tail[tail.find(" ") + 1:] if " " in tail else tail # Start the overlap on a word boundary
+            current = f"{tail} {piece}".strip() if tail and len(tail) + 1 + len(piece) <= max_chars else piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# --- Sources ---
+def discover_sources(path):
+    """Returns the files under path (or path itself) that can be ingested, sorted for stable ordering."""
+    path = os.path.abspath(path)
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def read_source(path):
+    """Returns a list of (source_key, text). JSONL files hold one document per line: {"source": ..., "text": ...}."""
+    if path.lower().endswith(".pdf"):
+        from modules import utils
+        return [(path, utils.extract_text_from_pdf(path) or "")]
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        if not path.lower().endswith(".jsonl"):
+            return [(path, f.read())]
+        documents = []
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            documents.append((f"{path}#{record.get('source') or line_no}", record.get("text", "")))
+        return documents
+
+
+# --- Worker Process ---
+_worker_model = None
+
+
+def _init_worker(torch_threads):
+    """Pool initializer: loads the embedding model once per worker process."""
+    global _worker_model
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL, logging.INFO))
+    try:
+        import torch
+        torch.set_num_threads(max(1, torch_threads)) # Workers split the cores instead of oversubscribing them
+    except ImportError:
+        pass
+    from modules import utils
+    _worker_model = utils.create_embedding_model()
+
+
+def _connect():
+    import psycopg2
+    return psycopg2.connect(
+        dbname=config.RAG_DB_NAME, user=config.RAG_DB_USER, password=config.RAG_DB_PASSWORD,
+        host=config.RAG_DB_HOST, port=config.RAG_DB_PORT, connect_timeout=10,
+    )
+
+
+def ingest_file(path, force=False):
+    """
+    Ingests one file (all documents in it). Returns {"path", "documents", "chunks", "skipped", "seconds"}.
+    Runs inside a pool worker; each document is replaced atomically with its log entry.
+    """
+    import numpy as np
+
+    start = time.time()
+    result = {"path": path, "documents": 0, "chunks": 0, "skipped": 0, "seconds": 0.0}
+    signature = model_signature()
+    conn = _connect()
+    try:
+        for source, text in read_source(path):
+            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT content_hash, model FROM {LOG_TABLE} WHERE source = %s", (source,))
+                row = cur.fetchone()
+            conn.rollback()
+            if not force and row is not None and row[0] == content_hash and row[1] == signature:
+                result["skipped"] += 1
+                continue
+
+            chunks = chunk_text(text)
+            vectors = np.asarray(_worker_model.encode(chunks, batch_size=config.RAG_INGEST_BATCH_SIZE), dtype=np.float32) if chunks else []
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for chunk, vector in zip(chunks, vectors):
+                writer.writerow([source, chunk, "[" + ",".join(f"{x:.7g}" for x in vector) + "]"])
+            buffer.seek(0)
+
+            with conn: # One transaction: old chunks out, new chunks in, log updated
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM knowledge_documents WHERE source = %s", (source,))
+                    if chunks:
+                        cur.copy_expert("COPY knowledge_documents (source, content, embedding) FROM STDIN WITH (FORMAT csv)", buffer)
+                    cur.execute(
+                        f"INSERT INTO {LOG_TABLE} (source, content_hash, model, chunks, ingested_at) VALUES (%s, %s, %s, %s, now()) "
+                        "ON CONFLICT (source) DO UPDATE SET content_hash = EXCLUDED.content_hash, model = EXCLUDED.model, "
+                        "chunks = EXCLUDED.chunks, ingested_at = EXCLUDED.ingested_at",
+                        (source, content_hash, signature, len(chunks)),
+                    )
+            result["documents"] += 1
+            result["chunks"] += len(chunks)
+    finally:
+        conn.close()
+    result["seconds"] = time.time() - start
+    return result
+
+
+# --- Orchestration ---
+def ensure_schema():
+    conn = _connect()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(SCHEMA_SQL)
+    finally:
+        conn.close()
+
+
+def run_ingest(path, workers=None, force=False, progress=None):
+    """
+    Ingests every supported file under path with a pool of worker processes.
+    progress(result, totals) is called after each file. Returns the totals dict.
+    """
+    files = discover_sources(path)
+    workers = max(1, min(workers or config.RAG_INGEST_WORKERS, len(files) or 1))
+    totals = {"files": len(files), "files_done": 0, "documents": 0, "chunks": 0, "skipped": 0, "failed": 0, "seconds": 0.0, "workers": workers}
+    if not files:
+        return totals
+    ensure_schema()
+
+    start = time.time()
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    # 'spawn' so workers don't inherit the Flask app, open sockets or a half-initialized torch thread pool
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=workers, initializer=_init_worker, initargs=(torch_threads,)) as pool:
+        pending = [(file_path, pool.apply_async(ingest_file, (file_path, force))) for file_path in files]
+        for file_path, async_result in pending:
+            try:
+                result = async_result.get()
+                totals["documents"] += result["documents"]
+                totals["chunks"] += result["chunks"]
+                totals["skipped"] += result["skipped"]
+            except Exception as e:
+                logger.error(f"Ingest of {file_path} failed: {e}")
+                result = {"path": file_path, "error": str(e)}
+                totals["failed"] += 1
+            totals["files_done"] += 1
+            totals["seconds"] = time.time() - start
+            if progress:
+                progress(result, totals)
+    totals["seconds"] = time.time() - start
+    return totals
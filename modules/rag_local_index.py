@@ -0,0 +1,228 @@
+# modules/rag_local_index.py
+"""
+Local, in-process retrieval backend (RAG_BACKEND=local).
+
+`flask rag-snapshot` copies knowledge_documents into a snapshot directory:
+    <RAG_LOCAL_INDEX_DIR>/<version>/embeddings.npy   float32 matrix, rows L2-normalized
+    <RAG_LOCAL_INDEX_DIR>/<version>/documents.json   {"ids": [...], "contents": [...]} aligned with the rows
+    <RAG_LOCAL_INDEX_DIR>/CURRENT                     name of the active version (swapped atomically)
+Workers memory-map embeddings.npy read-only, so all gunicorn workers share the same page-cache
+copy of the matrix. Top-k is one matrix product per batch of queries; no database round trip.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+from threading import Lock
+
+# Local module imports
+import config
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+    logging.getLogger(__name__).warning("NumPy not found. The local RAG backend is unavailable. Install with: pip install numpy")
+
+logger = logging.getLogger(__name__)
+
+CURRENT_POINTER = "CURRENT"
+FETCH_BATCH_SIZE = 2000
+KEEP_OLD_VERSIONS = 2 # Older snapshot directories are removed; a couple are kept for workers still mapping them
+
+
+class LocalVectorIndex:
+    """Read-only view of one snapshot version. Reloads itself when CURRENT points at a newer version."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.version = None
+        self.matrix = None # np.memmap, shape (N, D)
+        self.ids = []
+        self.contents = []
+        self._last_check = 0.0
+        self._lock = Lock()
+
+    @property
+    def size(self):
+        return 0 if self.matrix is None else self.matrix.shape[0]
+
+    def _read_current_version(self):
+        try:
+            with open(os.path.join(self.directory, CURRENT_POINTER), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def ensure_loaded(self):
+        """Loads the current snapshot if it changed (checked at most every RAG_LOCAL_RELOAD_CHECK_SECONDS). Returns True if usable."""
+        now = time.time()
+        if self.matrix is not None and now - self._last_check < config.RAG_LOCAL_RELOAD_CHECK_SECONDS:
+            return True
+        with self._lock:
+            self._last_check = now
+            version = self._read_current_version()
+            if version is None:
+                return self.matrix is not None
+            if version == self.version:
+                return True
+            version_dir = os.path.join(self.directory, version)
+            try:
+                matrix = np.load(os.path.join(version_dir, "embeddings.npy"), mmap_mode="r")
+                with open(os.path.join(version_dir, "documents.json"), "r", encoding="utf-8") as f:
+                    documents = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load local RAG snapshot '{version}': {e}")
+                return self.matrix is not None
+            if len(documents["ids"]) != matrix.shape[0]:
+                logger.error(f"Local RAG snapshot '{version}' is inconsistent ({matrix.shape[0]} vectors, {len(documents['ids'])} documents). Ignoring it.")
+                return self.matrix is not None
+            self.matrix, self.ids, self.contents, self.version = matrix, documents["ids"], documents["contents"], version
+            logger.info(f"Local RAG index loaded: version {version}, {matrix.shape[0]} documents, dim {matrix.shape[1] if matrix.ndim == 2 else 0}.")
+            return True
+
+    def search(self, query_vectors, top_k, threshold):
+        """
+        Top-k cosine search for every query vector in one matrix product.
+        Returns documents shaped like utils.retrieve_similar_documents_batch: deduped by content
+        (best score kept) and sorted by score, highest first.
+        """
+        matrix, ids, contents = self.matrix, self.ids, self.contents # Consistent view if a reload happens meanwhile
+        if matrix is None or matrix.shape[0] == 0:
+            return []
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        scores = queries @ matrix.T # (num_queries, N) cosine similarities
+        k = min(top_k, scores.shape[1])
+        top_idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        best = {}
+        for row, candidates in enumerate(top_idx):
+            for i in candidates:
+                score = float(scores[row, i])
+                if score < threshold:
+                    continue
+                content = contents[i]
+                if content not in best or score > best[content]["score"]:
+                    best[content] = {"id": ids[i], "content": content, "score": score}
+        return sorted(best.values(), key=lambda d: d["score"], reverse=True)
+
+
+# --- Snapshot Building (run from `flask rag-snapshot`, not from request workers) ---
+def _parse_vector(text):
+    return np.fromstring(text.strip("[]"), dtype=np.float32, sep=",")
+
+
+def _fetch_rows(conn, min_id_exclusive=None):
+    """Yields (id, content, vector) from knowledge_documents in id order using a server-side cursor."""
+    with conn.cursor(name="rag_snapshot") as cur:
+        cur.itersize = FETCH_BATCH_SIZE
+        if min_id_exclusive is None:
+            cur.execute("SELECT id, content, embedding::text FROM knowledge_documents ORDER BY id")
+        else:
+            cur.execute("SELECT id, content, embedding::text FROM knowledge_documents WHERE id > %s ORDER BY id", (min_id_exclusive,))
+        for doc_id, content, embedding_text in cur:
+            yield doc_id, content, _parse_vector(embedding_text)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def build_snapshot(conn, directory, full=False):
+    """
+    Writes a new snapshot version from Postgres and atomically points CURRENT at it.
+    Incremental by default: rows with an id above the current snapshot's highest id are appended
+    to a copy of it. Falls back to a full rebuild when there is no snapshot yet or the row count
+    shows that documents were deleted. (In-place edits to existing rows need --full.)
+    Returns a dict with counts and timings.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("NumPy is required for the local RAG backend.")
+    start = time.time()
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    current = LocalVectorIndex(directory)
+    current.ensure_loaded()
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM knowledge_documents")
+        db_count = cur.fetchone()[0]
+
+    mode = "full"
+    if not full and current.size:
+        last_id = max(current.ids)
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM knowledge_documents WHERE id <= %s", (last_id,))
+            unchanged_count = cur.fetchone()[0]
+        if unchanged_count == current.size:
+            mode = "incremental"
+
+    if mode == "incremental":
+        new_rows = list(_fetch_rows(conn, min_id_exclusive=max(current.ids)))
+        if not new_rows:
+            return {"mode": mode, "version": current.version, "documents": current.size, "added": 0, "seconds": time.time() - start}
+        ids = list(current.ids) + [r[0] for r in new_rows]
+        contents = list(current.contents) + [r[1] for r in new_rows]
+        matrix = np.vstack([np.asarray(current.matrix), _normalize_rows(np.stack([r[2] for r in new_rows]))])
+        added = len(new_rows)
+    else:
+        rows = list(_fetch_rows(conn))
+        ids = [r[0] for r in rows]
+        contents = [r[1] for r in rows]
+        matrix = _normalize_rows(np.stack([r[2] for r in rows])) if rows else np.zeros((0, 0), dtype=np.float32)
+        added = len(rows)
+
+    version = time.strftime("%Y%m%dT%H%M%S") + f"{time.time() % 1:.3f}"[1:] + f"-{len(ids)}" # Sortable, unique per run
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix=".building-")
+    try:
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), matrix.astype(np.float32, copy=False))
+        with open(os.path.join(tmp_dir, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "contents": contents}, f, ensure_ascii=False)
+        os.replace(tmp_dir, os.path.join(directory, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(directory, CURRENT_POINTER + ".tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_POINTER))
+    _remove_old_versions(directory, keep=version)
+    logger.info(f"Local RAG snapshot {version} written ({mode}, {len(ids)} documents, {added} added, db rows {db_count}).")
+    return {"mode": mode, "version": version, "documents": len(ids), "added": added, "seconds": time.time() - start}
+
+
+def _remove_old_versions(directory, keep):
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if name != keep and not name.startswith(".") and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-KEEP_OLD_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# --- Global Index (per worker process, loaded lazily) ---
+LOCAL_INDEX = None
+_local_index_lock = Lock()
+
+
+def get_local_index():
+    """Returns the worker's LocalVectorIndex if a snapshot is available, else None."""
+    global LOCAL_INDEX
+    if not NUMPY_AVAILABLE:
+        return None
+    if LOCAL_INDEX is None:
+        with _local_index_lock:
+            if LOCAL_INDEX is None:
+                LOCAL_INDEX = LocalVectorIndex(config.RAG_LOCAL_INDEX_DIR)
+    return LOCAL_INDEX if LOCAL_INDEX.ensure_loaded() else None
@@ -0,0 +1,144 @@
+# modules/session_journal.py
+import os
+import json
+import time
+import logging
+
+# Local module imports
+import config
+
+logger = logging.getLogger(__name__)
+
+# --- Global Journal (Initialized at app startup) ---
+JOURNAL = None
+
+
+class SessionJournal:
+    """
+    Append-only, per-interview checkpoint log (one JSON record per line).
+
+    The first record ("initialized") holds a full session snapshot, including the generated
+    questions; every later record holds only what a state transition changed (new history
+    entries, new QnA turns, updated scalar fields). Replaying the file rebuilds the session
+    without re-running text analysis, RAG retrieval or question generation.
+    """
+
+    def __init__(self, directory, fsync=True):
+        self.directory = os.path.abspath(directory)
+        self.fsync = fsync
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path_for(self, interview_id):
+        safe_id = "".join(c for c in str(interview_id) if c.isalnum() or c == "-")
+        if not safe_id:
+            raise ValueError(f"Invalid interview id for session journal: {interview_id!r}")
+        return os.path.join(self.directory, f"{safe_id}.jsonl")
+
+    def append(self, interview_id, event, payload):
+        """Appends one checkpoint record. A single write() of one line, so concurrent appends don't interleave."""
+        record = {"event": event, "ts": time.time(), **payload}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self._path_for(interview_id), "a", encoding="utf-8") as f:
+            f.write(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def replay(self, interview_id):
+        """
+        Rebuilds the session state dict (InterviewSession.to_dict() layout) from the journal.
+        Returns None if there is no journal or it has no initial snapshot.
+        """
+        path = self._path_for(interview_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"[{interview_id}] Failed to read session journal {path}: {e}")
+            return None
+
+        state = None
+        applied = 0
+        for line_no, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Typically a torn final line from a crash mid-write; everything before it is intact
+                logger.warning(f"[{interview_id}] Skipping unreadable journal record at line {line_no}.")
+                continue
+            if record.get("event") == "initialized":
+                state = dict(record["snapshot"])
+                applied = 1
+            elif state is not None:
+                state.update(record.get("fields", {}))
+                state["conversation_history"] = state.get("conversation_history", []) + record.get("history", [])
+                if "qna_replace" in record:
+                    state["interview_qna"] = record["qna_replace"]
+                else:
+                    state["interview_qna"] = state.get("interview_qna", []) + record.get("qna", [])
+                applied += 1
+
+        if state is None:
+            logger.warning(f"[{interview_id}] Session journal has no initial snapshot. Cannot recover.")
+            return None
+        logger.info(f"[{interview_id}] Replayed {applied} journal record(s). Recovered state: {state.get('state')}")
+        return state
+
+    def delete(self, interview_id):
+        try:
+            os.remove(self._path_for(interview_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def purge_older_than(self, max_age_seconds):
+        """Deletes journals not appended to for max_age_seconds. Returns the number removed."""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"Purged {removed} expired session journal(s).")
+        return removed
+
+
+# --- Module-Level Helpers ---
+def initialize_journal():
+    """Creates the global journal if SESSION_JOURNAL_ENABLED. Safe to call more than once."""
+    global JOURNAL
+    if not config.SESSION_JOURNAL_ENABLED:
+        logger.info("Session checkpoint journal is disabled (SESSION_JOURNAL_ENABLED=False).")
+        return None
+    if JOURNAL is None:
+        JOURNAL = SessionJournal(config.SESSION_JOURNAL_DIR, fsync=config.SESSION_JOURNAL_FSYNC)
+        logger.info(f"Session checkpoint journal ready: {JOURNAL.directory}")
+    return JOURNAL
+
+
+def is_enabled():
+    return JOURNAL is not None
+
+
+def append(interview_id, event, payload):
+    if JOURNAL is not None:
+        JOURNAL.append(interview_id, event, payload)
+
+
+def replay(interview_id):
+    return JOURNAL.replay(interview_id) if JOURNAL is not None else None
+
+
+def delete(interview_id):
+    return JOURNAL.delete(interview_id) if JOURNAL is not None else False
+
+
+def purge_older_than(max_age_seconds):
+    return JOURNAL.purge_older_than(max_age_seconds) if JOURNAL is not None else 0
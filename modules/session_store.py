@@ -0,0 +1,548 @@
+# modules/session_store.py
+import os
+import json
+import time
+import logging
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock, Thread, Event
+
+try:
+    import fcntl # POSIX only; used for cross-process session locks with the file backend
+except ImportError:
+    fcntl = None
+
+# Local module imports
+import config
+from .interview_logic import InterviewSession
+
+logger = logging.getLogger(__name__)
+
+
+# --- Base Store Interface ---
+class SessionStore:
+    """
+    Interface for storing live InterviewSession objects between requests.
+    Backends must be safe to call from multiple request threads.
+    """
+    backend_name = "base"
+
+    def get(self, interview_id):
+        """Returns the InterviewSession for interview_id, or None if not found."""
+        raise NotImplementedError
+
+    def put(self, interview_id, session_obj):
+        """Stores (or overwrites) the session state for interview_id."""
+        raise NotImplementedError
+
+    def delete(self, interview_id):
+        """Removes the session for interview_id. Returns True if something was removed."""
+        raise NotImplementedError
+
+    def count(self):
+        """Returns the number of sessions currently held by the store."""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Periodic housekeeping (expiry, spilling). Called by SessionSweeper."""
+        pass
+
+
+def _release_session_resources(interview_id, session_obj):
+    """Frees provider-side resources (the interviewer context cache) of a session dropped for good."""
+    try:
+        session_obj.release_resources()
+    except Exception as e:
+        logger.warning(f"[{interview_id}] Failed to release resources of dropped session: {e}")
+
+
+# --- In-Memory Backend (Default, single process only) ---
+class _MemoryEntry:
+    __slots__ = ("session_obj", "size_bytes", "last_access")
+
+    def __init__(self, session_obj, size_bytes):
+        self.session_obj = session_obj
+        self.size_bytes = size_bytes
+        self.last_access = time.monotonic()
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Keeps live session objects in a process-local LRU. Only valid with a single worker process.
+
+    Bounded by max_sessions and max_bytes (approximate serialized size). When a bound is exceeded,
+    or a session has been idle for idle_spill_seconds, the least recently used sessions are spilled
+    to spill_store (if configured) and transparently reloaded on the next get(). Sessions idle for
+    longer than ttl_seconds are dropped for good, including their spilled copy.
+    """
+    backend_name = "memory"
+
+    def __init__(self, max_sessions=0, max_bytes=0, ttl_seconds=0, idle_spill_seconds=0, spill_store=None):
+        self.max_sessions = max_sessions # 0 = unbounded
+        self.max_bytes = max_bytes # 0 = unbounded
+        self.ttl_seconds = ttl_seconds # 0 = never expire
+        self.idle_spill_seconds = idle_spill_seconds # 0 = never spill for idleness
+        self.spill_store = spill_store
+        self._sessions = OrderedDict() # interview_id -> _MemoryEntry, least recently used first
+        self._total_bytes = 0
+        # interview_id -> Event set when its spill copy has been written, restored or deleted. While
+        # a session is in transit it may be in neither place, so get/put/delete wait for the Event.
+        self._in_transit = {}
+        self._lock = Lock() # Protects _sessions, _total_bytes, _in_transit and stats
+        self.stats = {"evicted": 0, "spilled": 0, "restored": 0, "expired": 0}
+
+    @staticmethod
+    def _estimate_size(session_obj):
+        """Approximates the memory held by a session via its serialized size."""
+        try:
+            return len(json.dumps(session_obj.to_dict(), ensure_ascii=False))
+        except Exception:
+            return 0
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _remove_entry_locked(self, interview_id):
+        entry = self._sessions.pop(interview_id, None)
+        if entry:
+            self._total_bytes -= entry.size_bytes
+        return entry
+
+    def _begin_transit_locked(self, interview_id):
+        transit = Event()
+        self._in_transit[interview_id] = transit
+        return transit
+
+    def _end_transit(self, interview_id, transit):
+        with self._lock:
+            if self._in_transit.get(interview_id) is transit:
+                del self._in_transit[interview_id]
+        transit.set()
+
+    def _spill_or_drop(self, interview_id, entry, reason, transit):
+        """Writes an evicted session to the spill store (outside the lock), then ends its transit."""
+        try:
+            if self.spill_store:
+                try:
+                    self.spill_store.put(interview_id, entry.session_obj)
+                    self._count("spilled")
+                    logger.info(f"[{interview_id}] Spilled idle session to disk ({reason}).")
+                    return
+                except Exception as e:
+                    logger.error(f"[{interview_id}] Failed to spill session to disk, dropping it: {e}", exc_info=True)
+            self._count("evicted")
+            logger.warning(f"[{interview_id}] Evicted session from memory ({reason}); it cannot be resumed.")
+        finally:
+            self._end_transit(interview_id, transit)
+        _release_session_resources(interview_id, entry.session_obj)
+
+    def _enforce_bounds_locked(self):
+        """Pops LRU entries until count and byte budgets are met. Returns (id, entry, transit) for each."""
+        evicted = []
+        for interview_id in list(self._sessions):
+            if not (
+                (self.max_sessions and len(self._sessions) > self.max_sessions) or
+                (self.max_bytes and self._total_bytes > self.max_bytes and len(self._sessions) > 1)
+            ):
+                break
+            if interview_id in self._in_transit:
+                continue # Its stale spill copy is being removed by put(); evict the next one instead
+            entry = self._remove_entry_locked(interview_id)
+            evicted.append((interview_id, entry, self._begin_transit_locked(interview_id)))
+        return evicted
+
+    def _claim(self, interview_id):
+        """Waits until interview_id is not in transit and marks it as in transit for the caller."""
+        while True:
+            with self._lock:
+                transit = self._in_transit.get(interview_id)
+                if transit is None:
+                    return self._begin_transit_locked(interview_id)
+            transit.wait()
+
+    def get(self, interview_id):
+        while True:
+            with self._lock:
+                entry = self._sessions.get(interview_id)
+                if entry:
+                    entry.last_access = time.monotonic()
+                    self._sessions.move_to_end(interview_id)
+                    return entry.session_obj
+                if not self.spill_store:
+                    return None
+                transit = self._in_transit.get(interview_id)
+                if transit is None:
+                    transit = self._begin_transit_locked(interview_id)
+                    break
+            transit.wait() # Being spilled or restored by another thread; look again once that is done
+        # Not in memory: try to restore a spilled copy. The transit mark makes concurrent callers wait.
+        try:
+            session_obj = self.spill_store.get(interview_id)
+            if session_obj is None:
+                return None
+            self._count("restored")
+            logger.info(f"[{interview_id}] Restored spilled session from disk.")
+            self._insert(interview_id, session_obj, transit)
+            return session_obj
+        finally:
+            self._end_transit(interview_id, transit)
+
+    def put(self, interview_id, session_obj):
+        size_bytes = self._estimate_size(session_obj) if self.max_bytes else 0
+        while True:
+            with self._lock:
+                transit = self._in_transit.get(interview_id)
+                if transit is None:
+                    transit = self._begin_transit_locked(interview_id) if self.spill_store else None
+                    break
+            transit.wait()
+        try:
+            self._insert(interview_id, session_obj, transit, size_bytes)
+        finally:
+            if transit is not None:
+                self._end_transit(interview_id, transit)
+
+    def _insert(self, interview_id, session_obj, transit, size_bytes=None):
+        """Makes the session resident. The caller holds interview_id's transit mark (if there is a spill store)."""
+        if size_bytes is None:
+            size_bytes = self._estimate_size(session_obj) if self.max_bytes else 0
+        with self._lock:
+            was_resident = self._remove_entry_locked(interview_id) is not None
+            self._sessions[interview_id] = _MemoryEntry(session_obj, size_bytes)
+            self._total_bytes += size_bytes
+            evicted = self._enforce_bounds_locked()
+        if not was_resident and self.spill_store:
+            self.spill_store.delete(interview_id) # Drop the spilled copy superseded (or restored) by this write
+        for evicted_id, entry, evicted_transit in evicted:
+            self._spill_or_drop(evicted_id, entry, "memory bounds exceeded", evicted_transit)
+
+    def delete(self, interview_id):
+        transit = self._claim(interview_id)
+        try:
+            with self._lock:
+                removed = self._remove_entry_locked(interview_id) is not None
+            if self.spill_store:
+                removed = self.spill_store.delete(interview_id) or removed
+            return removed
+        finally:
+            self._end_transit(interview_id, transit)
+
+    def count(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def sweep(self):
+        """Expires sessions past their TTL and spills sessions idle past idle_spill_seconds."""
+        now = time.monotonic()
+        expired, idle = [], []
+        with self._lock:
+            for interview_id, entry in list(self._sessions.items()):
+                if interview_id in self._in_transit:
+                    continue # Being written right now, so not idle
+                idle_for = now - entry.last_access
+                if self.ttl_seconds and idle_for > self.ttl_seconds:
+                    expired.append((interview_id, self._remove_entry_locked(interview_id)))
+                elif self.idle_spill_seconds and self.spill_store and idle_for > self.idle_spill_seconds:
+                    idle.append((interview_id, self._remove_entry_locked(interview_id), self._begin_transit_locked(interview_id)))
+            self.stats["expired"] += len(expired)
+        for interview_id, entry, transit in idle:
+            self._spill_or_drop(interview_id, entry, f"idle > {self.idle_spill_seconds}s", transit)
+        for interview_id, entry in expired:
+            _release_session_resources(interview_id, entry.session_obj)
+        if expired:
+            logger.info(f"Expired {len(expired)} idle interview session(s) from memory.")
+        if self.spill_store and self.ttl_seconds:
+            self._count("expired", self.spill_store.purge_older_than(self.ttl_seconds))
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, sessions=len(self._sessions), total_bytes=self._total_bytes)
+
+
+# --- File Backend (Shared between worker processes) ---
+class FileSessionStore(SessionStore):
+    """
+    Serializes each session to a JSON file in a shared directory.
+    Every worker process (and every node mounting the same directory) sees the same state.
+    Writes are atomic (temp file + rename), so readers never see a half-written session.
+    """
+    backend_name = "file"
+
+    def __init__(self, directory, lock_manager=None):
+        self.directory = os.path.abspath(directory)
+        self.lock_manager = lock_manager # Optional, lets sweep() clean up stale lock files
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path_for(self, interview_id):
+        # Interview IDs are UUIDs, but never trust them as path components
+        safe_id = "".join(c for c in str(interview_id) if c.isalnum() or c == "-")
+        if not safe_id:
+            raise ValueError(f"Invalid interview id for file session store: {interview_id!r}")
+        return os.path.join(self.directory, f"{safe_id}.json")
+
+    def get(self, interview_id):
+        path = self._path_for(interview_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"[{interview_id}] Failed to read session state from {path}: {e}")
+            return None
+        try:
+            return InterviewSession.from_dict(data)
+        except Exception as e:
+            logger.error(f"[{interview_id}] Failed to deserialize session state from {path}: {e}", exc_info=True)
+            return None
+
+    def put(self, interview_id, session_obj):
+        path = self._path_for(interview_id)
+        payload = json.dumps(session_obj.to_dict(), ensure_ascii=False)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path) # Atomic on POSIX
+        except Exception:
+            if os.path.exists(tmp_path):
+                try: os.remove(tmp_path)
+                except OSError: pass
+            raise
+
+    def delete(self, interview_id):
+        try:
+            os.remove(self._path_for(interview_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _session_files(self):
+        try:
+            return [name for name in os.listdir(self.directory) if name.endswith(".json") and not name.startswith(".tmp_")]
+        except OSError:
+            return []
+
+    def count(self):
+        return len(self._session_files())
+
+    def purge_older_than(self, max_age_seconds):
+        """Deletes session files not written for max_age_seconds. Returns the number removed."""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for name in self._session_files():
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    session_obj = self.get(name[:-len(".json")])
+                    os.remove(path)
+                    removed += 1
+                    if session_obj is not None:
+                        _release_session_resources(session_obj.interview_id, session_obj)
+            except OSError:
+                continue # Concurrently updated or removed by another worker
+        if removed:
+            logger.info(f"Purged {removed} expired interview session file(s) from {self.directory}.")
+        return removed
+
+    def sweep(self):
+        """Removes session files past SESSION_TTL_SECONDS."""
+        if config.SESSION_TTL_SECONDS > 0:
+            self.purge_older_than(config.SESSION_TTL_SECONDS)
+            if self.lock_manager:
+                self.lock_manager.purge_stale_lock_files(config.SESSION_TTL_SECONDS)
+
+
+# --- Background Sweeper ---
+class SessionSweeper(Thread):
+    """Daemon thread that periodically calls store.sweep()."""
+
+    def __init__(self, store, interval_seconds):
+        super().__init__(name="session-sweeper", daemon=True)
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.extra_tasks = [] # Additional housekeeping callables run on every sweep
+        self._stop_event = Event()
+
+    def add_task(self, task):
+        self.extra_tasks.append(task)
+
+    def run(self):
+        logger.info(f"Session sweeper started (interval: {self.interval_seconds}s).")
+        while not self._stop_event.wait(self.interval_seconds):
+            for task in [self.store.sweep] + self.extra_tasks:
+                try:
+                    task()
+                except Exception as e:
+                    logger.error(f"Session sweep task {getattr(task, '__name__', task)} failed: {e}", exc_info=True)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# --- Per-Session Locking ---
+class SessionLockManager:
+    """
+    Serializes mutations of a single interview session.
+
+    Each interview ID gets its own in-process lock; when lock_dir is set (file backend),
+    an flock() on a per-session lock file extends the exclusion across worker processes.
+    hold() uses try-acquire semantics so callers can reject overlapping requests (HTTP 409)
+    instead of queueing duplicate STT/LLM work behind the current one.
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir
+        if self.lock_dir:
+            if fcntl is None:
+                logger.warning("fcntl not available on this platform. Session locks will only be enforced within a process.")
+                self.lock_dir = None
+            else:
+                os.makedirs(self.lock_dir, exist_ok=True)
+        self._locks = {} # interview_id -> [Lock, number of threads using it]
+        self._guard = Lock() # Protects _locks and stats
+        self.stats = {"acquired": 0, "rejected": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0, "held": 0}
+
+    def _checkout(self, interview_id):
+        with self._guard:
+            entry = self._locks.setdefault(interview_id, [Lock(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def _checkin(self, interview_id):
+        with self._guard:
+            entry = self._locks.get(interview_id)
+            if entry:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._locks[interview_id]
+
+    def _lock_file_path(self, interview_id):
+        safe_id = "".join(c for c in str(interview_id) if c.isalnum() or c == "-")
+        return os.path.join(self.lock_dir, f"{safe_id}.lock")
+
+    def _acquire_file_lock(self, interview_id, deadline):
+        """Returns an open fd holding an exclusive flock, or None if it could not be taken before deadline."""
+        fd = os.open(self._lock_file_path(interview_id), os.O_RDWR | os.O_CREAT, 0o644)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.utime(fd) # Mark as recently used so purge_stale_lock_files leaves it alone
+                return fd
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    return None
+                time.sleep(0.05)
+
+    def _record(self, acquired, waited):
+        with self._guard:
+            if acquired:
+                self.stats["acquired"] += 1
+                self.stats["held"] += 1
+            else:
+                self.stats["rejected"] += 1
+            self.stats["total_wait_seconds"] += waited
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+
+    @contextmanager
+    def hold(self, interview_id, timeout=0.0):
+        """
+        Context manager yielding True if the session lock was acquired within timeout seconds
+        (0 = do not wait), or False if another request currently owns the session.
+        """
+        start = time.monotonic()
+        deadline = start + max(timeout, 0.0)
+        lock = self._checkout(interview_id)
+        fd = None
+        acquired = lock.acquire(timeout=timeout) if timeout > 0 else lock.acquire(blocking=False)
+        try:
+            if acquired and self.lock_dir:
+                fd = self._acquire_file_lock(interview_id, deadline)
+                if fd is None:
+                    lock.release()
+                    acquired = False
+            waited = time.monotonic() - start
+            self._record(acquired, waited)
+            if not acquired:
+                logger.info(f"[{interview_id}] Session is busy (lock not acquired after {waited:.3f}s).")
+            yield acquired
+        finally:
+            if acquired:
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+                lock.release()
+                with self._guard:
+                    self.stats["held"] -= 1
+            self._checkin(interview_id)
+
+    def purge_stale_lock_files(self, max_age_seconds):
+        """Removes lock files of sessions untouched for max_age_seconds."""
+        if not self.lock_dir:
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if name.endswith(".lock") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def get_stats(self):
+        with self._guard:
+            stats = dict(self.stats)
+        attempts = stats["acquired"] + stats["rejected"]
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / attempts if attempts else 0.0
+        return stats
+
+
+# --- Factory ---
+def create_session_store(backend=None, lock_manager=None):
+    """Creates the session store configured by SESSION_STORE_BACKEND ('memory' or 'file')."""
+    backend = (backend or config.SESSION_STORE_BACKEND).lower()
+    if backend == "memory":
+        spill_store = FileSessionStore(config.SESSION_SPILL_DIR) if config.SESSION_IDLE_SPILL_SECONDS > 0 or config.SESSION_MAX_COUNT > 0 or config.SESSION_MAX_BYTES > 0 else None
+        store = InMemorySessionStore(
+            max_sessions=config.SESSION_MAX_COUNT,
+            max_bytes=config.SESSION_MAX_BYTES,
+            ttl_seconds=config.SESSION_TTL_SECONDS,
+            idle_spill_seconds=config.SESSION_IDLE_SPILL_SECONDS,
+            spill_store=spill_store,
+        )
+    elif backend == "file":
+        store = FileSessionStore(config.SESSION_STORE_DIR, lock_manager=lock_manager)
+    else:
+        raise ValueError(f"Unknown SESSION_STORE_BACKEND '{backend}'. Expected 'memory' or 'file'.")
+    if config.SESSION_SWEEP_INTERVAL_SECONDS > 0:
+        store.sweeper = SessionSweeper(store, config.SESSION_SWEEP_INTERVAL_SECONDS)
+        store.sweeper.start()
+    logger.info(f"Interview session store initialized (backend: {store.backend_name}).")
+    return store
+
+
+def restart_sweeper(store):
+    """
+    Starts a fresh sweeper thread for store, keeping its extra tasks. Threads do not survive fork(),
+    so a store created in a preloading gunicorn master needs this in each worker (post_fork).
+    """
+    old_sweeper = getattr(store, 'sweeper', None)
+    if old_sweeper is None:
+        return None
+    store.sweeper = SessionSweeper(store, old_sweeper.interval_seconds)
+    store.sweeper.extra_tasks = list(old_sweeper.extra_tasks)
+    store.sweeper.start()
+    return store.sweeper
+
+
+def create_session_lock_manager(backend=None):
+    """Creates per-session locks matching the store backend (cross-process for 'file')."""
+    backend = (backend or config.SESSION_STORE_BACKEND).lower()
+    lock_dir = os.path.join(config.SESSION_STORE_DIR, "locks") if backend == "file" else None
+    return SessionLockManager(lock_dir=lock_dir)
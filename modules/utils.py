@@ -4,6 +4,10 @@ import os
 import re
 import warnings
 import sys # For NLTK download path check
+import time
+import hashlib
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
 
 # PDF Parsing
 try:
@@ -43,6 +47,7 @@ except ImportError:
 # RAG Dependencies
 try:
     import psycopg2 # For PostgreSQL connection
+    import psycopg2.pool
     from sentence_transformers import SentenceTransformer # For embeddings
     RAG_DEPENDENCIES_AVAILABLE = True
 except ImportError as e:
@@ -53,6 +58,8 @@ except ImportError as e:
 
 # Local Imports
 import config # Import the updated config
+from modules.cache import LRUCache, SqliteBlobStore
+from modules import rag_local_index, rag_context
 
 logger = logging.getLogger(__name__)
 
@@ -63,10 +70,24 @@ def allowed_file(filename, allowed_extensions):
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 # --- Global Variables for RAG ---
-rag_db_connection = None # Use a distinct name for RAG connection
-rag_db_cursor = None     # Use a distinct name
+rag_db_pool = None # psycopg2 ThreadedConnectionPool; check out connections with rag_db_cursor()
+_rag_pool_lock = Lock()
+_embedding_model_lock = Lock()
+_rag_pool_slots = None # BoundedSemaphore(RAG_DB_POOL_MAX): lets callers wait for a free connection
+_rag_pool_next_retry = 0.0 # Earliest time to retry creating the pool after a connection failure
+_rag_conn_last_used = {} # id(connection) -> time it was returned to the pool
+rag_pool_stats = {"checkouts": 0, "waits": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+                  "saturated": 0, "in_use": 0, "health_check_failures": 0, "discarded": 0, "reconnects": 0}
+_rag_pool_stats_lock = Lock() # Request threads update rag_pool_stats concurrently
 embedding_model = None
 nltk_initialized = False
+# Query embeddings keyed by model + normalized text (generate_search_queries' templates recur across candidates)
+embedding_cache = LRUCache(config.EMBEDDING_CACHE_SIZE) if config.EMBEDDING_CACHE_SIZE > 0 else None
+embedding_disk_cache = None # SqliteBlobStore, created on first use when EMBEDDING_CACHE_PATH is set
+embedding_client = None # EmbeddingClient, created on first use when EMBEDDING_SERVER_SOCKET is set
+# Final formatted RAG context per (JD fingerprint, focus topics, knowledge base version); recruiters reuse one JD for many candidates
+rag_context_cache = LRUCache(config.RAG_CONTEXT_CACHE_SIZE, ttl_seconds=config.RAG_CONTEXT_CACHE_TTL_SECONDS) if config.RAG_CONTEXT_CACHE_SIZE > 0 else None
+_kb_version = None # (version string, checked_at)
 
 # --- NLTK Initialization ---
 def initialize_nltk():
@@ -104,8 +125,6 @@ def initialize_nltk():
 # --- RAG Initialization ---
 def initialize_rag():
     """Initializes embedding model and RAG database connection."""
-    global embedding_model, rag_db_connection, rag_db_cursor # Use specific names
-
     # Check config flags first
     logger.info(f"RAG Check: config.RAG_ENABLED={config.RAG_ENABLED}, config.RETRIEVAL_TOP_K={config.RETRIEVAL_TOP_K}") # Changed to info log
     if not config.RAG_ENABLED or config.RETRIEVAL_TOP_K <= 0:
@@ -118,55 +137,310 @@ def initialize_rag():
         return
 
     # 1. Initialize Embedding Model (only if not already loaded)
-    if embedding_model is None:
-        try:
-            logger.info(f"Loading embedding model for RAG: {config.EMBEDDING_MODEL_NAME}")
-            embedding_model = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
-            logger.info("RAG Embedding model loaded successfully.")
-        except Exception as e:
-            logger.error(f"Failed to load RAG embedding model '{config.EMBEDDING_MODEL_NAME}': {e}", exc_info=True)
-            embedding_model = None
-            config.RAG_ENABLED = False # Disable RAG if model fails
-            logger.warning("Disabling RAG due to embedding model failure.")
-            return # Stop initialization here
-
-    # 2. Initialize RAG Database Connection (only if not already connected)
-    if rag_db_connection is None:
-        # Check if RAG-specific config variables are present
-        # Password can be empty string, so check user and host specifically
+    if config.EMBEDDING_SERVER_SOCKET:
+        logger.info(f"Query embeddings are served by the embedding server at {config.EMBEDDING_SERVER_SOCKET}; not loading the model in this process.")
+    elif config.EMBEDDING_LOAD_MODE == "lazy":
+        logger.info("Embedding model will be loaded on first RAG use (EMBEDDING_LOAD_MODE=lazy).")
+    elif _load_embedding_model() is None:
+        return # Stop initialization here
+
+    # In preload mode this runs in the gunicorn master before fork; connections must not be shared
+    # with the workers, so each worker creates its pool in _ensure_rag_pool() on first use.
+    connect_now = config.EMBEDDING_LOAD_MODE != "preload"
+    if not connect_now:
+        logger.info("RAG database pool will be created in each worker on first use (EMBEDDING_LOAD_MODE=preload).")
+
+    # 2. Local backend: the snapshot answers queries; Postgres is only a fallback
+    if config.RAG_BACKEND == "local":
+        local_index = rag_local_index.get_local_index()
+        if local_index is not None:
+            logger.info(f"RAG backend: local snapshot ({local_index.size} documents, version {local_index.version}).")
+        else:
+            logger.warning(f"RAG_BACKEND=local but no snapshot found in {config.RAG_LOCAL_INDEX_DIR}. Run `flask rag-snapshot`. Falling back to Postgres.")
         if not all([config.RAG_DB_NAME, config.RAG_DB_USER, config.RAG_DB_HOST]):
-             logger.error("RAG Database configuration (RAG_DB_NAME, RAG_DB_USER, RAG_DB_HOST) is incomplete.")
-             config.RAG_ENABLED = False
-             logger.warning("Disabling RAG due to incomplete RAG DB configuration.")
-             return
+            if local_index is None:
+                config.RAG_ENABLED = False
+                logger.warning("Disabling RAG: no local snapshot and incomplete RAG DB configuration.")
+            return
+        if connect_now:
+            _ensure_rag_pool()
+        return
 
+    # 2. Initialize RAG Database Connection Pool (only if not already created)
+    # Password can be empty string, so check user and host specifically
+    if not all([config.RAG_DB_NAME, config.RAG_DB_USER, config.RAG_DB_HOST]):
+         logger.error("RAG Database configuration (RAG_DB_NAME, RAG_DB_USER, RAG_DB_HOST) is incomplete.")
+         config.RAG_ENABLED = False
+         logger.warning("Disabling RAG due to incomplete RAG DB configuration.")
+         return
+    if connect_now and not _ensure_rag_pool():
+        logger.warning(f"RAG database unavailable at startup. Retrieval returns no context until a reconnect succeeds (retried every {config.RAG_DB_RECONNECT_INTERVAL_SECONDS}s).")
+
+
+def create_embedding_model(backend=None):
+    """
+    Builds the SentenceTransformer for an EMBEDDING_BACKEND:
+      'torch' - float32 PyTorch (reference)
+      'onnx'  - ONNX Runtime via sentence-transformers' backend="onnx" (needs sentence-transformers>=3.2, optimum, onnxruntime)
+      'int8'  - PyTorch with dynamic int8 quantization of the Linear layers (no extra dependencies)
+    """
+    backend = (backend or config.EMBEDDING_BACKEND).lower()
+    if backend == "torch":
+        return SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+    if backend == "onnx":
+        model_kwargs = {"file_name": config.EMBEDDING_ONNX_FILE} if config.EMBEDDING_ONNX_FILE else None
+        return SentenceTransformer(config.EMBEDDING_MODEL_NAME, backend="onnx", model_kwargs=model_kwargs)
+    if backend == "int8":
+        import torch
+        model = SentenceTransformer(config.EMBEDDING_MODEL_NAME, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Expected 'torch', 'onnx' or 'int8'.")
+
+
+def _load_embedding_model():
+    """Loads the SentenceTransformer once per process (thread-safe). Disables RAG if loading fails."""
+    global embedding_model
+    if embedding_model is not None:
+        return embedding_model
+    with _embedding_model_lock:
+        if embedding_model is None and config.RAG_ENABLED and RAG_DEPENDENCIES_AVAILABLE:
+            try:
+                start = time.time()
+                logger.info(f"Loading embedding model for RAG: {config.EMBEDDING_MODEL_NAME} (backend: {config.EMBEDDING_BACKEND})")
+                embedding_model = create_embedding_model()
+                logger.info(f"RAG Embedding model loaded successfully in {time.time() - start:.1f}s.")
+            except Exception as e:
+                logger.error(f"Failed to load RAG embedding model '{config.EMBEDDING_MODEL_NAME}': {e}", exc_info=True)
+                embedding_model = None
+                config.RAG_ENABLED = False # Disable RAG if model fails
+                logger.warning("Disabling RAG due to embedding model failure.")
+    return embedding_model
+
+
+def get_embedding_model(allow_load=None):
+    """
+    Returns the embedding model, loading it on first use when EMBEDDING_LOAD_MODE=lazy.
+    With an embedding server configured the model is only loaded in-process when allow_load=True
+    (the fallback path). Returns None when RAG is disabled or the model cannot be loaded.
+    """
+    if embedding_model is not None:
+        return embedding_model
+    if not config.RAG_ENABLED or config.RETRIEVAL_TOP_K <= 0:
+        return None
+    if allow_load is None:
+        allow_load = not config.EMBEDDING_SERVER_SOCKET
+    return _load_embedding_model() if allow_load else None
+
+
+def _ensure_rag_pool():
+    """
+    Creates the RAG connection pool if it does not exist yet. After a failure, creation is
+    retried at most every RAG_DB_RECONNECT_INTERVAL_SECONDS, so a database outage no longer
+    disables RAG until the app restarts. Returns True if the pool is available.
+    """
+    global rag_db_pool, _rag_pool_slots, _rag_pool_next_retry
+    if rag_db_pool is not None:
+        return True
+    if not RAG_DEPENDENCIES_AVAILABLE or time.time() < _rag_pool_next_retry:
+        return False
+    with _rag_pool_lock:
+        if rag_db_pool is not None:
+            return True
         try:
-            logger.info(f"Connecting to RAG database '{config.RAG_DB_NAME}' on {config.RAG_DB_HOST}:{config.RAG_DB_PORT} as user '{config.RAG_DB_USER}'...")
-            rag_db_connection = psycopg2.connect(
+            logger.info(f"Connecting to RAG database '{config.RAG_DB_NAME}' on {config.RAG_DB_HOST}:{config.RAG_DB_PORT} as user '{config.RAG_DB_USER}' (pool {config.RAG_DB_POOL_MIN}-{config.RAG_DB_POOL_MAX})...")
+            pool = psycopg2.pool.ThreadedConnectionPool(
+                config.RAG_DB_POOL_MIN,
+                config.RAG_DB_POOL_MAX,
                 dbname=config.RAG_DB_NAME,
                 user=config.RAG_DB_USER,
                 password=config.RAG_DB_PASSWORD, # Handles empty string correctly
                 host=config.RAG_DB_HOST,
                 port=config.RAG_DB_PORT,
-                connect_timeout=10
+                connect_timeout=10,
+                options=f"-c statement_timeout={config.RAG_DB_STATEMENT_TIMEOUT_MS}" # Server-side cap per query
             )
-            rag_db_cursor = rag_db_connection.cursor()
             # Test connection
-            rag_db_cursor.execute("SELECT 1;") # Simple query to check connection
-            rag_db_cursor.fetchone()
-            logger.info("RAG Database connection successful.")
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;") # Simple query to check connection
+                    cur.fetchone()
+                conn.rollback()
+            finally:
+                pool.putconn(conn)
         except psycopg2.OperationalError as e:
             logger.error(f"Failed to connect to RAG database '{config.RAG_DB_NAME}' on {config.RAG_DB_HOST}: {e}", exc_info=False) # Less verbose log often
-            rag_db_connection = None
-            rag_db_cursor = None
-            config.RAG_ENABLED = False
-            logger.warning("Disabling RAG due to RAG database connection failure. Check credentials, host, port, and if DB exists.")
+            _rag_pool_next_retry = time.time() + config.RAG_DB_RECONNECT_INTERVAL_SECONDS
+            return False
         except Exception as e:
-             logger.error(f"An unexpected error occurred during RAG database connection: {e}", exc_info=True)
-             rag_db_connection = None
-             rag_db_cursor = None
-             config.RAG_ENABLED = False
-             logger.warning("Disabling RAG due to unexpected RAG database connection error.")
+            logger.error(f"An unexpected error occurred during RAG database connection: {e}", exc_info=True)
+            _rag_pool_next_retry = time.time() + config.RAG_DB_RECONNECT_INTERVAL_SECONDS
+            return False
+        if _rag_pool_slots is None:
+            _rag_pool_slots = BoundedSemaphore(config.RAG_DB_POOL_MAX)
+        if _rag_pool_next_retry:
+            _count_rag_pool("reconnects")
+        rag_db_pool = pool
+        logger.info("RAG Database connection pool ready.")
+        return True
+
+
+def _count_rag_pool(name, amount=1):
+    with _rag_pool_stats_lock:
+        rag_pool_stats[name] += amount
+
+
+def _rag_connection_is_healthy(conn):
+    """Cheap liveness check, only run for connections idle longer than RAG_DB_HEALTHCHECK_IDLE_SECONDS."""
+    if conn.closed:
+        return False
+    idle_for = time.time() - _rag_conn_last_used.get(id(conn), 0.0)
+    if idle_for < config.RAG_DB_HEALTHCHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def rag_db_cursor(wait_seconds=None):
+    """
+    Checks a connection out of the RAG pool for the duration of the block and yields a cursor.
+    Waits up to wait_seconds (default RAG_DB_POOL_WAIT_SECONDS) for a free connection and raises
+    psycopg2.pool.PoolError if the pool stays saturated. Broken connections are discarded and
+    replaced; the open transaction is rolled back when the connection is returned.
+    """
+    if not _ensure_rag_pool():
+        raise psycopg2.OperationalError("RAG database connection pool is not available.")
+    wait_seconds = config.RAG_DB_POOL_WAIT_SECONDS if wait_seconds is None else wait_seconds
+
+    wait_start = time.time()
+    if not _rag_pool_slots.acquire(blocking=False):
+        acquired = _rag_pool_slots.acquire(timeout=wait_seconds)
+        waited = time.time() - wait_start
+        with _rag_pool_stats_lock:
+            rag_pool_stats["waits"] += 1
+            rag_pool_stats["wait_seconds_total"] += waited
+            rag_pool_stats["wait_seconds_max"] = max(rag_pool_stats["wait_seconds_max"], waited)
+            if not acquired:
+                rag_pool_stats["saturated"] += 1
+        if not acquired:
+            raise psycopg2.pool.PoolError(f"RAG connection pool saturated ({config.RAG_DB_POOL_MAX} in use, waited {waited:.1f}s).")
+
+    pool = rag_db_pool
+    conn = None
+    counted = False # in_use was incremented for this checkout
+    broken = False
+    try:
+        conn = pool.getconn()
+        if not _rag_connection_is_healthy(conn):
+            _count_rag_pool("health_check_failures")
+            _rag_conn_last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = None # Already returned; a failing getconn() below must not return it again
+            conn = pool.getconn() # Opens a fresh connection in place of the broken one
+        with _rag_pool_stats_lock:
+            rag_pool_stats["checkouts"] += 1
+            rag_pool_stats["in_use"] += 1
+        counted = True
+        with conn.cursor() as cur:
+            yield cur
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        if counted:
+            _count_rag_pool("in_use", -1)
+        if conn is not None:
+            try:
+                if not broken and not conn.closed:
+                    conn.rollback() # Return the connection idle, never mid-transaction
+            except psycopg2.Error:
+                broken = True
+            if broken or conn.closed:
+                _count_rag_pool("discarded")
+                _rag_conn_last_used.pop(id(conn), None)
+            else:
+                _rag_conn_last_used[id(conn)] = time.time()
+            try:
+                pool.putconn(conn, close=broken or conn.closed)
+            except psycopg2.pool.PoolError:
+                pass # Pool was closed while the connection was checked out
+        _rag_pool_slots.release()
+
+
+def apply_ann_search_settings(cur):
+    """
+    Sets the pgvector index search knobs for the current transaction (SET LOCAL, so pooled
+    connections are not affected after they are returned). 0 keeps the server default.
+    """
+    ef_search = config.RAG_HNSW_EF_SEARCH
+    if config.RAG_VECTOR_STORAGE != "vector":
+        ef_search = max(ef_search, config.RAG_RERANK_CANDIDATES) # HNSW returns at most ef_search rows, so cover the re-rank pool
+    if ef_search > 0:
+        cur.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+    if config.RAG_IVFFLAT_PROBES > 0:
+        cur.execute("SET LOCAL ivfflat.probes = %s", (config.RAG_IVFFLAT_PROBES,))
+
+
+def coarse_distance_sql(storage, column, query):
+    """
+    Distance expression for the ANN search over the given storage ('vector', 'halfvec' or 'binary').
+    It must match the index expression built by rag_admin.create_ann_index for the index to be used.
+    """
+    dim = int(config.EMBEDDING_DIMENSIONS)
+    if storage == "halfvec":
+        return f"{column}::halfvec({dim}) <=> {query}::halfvec({dim})"
+    if storage == "binary":
+        return f"binary_quantize({column})::bit({dim}) <~> binary_quantize({query})::bit({dim})"
+    return f"{column} <=> {query}"
+
+
+def top_k_search_sql(storage, query):
+    """
+    Per-query top-k subquery over knowledge_documents returning (id, content, distance), where
+    distance is always the exact cosine distance. For 'vector' the single placeholder is top_k;
+    for 'halfvec'/'binary' the placeholders are (candidates, top_k): the compact index yields the
+    candidates, which are re-ranked against the full-precision embedding.
+    """
+    if storage == "vector":
+        return f"""
+                    SELECT kd.id, kd.content, kd.embedding <=> {query} AS distance
+                    FROM knowledge_documents kd
+                    ORDER BY kd.embedding <=> {query}
+                    LIMIT %s"""
+    return f"""
+                    SELECT c.id, c.content, c.embedding <=> {query} AS distance
+                    FROM (
+                        SELECT kd.id, kd.content, kd.embedding
+                        FROM knowledge_documents kd
+                        ORDER BY {coarse_distance_sql(storage, "kd.embedding", query)}
+                        LIMIT %s
+                    ) AS c
+                    ORDER BY c.embedding <=> {query}
+                    LIMIT %s"""
+
+
+def top_k_search_params(storage, top_k):
+    """LIMIT parameters for top_k_search_sql."""
+    if storage == "vector":
+        return (top_k,)
+    return (max(config.RAG_RERANK_CANDIDATES, top_k), top_k)
+
+
+def get_rag_pool_stats():
+    """Connection checkout/wait/saturation counters for the RAG pool in this worker."""
+    with _rag_pool_stats_lock:
+        stats = dict(rag_pool_stats)
+    stats["pool_max"] = config.RAG_DB_POOL_MAX
+    stats["available"] = rag_db_pool is not None
+    stats["avg_wait_seconds"] = round(stats["wait_seconds_total"] / stats["waits"], 4) if stats["waits"] else 0.0
+    return stats
 
 
 # --- PDF Text Extraction ---
@@ -216,7 +490,8 @@ def extract_keywords(text, max_keywords=10):
         return []
 
 # --- RAG Helper Functions ---
-def generate_search_queries(resume_summary, jd_summary, num_queries=3):
+def generate_search_queries(resume_summary, jd_summary, num_queries=3, jd_keywords=None, role_title=None):
+    """jd_keywords/role_title may be passed precomputed (see interview_logic.get_jd_artifacts) to skip the JD-side analysis."""
     logger.debug("Generating RAG search queries...")
     if not NLTK_AVAILABLE or not nltk_initialized:
          logger.warning("NLTK unavailable, using basic combined text for RAG query.")
@@ -224,11 +499,12 @@ def generate_search_queries(resume_summary, jd_summary, num_queries=3):
          return [clean_text(combined_text)[:500]]
 
     try:
-        role_title_match = re.search(r"^(?:Job\s+)?Title\s*[:\-]?\s*(.*?)(\n|$)", jd_summary, re.IGNORECASE | re.MULTILINE)
-        role_title = role_title_match.group(1).strip() if role_title_match else "Position"
+        if role_title is None:
+            role_title_match = re.search(r"^(?:Job\s+)?Title\s*[:\-]?\s*(.*?)(\n|$)", jd_summary, re.IGNORECASE | re.MULTILINE)
+            role_title = role_title_match.group(1).strip() if role_title_match else "Position"
 
         resume_keywords = extract_keywords(resume_summary, max_keywords=8)
-        jd_keywords = extract_keywords(jd_summary, max_keywords=8)
+        jd_keywords = list(jd_keywords) if jd_keywords is not None else extract_keywords(jd_summary, max_keywords=8)
         combined_keywords = list(set(resume_keywords + jd_keywords))
         overlap_keywords = list(set(resume_keywords) & set(jd_keywords))
 
@@ -250,70 +526,275 @@ def generate_search_queries(resume_summary, jd_summary, num_queries=3):
         return [clean_text(f"Job Description: {jd_summary} Resume Summary: {resume_summary}")[:500]]
 
 
+# --- Embedding Cache ---
+def _embedding_cache_key(normalized_text):
+    # Backends produce slightly different vectors, so they never share cache entries
+    return f"{config.EMBEDDING_MODEL_NAME}\x00{config.EMBEDDING_BACKEND}\x00{normalized_text}"
+
+
+def _get_embedding_disk_cache():
+    global embedding_disk_cache
+    if embedding_disk_cache is None and config.EMBEDDING_CACHE_PATH:
+        try:
+            embedding_disk_cache = SqliteBlobStore(config.EMBEDDING_CACHE_PATH, table="query_embeddings")
+            logger.info(f"Embedding disk cache ready: {embedding_disk_cache.path}")
+        except Exception as e:
+            logger.error(f"Could not open embedding disk cache '{config.EMBEDDING_CACHE_PATH}': {e}. Continuing without it.")
+            config.EMBEDDING_CACHE_PATH = ""
+    return embedding_disk_cache
+
+
+def encode_texts(texts):
+    """
+    Returns one embedding (float32 numpy vector) per text, in order.
+    Looks each text up in the in-memory LRU, then the optional disk cache; only the misses
+    are encoded, in a single batch (by the embedding server if configured, else the local model).
+    """
+    import numpy as np # Installed with sentence-transformers
+
+    normalized = [" ".join(str(t).split()) for t in texts]
+    vectors = [None] * len(normalized)
+    misses = {} # normalized text -> positions waiting for it
+    disk_cache = _get_embedding_disk_cache()
+    for i, text in enumerate(normalized):
+        key = _embedding_cache_key(text)
+        vector = embedding_cache.get(key) if embedding_cache is not None else None
+        if vector is None and disk_cache is not None:
+            blob = disk_cache.get(key)
+            if blob is not None:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                if embedding_cache is not None:
+                    embedding_cache.put(key, vector)
+        if vector is None:
+            misses.setdefault(text, []).append(i)
+        else:
+            vectors[i] = vector
+
+    if misses:
+        miss_texts = list(misses)
+        encoded = _encode_uncached(miss_texts)
+        for text, vector in zip(miss_texts, encoded):
+            vector.setflags(write=False) # Cached vectors are shared between callers
+            key = _embedding_cache_key(text)
+            if embedding_cache is not None:
+                embedding_cache.put(key, vector)
+            if disk_cache is not None:
+                disk_cache.put(key, vector.tobytes())
+            for i in misses[text]:
+                vectors[i] = vector
+    logger.debug(f"Embedding lookup: {len(texts)} texts, {len(misses)} encoded, {len(texts) - sum(len(v) for v in misses.values())} from cache.")
+    return vectors
+
+
+def _get_embedding_client():
+    global embedding_client
+    if embedding_client is None and config.EMBEDDING_SERVER_SOCKET:
+        from modules.embedding_server import EmbeddingClient
+        embedding_client = EmbeddingClient(config.EMBEDDING_SERVER_SOCKET, config.EMBEDDING_SERVER_TIMEOUT_SECONDS)
+    return embedding_client
+
+
+def _encode_uncached(texts):
+    """Encodes texts via the shared embedding server when configured, falling back to the in-process model."""
+    import numpy as np
+    from modules.embedding_server import EmbeddingServerError
+
+    client = _get_embedding_client()
+    if client is not None:
+        try:
+            return client.encode(texts)
+        except EmbeddingServerError as e:
+            if not config.EMBEDDING_SERVER_FALLBACK:
+                raise
+            logger.warning(f"{e}. Encoding in-process instead.")
+    model = get_embedding_model(allow_load=True)
+    if model is None:
+        raise RuntimeError("No embedding model available (embedding server unreachable and local model not loaded).")
+    return np.asarray(model.encode(texts), dtype=np.float32)
+
+
+def embeddings_available():
+    """True if query embeddings can be produced: via the embedding server (if configured) or the local model."""
+    if not config.RAG_ENABLED or config.RETRIEVAL_TOP_K <= 0:
+        return False
+    if config.EMBEDDING_SERVER_SOCKET:
+        return True # Failures are handled (with optional in-process fallback) in _encode_uncached
+    return get_embedding_model() is not None
+
+
+def get_embedding_cache_stats():
+    """Hit/miss counters for the query-embedding cache (in-memory tier) plus disk tier size."""
+    stats = embedding_cache.get_stats() if embedding_cache is not None else {"enabled": False}
+    if embedding_disk_cache is not None:
+        stats["disk_entries"] = embedding_disk_cache.count()
+    return stats
+
+
+# --- RAG Context Cache ---
+def knowledge_base_version():
+    """
+    Cheap fingerprint of knowledge_documents' contents, re-read at most every RAG_KB_VERSION_CHECK_SECONDS.
+    Local backend: the snapshot version. Postgres: insert/update/delete counters from pg_stat_user_tables,
+    which change whenever the table is written. Returns None if it cannot be determined.
+    """
+    global _kb_version
+    if _kb_version is not None and time.time() - _kb_version[1] < config.RAG_KB_VERSION_CHECK_SECONDS:
+        return _kb_version[0]
+    version = None
+    local_index = rag_local_index.get_local_index() if config.RAG_BACKEND == "local" else None
+    if local_index is not None:
+        version = f"local:{local_index.version}"
+    elif _ensure_rag_pool():
+        try:
+            with rag_db_cursor() as cur:
+                cur.execute("SELECT n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables WHERE relname = 'knowledge_documents'")
+                row = cur.fetchone()
+            version = "pg:" + ":".join(str(v) for v in row) if row else None
+        except Exception as e:
+            logger.warning(f"Could not read knowledge base version: {e}")
+    _kb_version = (version, time.time())
+    return version
+
+
+def rag_context_cache_key(jd_text, focus_topics):
+    """
+    Key for the formatted-context cache: normalized JD text + focus topics + retrieval settings +
+    knowledge base version (so a changed knowledge base never serves stale context).
+    Returns None when the knowledge base version is unknown (caching is skipped).
+    """
+    kb_version = knowledge_base_version()
+    if kb_version is None:
+        return None
+    normalized_jd = " ".join((jd_text or "").lower().split())
+    topics = ",".join(sorted(t.strip().lower() for t in (focus_topics or [])))
+    settings = (
+        f"{config.EMBEDDING_MODEL_NAME}|{config.RETRIEVAL_TOP_K}|{config.RETRIEVAL_SIMILARITY_THRESHOLD}|{config.MAX_CONTEXT_LENGTH}|"
+        f"{config.RAG_CONTEXT_TOKEN_BUDGET}|{config.RAG_CONTEXT_MAX_SENTENCES_PER_DOC}|{config.RAG_CONTEXT_DEDUP_THRESHOLD}"
+    )
+    digest = hashlib.sha256(f"{normalized_jd}\x00{topics}\x00{settings}".encode("utf-8")).hexdigest()
+    return f"{kb_version}|{digest}"
+
+
+def get_cached_rag_context(key):
+    if rag_context_cache is None or key is None:
+        return None
+    return rag_context_cache.get(key)
+
+
+def cache_rag_context(key, context_str):
+    if rag_context_cache is not None and key is not None:
+        rag_context_cache.put(key, context_str)
+
+
+def get_rag_context_cache_stats():
+    stats = rag_context_cache.get_stats() if rag_context_cache is not None else {"enabled": False}
+    stats["kb_version"] = _kb_version[0] if _kb_version else None
+    return stats
+
+
+def _log_rag_db_error(db_err):
+    """Logs a RAG database error with a hint for the common schema/extension problems."""
+    if "relation \"knowledge_documents\" does not exist" in str(db_err):
+        logger.error("RAG DB Error: Table 'knowledge_documents' not found. Ensure it exists in the RAG database ('%s').", config.RAG_DB_NAME)
+    elif "column \"embedding\" does not exist" in str(db_err):
+        logger.error("RAG DB Error: Column 'embedding' not found in 'knowledge_documents'. Ensure schema is correct.")
+    elif "operator does not exist: vector <=> vector" in str(db_err) or "type \"vector\" does not exist" in str(db_err):
+        logger.error("RAG DB Error: <=> operator not found. Ensure the 'pgvector' extension is installed and enabled in the RAG database ('%s'). Run: CREATE EXTENSION IF NOT EXISTS vector;", config.RAG_DB_NAME)
+    else:
+        logger.error(f"RAG Database error during retrieval: {db_err}", exc_info=True)
+
+
 def retrieve_similar_documents(query, top_k=None, threshold=None):
     """Retrieves similar documents from the RAG database using vector similarity."""
-    if not config.RAG_ENABLED or rag_db_cursor is None or embedding_model is None:
+    return retrieve_similar_documents_batch([query], top_k=top_k, threshold=threshold)
+
+
+def retrieve_similar_documents_batch(queries, top_k=None, threshold=None):
+    """
+    Retrieves documents for several queries in one round trip.
+    All queries are encoded in a single batch, and one SQL statement runs the top-k search per query
+    (LATERAL join over a VALUES list of query vectors). With RAG_BACKEND=local the search runs
+    against the memory-mapped snapshot instead (no database round trip), falling back to Postgres
+    if no snapshot is available. The results are de-duplicated by content, keeping the best score,
+    and sorted by similarity (highest first).
+    """
+    if not embeddings_available():
         # logger.debug("RAG retrieval skipped.")
         return []
 
     top_k = top_k if top_k is not None else config.RETRIEVAL_TOP_K
     threshold = threshold if threshold is not None else config.RETRIEVAL_SIMILARITY_THRESHOLD
+    queries = [q for q in dict.fromkeys(queries) if q] # Drop empty and repeated queries, keep order
 
     # No point querying if top_k is 0 or less
-    if top_k <= 0:
+    if top_k <= 0 or not queries:
+        return []
+
+    local_index = rag_local_index.get_local_index() if config.RAG_BACKEND == "local" else None
+    if local_index is None and not _ensure_rag_pool():
         return []
 
     try:
-        logger.debug(f"Generating RAG embedding for query: '{query[:50]}...'")
-        query_embedding = embedding_model.encode(query)
-
-        sql_query = """
-            SELECT id, content, 1 - (embedding <=> %s) AS similarity
-            FROM knowledge_documents -- Ensure table name is correct!
-            WHERE 1 - (embedding <=> %s) >= %s
-            ORDER BY similarity DESC
-            LIMIT %s;
+        logger.debug(f"Generating RAG embeddings for {len(queries)} queries in one batch...")
+        query_embeddings = encode_texts(queries) # Cached; only unseen queries hit the model
+
+        if local_index is not None:
+            documents = local_index.search(query_embeddings, top_k, threshold)
+            logger.info(f"Retrieved {len(documents)} unique documents from local RAG index for {len(queries)} queries (Threshold: {threshold}, TopK per query: {top_k})")
+            return documents
+
+        # The inner ORDER BY uses the bare distance expression so an HNSW/IVFFlat index can serve it;
+        # the similarity threshold is applied to the k candidates afterwards, not to the whole table.
+        # With halfvec/binary storage the index search is coarse and its candidates are re-ranked exactly.
+        storage = config.RAG_VECTOR_STORAGE
+        values_sql = ", ".join(["(%s, %s::vector)"] * len(queries))
+        sql_query = f"""
+            SELECT id, content, similarity FROM (
+                SELECT DISTINCT ON (d.content) d.id, d.content, 1 - d.distance AS similarity
+                FROM (VALUES {values_sql}) AS q(query_idx, embedding)
+                CROSS JOIN LATERAL ({top_k_search_sql(storage, "q.embedding")}
+                ) AS d
+                WHERE 1 - d.distance >= %s
+                ORDER BY d.content, d.distance
+            ) AS best
+            ORDER BY similarity DESC;
         """
-        embedding_list = query_embedding.tolist()
-        rag_db_cursor.execute(sql_query, (embedding_list, embedding_list, threshold, top_k)) # Use rag_db_cursor
-        results = rag_db_cursor.fetchall()
+        params = []
+        for idx, embedding in enumerate(query_embeddings):
+            params.extend((idx, embedding.tolist()))
+        params.extend(top_k_search_params(storage, top_k))
+        params.append(threshold)
+        with rag_db_cursor() as cur: # Pooled connection, held only for this statement
+            apply_ann_search_settings(cur)
+            cur.execute(sql_query, params)
+            results = cur.fetchall()
 
         documents = [{"id": row[0], "content": row[1], "score": row[2]} for row in results]
-        logger.info(f"Retrieved {len(documents)} documents from RAG DB for query '{query[:30]}...' (Threshold: {threshold}, TopK: {top_k})")
+        logger.info(f"Retrieved {len(documents)} unique documents from RAG DB for {len(queries)} queries (Threshold: {threshold}, TopK per query: {top_k})")
         return documents
+    except psycopg2.pool.PoolError as pool_err:
+         logger.warning(f"RAG retrieval skipped: {pool_err}")
+         return []
     except psycopg2.Error as db_err:
-         if "relation \"knowledge_documents\" does not exist" in str(db_err):
-             logger.error("RAG DB Error: Table 'knowledge_documents' not found. Ensure it exists in the RAG database ('%s').", config.RAG_DB_NAME)
-         elif "column \"embedding\" does not exist" in str(db_err):
-              logger.error("RAG DB Error: Column 'embedding' not found in 'knowledge_documents'. Ensure schema is correct.")
-         elif "operator does not exist: vector <=> vector" in str(db_err):
-              logger.error("RAG DB Error: <=> operator not found. Ensure the 'pgvector' extension is installed and enabled in the RAG database ('%s'). Run: CREATE EXTENSION IF NOT EXISTS vector;", config.RAG_DB_NAME)
-         else:
-             logger.error(f"RAG Database error during retrieval: {db_err}", exc_info=True)
+         _log_rag_db_error(db_err)
          return [] # Return empty list on DB errors
     except Exception as e:
         logger.error(f"Unexpected error during RAG document retrieval: {e}", exc_info=True)
         return []
 
 
-def format_rag_context(documents, max_length=None):
-    if not documents:
-        return "No relevant context found in the knowledge base."
+def format_rag_context(documents, max_length=None, query_texts=None, token_budget=None):
+    """
+    Formats retrieved documents for the question-generation prompt within RAG_CONTEXT_TOKEN_BUDGET
+    (see rag_context.pack_context): documents trimmed to the sentences most relevant to query_texts,
+    near-duplicates dropped, filled by score. max_length remains a hard character cap.
+    """
     max_length = max_length if max_length is not None else config.MAX_CONTEXT_LENGTH
-    context_str = "--- Relevant Context from Knowledge Base ---\n\n"
-    current_length = len(context_str)
-    for doc in documents:
-        doc_content = f"**Source ID {doc.get('id', 'N/A')} (Similarity: {doc.get('score', 0):.2f}):**\n{doc.get('content', '')}\n\n"
-        if max_length is None or (current_length + len(doc_content) <= max_length):
-            context_str += doc_content
-            current_length += len(doc_content)
-        else:
-            logger.warning(f"RAG context truncated at {max_length} characters.")
-            break
-    return context_str.strip()
+    return rag_context.pack_context(documents, query_texts=query_texts, token_budget=token_budget, max_length=max_length)
 
 # --- Skill/Topic Extraction ---
-def get_focus_topics(resume_text, jd_text, top_n=5):
+def get_focus_topics(resume_text, jd_text, top_n=5, jd_keywords=None):
+    """jd_keywords may be passed precomputed (extract_keywords(jd_text, 20)) to skip POS-tagging the JD again."""
     if not NLTK_AVAILABLE or not nltk_initialized:
         logger.warning("NLTK unavailable. Cannot determine focus topics accurately.")
         return ["General skills based on JD"]
@@ -322,7 +803,7 @@ def get_focus_topics(resume_text, jd_text, top_n=5):
     try:
         logger.debug("Extracting focus topics from resume and JD...")
         resume_keywords = set(extract_keywords(resume_text, max_keywords=20))
-        jd_keywords = set(extract_keywords(jd_text, max_keywords=20))
+        jd_keywords = set(jd_keywords) if jd_keywords is not None else set(extract_keywords(jd_text, max_keywords=20))
         overlap = list(resume_keywords.intersection(jd_keywords))
         if len(overlap) < top_n:
              additional_topics = [kw for kw in jd_keywords if kw not in overlap]
@@ -392,20 +873,14 @@ def extract_project_details(resume_text, max_length=None):
 
 # --- Cleanup function ---
 def close_resources():
-    """Closes RAG database connection if open."""
-    global rag_db_connection, rag_db_cursor # Use specific names
-    if rag_db_cursor:
-        try:
-            rag_db_cursor.close()
-            logger.info("RAG Database cursor closed.")
-        except Exception as e:
-            logger.error(f"Error closing RAG database cursor: {e}", exc_info=True)
-        rag_db_cursor = None
-    if rag_db_connection:
+    """Closes all pooled RAG database connections."""
+    global rag_db_pool # Use specific names
+    if rag_db_pool is not None:
         try:
-            rag_db_connection.close()
-            logger.info("RAG Database connection closed.")
+            rag_db_pool.closeall()
+            logger.info("RAG Database connection pool closed.")
         except Exception as e:
-            logger.error(f"Error closing RAG database connection: {e}", exc_info=True)
-        rag_db_connection = None
+            logger.error(f"Error closing RAG database connection pool: {e}", exc_info=True)
+        rag_db_pool = None
+        _rag_conn_last_used.clear()
     logger.info("Resource cleanup attempted.")
@@ -87,10 +87,12 @@ async function handleStartInterview(event) {
             throw new Error(data.error || `HTTP error! status: ${response.status}`);
         }
 
-        // --- SUCCESS ---
+        // --- ACCEPTED (202): setup runs in the background ---
         interviewId = data.interview_id;
-        updateStatus("Interview initialized. Waiting for greeting...");
         console.log("Interview started with ID:", interviewId);
+        updateStatus("Analyzing resume and preparing questions...");
+        await waitForInterviewReady(data.status_url || '/interview-status');
+        updateStatus("Interview initialized. Waiting for greeting...");
 
         // Hide the setup form and show the interview controls
         if (startForm) startForm.style.display = 'none';
@@ -107,6 +109,24 @@ async function handleStartInterview(event) {
     }
 }
 
+// Polls the setup status until the session is READY. Throws if setup failed.
+async function waitForInterviewReady(statusUrl) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+        if (data.status === 'ERROR') {
+            throw new Error(data.error || "Interview setup failed.");
+        }
+        if (data.status !== 'INITIALIZING') {
+            return data;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1500));
+    }
+}
+
 // Function to fetch the next AI message
 async function fetchAiMessage() {
     if (!interviewId) {
@@ -116,10 +136,27 @@ async function fetchAiMessage() {
     updateStatus("Getting AI message...");
     clearError(); // Clear previous errors
 
+    // Prefer the streaming endpoint: sentences appear (and are spoken) while the reply is generated
+    if (window.ReadableStream && window.TextDecoder) {
+        try {
+            await streamAiMessage();
+            return;
+        } catch (error) {
+            console.warn("Streaming AI message failed, falling back to /get-ai-message:", error);
+        }
+    }
+
     try {
         const response = await fetch('/get-ai-message');
         const data = await response.json();
 
+        // Another request for this interview is still running (e.g. response processing). Retry shortly.
+        if (response.status === 409 && data.status === 'BUSY') {
+            updateStatus("Waiting for the interviewer...");
+            setTimeout(fetchAiMessage, 1000);
+            return;
+        }
+
         if (!response.ok || data.error) {
              throw new Error(data.error || `HTTP error! status: ${response.status}`);
         }
@@ -142,6 +179,62 @@ async function fetchAiMessage() {
     }
 }
 
+// Parses one Server-Sent Events frame ("event: x\ndata: {...}") into {type, data}
+function parseSseFrame(frame) {
+    let type = 'message';
+    let data = '';
+    for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) type = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+    }
+    return { type, data: data ? JSON.parse(data) : {} };
+}
+
+// Reads /get-ai-message/stream, showing each sentence chunk as it arrives.
+// Throws only if the stream itself fails, so the caller can fall back to /get-ai-message.
+async function streamAiMessage() {
+    const response = await fetch('/get-ai-message/stream');
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let spokenText = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            const event = parseSseFrame(buffer.slice(0, separator));
+            buffer = buffer.slice(separator + 2);
+
+            if (event.type === 'chunk') {
+                spokenText = spokenText ? `${spokenText} ${event.data.text}` : event.data.text;
+                if (aiMessageTextElement) aiMessageTextElement.textContent = `AI: ${spokenText}`;
+                updateStatus("AI is speaking...");
+            } else if (event.type === 'busy') {
+                // Another request for this interview is still running (e.g. response processing). Retry shortly.
+                updateStatus("Waiting for the interviewer...");
+                setTimeout(fetchAiMessage, 1000);
+                return;
+            } else if (event.type === 'error') {
+                displayError(`Error fetching AI message: ${event.data.error}`);
+                updateStatus("Error getting message.");
+                updateInterviewUI('ERROR');
+                return;
+            } else if (event.type === 'done') {
+                if (aiMessageTextElement) aiMessageTextElement.textContent = `AI: ${event.data.ai_message}`;
+                updateInterviewUI(event.data.status);
+                return;
+            }
+        }
+    }
+    throw new Error("Stream ended before the AI message was complete.");
+}
+
 // --- Audio Recording Functions (Keep existing startRecording, stopRecording) ---
 async function startRecording() {
     if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {